@@ -0,0 +1,248 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :run.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+
+离线基准测试, 用sim下的xtquant替身代替QMT, 不需要安装QMT也不连接券商.
+
+    python benchmarks/run.py                 # 全部
+    python benchmarks/run.py tick dbf        # 指定项目
+    python benchmarks/run.py --stocks 5000 --orders 2000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'sim'))
+sys.path.insert(1, os.path.dirname(HERE))
+
+# vnpy按当前目录下是否有.vntrader决定数据目录, 必须在导入vnpy之前切换
+WORK_DIR = tempfile.mkdtemp(prefix='qmt_bench_')
+os.makedirs(os.path.join(WORK_DIR, '.vntrader'))
+os.chdir(WORK_DIR)
+
+import dbf
+from xtquant import xtdata, xttrader
+from vnpy.event import EventEngine
+from vnpy.trader.constant import Direction, Exchange, Interval, OrderType
+from vnpy.trader.object import OrderRequest, SubscribeRequest
+from vnpy.trader.utility import get_file_path, get_folder_path
+
+from vnpy_qmt import QmtGateway
+from vnpy_qmt.file_handler import DbfTailer
+from vnpy_qmt.tick_recorder import TickRecorder
+from vnpy_qmt.replay import TickReplayer
+from vnpy_qmt.history import HistoryService
+import dbf_export
+
+
+def new_gateway():
+    event_engine = EventEngine()
+    event_engine.start()
+    gateway = QmtGateway(event_engine)
+    gateway.write_log = lambda msg: None
+    return gateway
+
+
+def load_contracts(gateway):
+    gateway.md.get_contract()
+
+
+def print_stats(gateway, prefix):
+    for name, s in gateway.get_latency_stats().items():
+        if name.startswith(prefix):
+            print(f'  {name:<20} n={s["count"]:<8} p50={s["p50"]}us p99={s["p99"]}us max={s["max"]}us')
+
+
+def bench_tick(args):
+    """
+    MD.on_tick吞吐: 每批每个代码一笔tick; 再按实盘的方式逐个subscribe_quote, 由xtdata推送线程回调
+    """
+    gateway = new_gateway()
+    load_contracts(gateway)
+    codes = xtdata.get_stock_list_in_sector('沪深A股')[:args.codes]
+    batches = [xtdata.make_batch(codes, n) for n in range(args.batches)]
+    start = time.perf_counter()
+    for batch in batches:
+        gateway.md.on_tick(batch)
+    cost = time.perf_counter() - start
+    n = len(codes) * len(batches)
+    print(f'tick: {n}笔 {n / cost:,.0f} ticks/s')
+    print_stats(gateway, 'tick_')
+    gateway.event_engine.stop()
+
+    # 订阅推送: 每个代码一个订阅, 推送线程每轮逐个回调, 交易所到收到的延迟反映回调排队
+    xtdata.configure(tick_rate=args.tick_rate)
+    gateway = new_gateway()
+    load_contracts(gateway)
+    reqs = [SubscribeRequest(symbol=c[:6], exchange=Exchange.SSE if c.endswith('SH') else Exchange.SZSE)
+            for c in codes]
+    for req in reqs:
+        gateway.subscribe(req)
+    time.sleep(args.feed_seconds)
+    for req in reqs:
+        gateway.unsubscribe(req)
+    n = gateway.get_latency_stats().get('tick_exchange', {}).get('count', 0)
+    print(f'tick: 订阅推送{len(codes)}个代码 {args.feed_seconds}s {n}笔 {n / args.feed_seconds:,.0f} ticks/s')
+    print_stats(gateway, 'tick_')
+    gateway.event_engine.stop()
+    xtdata.configure(tick_rate=1.0)
+
+
+def bench_replay(args):
+    """
+    先用TickRecorder记录, 再全速回放经过MD.on_tick
+    """
+    gateway = new_gateway()
+    load_contracts(gateway)
+    codes = xtdata.get_stock_list_in_sector('沪深A股')[:args.codes]
+    folder = str(get_folder_path('qmt_ticks'))
+    recorder = TickRecorder(folder)
+    recorder.start()
+    for n in range(args.batches):
+        recorder.record(xtdata.make_batch(codes, n, int(time.time() * 1000) + n * 3000))
+    recorder.close()
+    replayer = TickReplayer(gateway.md.on_replay_tick, folder, time.strftime('%Y%m%d'), codes)
+    replayer.run()
+    stats = replayer.get_stats()
+    print(f'replay: {stats["ticks"]}笔 {stats["batches"]}批 {stats["ticks_per_second"]:,.0f} ticks/s, '
+          f'记录文件{recorder.written_bytes}字节')
+    gateway.event_engine.stop()
+
+
+def bench_order(args):
+    """
+    委托往返: 下单到异步回报、到第一次委托主推的延迟
+    """
+    xttrader.config['response_delay'] = args.order_delay / 1000
+    gateway = new_gateway()
+    load_contracts(gateway)
+    mini_path = os.path.join(WORK_DIR, 'userdata_mini')
+    os.makedirs(os.path.join(WORK_DIR, 'export_data'), exist_ok=True)
+    gateway.td.connect({'交易账号': 'bench', 'mini路径': mini_path, '委托保留(秒)': 3600})
+    code = xtdata.get_stock_list_in_sector('沪深A股')[0]
+    symbol, market = code.split('.')
+    price = xtdata.get_instrument_detail(code)['DownStopPrice']
+    req = OrderRequest(symbol=symbol, exchange=Exchange.SSE if market == 'SH' else Exchange.SZSE,
+                       direction=Direction.LONG, type=OrderType.LIMIT, volume=100, price=price)
+    start = time.perf_counter()
+    for _ in range(args.orders):
+        gateway.send_order(req)
+    sent = time.perf_counter() - start
+    deadline = time.time() + 30
+    while len(gateway.td.traders) < args.orders and time.time() < deadline:
+        time.sleep(0.01)
+    done = time.perf_counter() - start
+    print(f'order: {args.orders}笔 发送{args.orders / sent:,.0f}笔/s, '
+          f'全部成交{len(gateway.td.traders)}笔 耗时{done:.2f}s')
+    print_stats(gateway, 'order_')
+    gateway.td.dbf_monitor.stop()
+    gateway.td.trader.stop()
+    gateway.event_engine.stop()
+
+
+def bench_dbf(args):
+    """
+    文件单成交dbf的增量读取: 定位到已读位置后追加rows条, 对比整表扫描
+    """
+    for size in args.dbf_sizes:
+        folder = tempfile.mkdtemp(dir=WORK_DIR)
+        path = dbf_export.trade_file_path(folder)
+        dbf_export.append_trades(path, size)
+        tailer = DbfTailer(path)
+        tailer.read_new()
+        dbf_export.append_trades(path, args.dbf_append, start=size)
+        start = time.perf_counter()
+        rows = tailer.read_new()
+        tail_cost = time.perf_counter() - start
+
+        start = time.perf_counter()
+        table = dbf.Table(path, codepage='cp936')
+        table.open()
+        scanned = sum(1 for _ in table)
+        table.close()
+        scan_cost = time.perf_counter() - start
+        print(f'dbf: {size}行 追加{len(rows)}行 增量读取{tail_cost * 1000:.2f}ms, '
+              f'整表扫描{scanned}行{scan_cost * 1000:.2f}ms')
+
+
+def bench_history(args):
+    """
+    批量加载日线: 第一次全部下载, 第二次只读本地缓存
+    """
+    import datetime
+
+    xtdata.configure(call_delay=args.call_delay / 1000)
+    gateway = new_gateway()
+    gateway.md.history = HistoryService(str(get_folder_path('qmt_history')))
+    codes = xtdata.get_stock_list_in_sector('沪深A股')[:args.codes]
+    vt_symbols = [f'{c[:6]}.{"SSE" if c.endswith("SH") else "SZSE"}' for c in codes]
+    end = datetime.datetime.now()
+    start = end - datetime.timedelta(days=365)
+    for name in ('下载', '缓存'):
+        t = time.perf_counter()
+        result = gateway.load_history(vt_symbols, Interval.DAILY, start, end)
+        rows = sum(len(bars) for bars in result.values())
+        print(f'history: {name} {len(result)}个标的 {rows}根日线 {time.perf_counter() - t:.2f}s')
+    gateway.event_engine.stop()
+    xtdata.configure(call_delay=0)
+
+
+def bench_startup(args):
+    """
+    合约加载: 无缓存(冷启动)和有当日缓存(热启动)
+    """
+    cache_path = str(get_file_path('qmt_contract_cache.pkl'))
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    xtdata.configure(call_delay=args.call_delay / 1000)
+    for name in ('冷启动', '热启动'):
+        gateway = new_gateway()
+        start = time.perf_counter()
+        load_contracts(gateway)
+        print(f'startup: {name} {len(gateway.contracts)}个合约 {time.perf_counter() - start:.2f}s')
+        gateway.event_engine.stop()
+    xtdata.configure(call_delay=0)
+
+
+BENCHES = {
+    'tick': bench_tick,
+    'replay': bench_replay,
+    'order': bench_order,
+    'dbf': bench_dbf,
+    'history': bench_history,
+    'startup': bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='vnpy_qmt离线基准测试')
+    parser.add_argument('benches', nargs='*', help=f'{"/".join(BENCHES)}, 默认全部')
+    parser.add_argument('--stocks', type=int, default=2000, help='模拟的股票数量')
+    parser.add_argument('--etfs', type=int, default=10, help='模拟的ETF数量')
+    parser.add_argument('--codes', type=int, default=500, help='tick测试每批的代码数')
+    parser.add_argument('--batches', type=int, default=200, help='tick测试的批数')
+    parser.add_argument('--tick-rate', type=float, default=20, help='订阅推送时每个代码每秒的tick数')
+    parser.add_argument('--feed-seconds', type=float, default=3, help='订阅推送的持续秒数')
+    parser.add_argument('--orders', type=int, default=1000, help='委托测试的笔数')
+    parser.add_argument('--order-delay', type=float, default=0, help='模拟柜台回报延迟(毫秒)')
+    parser.add_argument('--dbf-sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--dbf-append', type=int, default=10, help='dbf测试每次追加的行数')
+    parser.add_argument('--call-delay', type=float, default=0.2, help='模拟xtdata查询耗时(毫秒)')
+    args = parser.parse_args()
+    for name in args.benches:
+        if name not in BENCHES:
+            parser.error(f'未知的测试项目 {name}')
+
+    xtdata.configure(stocks=args.stocks, etfs=args.etfs)
+    print(f'工作目录 {WORK_DIR}')
+    for name in args.benches or BENCHES:
+        BENCHES[name](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :dbf_export.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+
+模拟QMT导出的成交dbf和文件单结果dbf
+"""
+import os
+import datetime
+
+import dbf
+
+
+TRADE_FIELDS = ('投资备注 C(32); 操作 C(8); 证券代码 C(12); 证券市场 C(8); 成交价格 C(16); '
+                '成交数量 C(16); 成交日期 C(8); 成交时间 C(8); 成交编号 C(32)')
+ORDER_RESULT_FIELDS = 'ORDERNUM C(20); TASKPRO C(20); MESSAGE C(64); STATUS C(8); TASKSTATUS C(8); NOTE C(32)'
+
+
+def trade_file_path(folder: str, date: datetime.date = None) -> str:
+    date = date or datetime.date.today()
+    return os.path.join(folder, f'XT_CJCX_Stock_{date.strftime("%Y%m%d")}.dbf')
+
+
+def order_result_file_path(folder: str) -> str:
+    return os.path.join(folder, 'XT_DBF_ORDER_result.dbf')
+
+
+def _open(path: str, fields: str) -> dbf.Table:
+    if os.path.exists(path):
+        table = dbf.Table(path)
+    else:
+        table = dbf.Table(path, fields, codepage='cp936')
+    table.open(mode=dbf.READ_WRITE)
+    return table
+
+
+def append_trades(path: str, n: int, start: int = 0):
+    """
+    追加n条成交, 成交编号从start开始
+    """
+    table = _open(path, TRADE_FIELDS)
+    now = datetime.datetime.now()
+    for i in range(start, start + n):
+        table.append({
+            '投资备注': f'QMT.{i}',
+            '操作': '买入' if i % 2 else '卖出',
+            '证券代码': f'{600000 + i % 1000:06d}',
+            '证券市场': 'SH',
+            '成交价格': f'{10 + i % 100 * 0.01:.2f}',
+            '成交数量': '100',
+            '成交日期': now.strftime('%Y%m%d'),
+            '成交时间': now.strftime('%H:%M:%S'),
+            '成交编号': str(i),
+        })
+    table.close()
+
+
+def append_order_results(path: str, n: int, start: int = 0):
+    table = _open(path, ORDER_RESULT_FIELDS)
+    for i in range(start, start + n):
+        table.append({
+            'ORDERNUM': str(1000 + i),
+            'TASKPRO': '100/100',
+            'MESSAGE': '',
+            'STATUS': '0',
+            'TASKSTATUS': '7',
+            'NOTE': f'QMT.{i}',
+        })
+    table.close()
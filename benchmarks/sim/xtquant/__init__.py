@@ -0,0 +1,8 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :__init__.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+
+离线xtquant替身, 只实现本gateway用到的接口, 用于在没有QMT的机器上跑基准测试
+"""
@@ -0,0 +1,25 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :xtconstant.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+"""
+STOCK_BUY = 23
+STOCK_SELL = 24
+
+LATEST_PRICE = 5
+FIX_PRICE = 11
+MARKET_SH_CONVERT_5_LIMIT = 42
+MARKET_SZ_CONVERT_5_CANCEL = 47
+
+ORDER_UNREPORTED = 48
+ORDER_WAIT_REPORTING = 49
+ORDER_REPORTED = 50
+ORDER_REPORTED_CANCEL = 51
+ORDER_PARTSUCC_CANCEL = 52
+ORDER_PART_CANCEL = 53
+ORDER_CANCELED = 54
+ORDER_PART_SUCC = 55
+ORDER_SUCCEEDED = 56
+ORDER_JUNK = 57
+ORDER_UNKNOWN = 255
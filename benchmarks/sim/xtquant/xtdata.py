@@ -0,0 +1,217 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :xtdata.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+"""
+import time
+import datetime
+from itertools import count
+from threading import Thread, Lock
+from typing import Callable, Dict, List
+
+# stocks/etfs: 合成的沪深股票和沪市ETF数量
+# call_delay: 每次查询接口的模拟耗时(秒)
+# tick_rate: 每个代码每秒推送的tick数
+_config = {
+    'stocks': 2000,
+    'etfs': 10,
+    'basket_size': 50,
+    'call_delay': 0.0,
+    'tick_rate': 1.0,
+}
+_universe = None
+_subscriptions: Dict[int, tuple] = {}
+_seq = count(1)
+_lock = Lock()
+_feeder: Thread = None
+
+
+def configure(**kwargs):
+    global _universe
+    _config.update(kwargs)
+    _universe = None
+
+
+def _get_universe():
+    global _universe
+    if _universe is None:
+        n = _config['stocks']
+        stocks = [f'{600000 + i:06d}.SH' for i in range(n // 2)] + \
+                 [f'{1 + i:06d}.SZ' for i in range(n - n // 2)]
+        etfs = [f'{510000 + i:06d}.SH' for i in range(_config['etfs'])]
+        _universe = stocks, etfs
+    return _universe
+
+
+def _delay():
+    if _config['call_delay']:
+        time.sleep(_config['call_delay'])
+
+
+def get_stock_list_in_sector(sector_name):
+    stocks, etfs = _get_universe()
+    if sector_name == '沪深A股':
+        return list(stocks)
+    if sector_name == '沪市ETF':
+        return list(etfs)
+    return []
+
+
+def _base_price(code):
+    return 5 + int(code[:6]) % 100
+
+
+def get_instrument_detail(stock_code):
+    _delay()
+    stocks, etfs = _get_universe()
+    if stock_code not in stocks and stock_code not in etfs:
+        return None
+    symbol, market = stock_code.split('.')
+    price = _base_price(stock_code)
+    return {
+        'ExchangeID': market,
+        'InstrumentID': symbol,
+        'InstrumentName': f'模拟{symbol}',
+        'PriceTick': 0.001 if stock_code in etfs else 0.01,
+        'UpStopPrice': round(price * 1.1, 2),
+        'DownStopPrice': round(price * 0.9, 2),
+    }
+
+
+def get_instrument_type(stock_code):
+    _delay()
+    stocks, etfs = _get_universe()
+    if stock_code not in stocks and stock_code not in etfs:
+        return None
+    etf = stock_code in etfs
+    return {'index': False, 'stock': not etf, 'fund': etf, 'etf': etf}
+
+
+def get_etf_info(stock_code):
+    _delay()
+    stocks, etfs = _get_universe()
+    i = etfs.index(stock_code)
+    size = _config['basket_size']
+    sh_stocks = [s for s in stocks if s.endswith('.SH')]
+    components = {}
+    for j in range(size):
+        code = sh_stocks[(i * size + j) % len(sh_stocks)]
+        symbol, market = code.split('.')
+        components[code] = {
+            'componentExchID': market,
+            'componentCode': symbol,
+            'componentName': f'模拟{symbol}',
+            'componentVolume': 100 * (1 + j % 5),
+        }
+    return {'reportUnit': 100000, 'cashBalance': 0, 'stocks': components}
+
+
+def make_tick(code: str, ts: int, n: int) -> dict:
+    price = _base_price(code) + (n % 20) * 0.01
+    return {
+        'time': ts,
+        'lastPrice': price,
+        'open': _base_price(code),
+        'high': price + 0.1,
+        'low': price - 0.1,
+        'lastClose': _base_price(code),
+        'volume': 100 * n,
+        'amount': 100 * n * price,
+        'askPrice': [price + 0.01 * k for k in range(1, 6)],
+        'askVol': [10 * k for k in range(1, 6)],
+        'bidPrice': [price - 0.01 * k for k in range(1, 6)],
+        'bidVol': [10 * k for k in range(1, 6)],
+    }
+
+
+def make_batch(codes: List[str], n: int, ts: int = None) -> Dict[str, List[dict]]:
+    """
+    生成subscribe_quote回调格式的一批tick
+    """
+    ts = ts or int(time.time() * 1000)
+    return {code: [make_tick(code, ts, n)] for code in codes}
+
+
+def subscribe_quote(stock_code, period='1d', start_time='', end_time='', count=0, callback=None):
+    return _subscribe([stock_code], False, callback)
+
+
+def subscribe_whole_quote(code_list, callback=None):
+    stocks, etfs = _get_universe()
+    codes = [c for c in stocks + etfs if c.split('.')[1] in code_list or c in code_list]
+    return _subscribe(codes, True, callback)
+
+
+def unsubscribe_quote(seq):
+    with _lock:
+        _subscriptions.pop(seq, None)
+
+
+def _subscribe(codes: List[str], whole: bool, callback: Callable) -> int:
+    global _feeder
+    seq = next(_seq)
+    with _lock:
+        _subscriptions[seq] = (codes, whole, callback)
+        if _feeder is None:
+            _feeder = Thread(target=_feed, daemon=True)
+            _feeder.start()
+    return seq
+
+
+def _feed():
+    n = 0
+    while True:
+        time.sleep(1 / _config['tick_rate'])
+        n += 1
+        ts = int(time.time() * 1000)
+        with _lock:
+            subscriptions = list(_subscriptions.values())
+        for codes, whole, callback in subscriptions:
+            if whole:
+                callback({code: make_tick(code, ts, n) for code in codes})
+            else:
+                callback(make_batch(codes, n, ts))
+
+
+def download_history_data2(stock_list, period, start_time='', end_time='', callback=None, incrementally=None):
+    # 模拟按代码逐个下载的耗时
+    for _ in stock_list:
+        _delay()
+
+
+def _bar_times(period, start_time, end_time):
+    start = datetime.datetime.strptime(start_time[:8], '%Y%m%d')
+    end = datetime.datetime.strptime(end_time[:8], '%Y%m%d')
+    times = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            if period == '1d':
+                times.append(day)
+            else:
+                for minute in list(range(9 * 60 + 31, 11 * 60 + 31)) + list(range(13 * 60 + 1, 15 * 60 + 1)):
+                    times.append(day + datetime.timedelta(minutes=minute))
+        day += datetime.timedelta(days=1)
+    return [int(t.timestamp() * 1000) for t in times]
+
+
+def get_market_data_ex(field_list=[], stock_list=[], period='1d', start_time='', end_time='', count=-1,
+                       dividend_type='none', fill_data=True):
+    import pandas as pd
+
+    times = _bar_times(period, start_time, end_time)
+    result = {}
+    for code in stock_list:
+        base = _base_price(code)
+        close = [base + (i % 20) * 0.01 for i in range(len(times))]
+        result[code] = pd.DataFrame({
+            'time': times,
+            'open': close,
+            'high': [c + 0.05 for c in close],
+            'low': [c - 0.05 for c in close],
+            'close': close,
+            'volume': [1000] * len(times),
+            'amount': [c * 1000 for c in close],
+        })
+    return result
@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :xttrader.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+"""
+import time
+from itertools import count
+from queue import Queue
+from threading import Thread
+
+from xtquant import xtconstant
+from xtquant.xttype import (
+    XtAsset, XtOrder, XtTrade, XtPosition, XtOrderResponse, XtCancelOrderResponse
+)
+
+# response_delay: 委托到异步回报的延迟, fill_delay: 回报到成交的延迟(秒)
+config = {
+    'response_delay': 0.0,
+    'fill_delay': 0.0,
+}
+
+
+class XtQuantTraderCallback:
+
+    def on_disconnected(self):
+        pass
+
+    def on_stock_asset(self, asset):
+        pass
+
+    def on_stock_order(self, order):
+        pass
+
+    def on_stock_trade(self, trade):
+        pass
+
+    def on_stock_position(self, position):
+        pass
+
+    def on_order_error(self, order_error):
+        pass
+
+    def on_cancel_error(self, cancel_error):
+        pass
+
+    def on_order_stock_async_response(self, response):
+        pass
+
+    def on_cancel_order_stock_async_response(self, response):
+        pass
+
+
+class XtQuantTrader:
+    """
+    模拟交易: 委托立即报单并全部成交, 回调在单独线程中按顺序执行
+    """
+
+    def __init__(self, path, session, callback=None):
+        self.path = path
+        self.session = session
+        self.callback: XtQuantTraderCallback = callback
+        self._seq = count(1)
+        self._order_id = count(1000)
+        self._trade_id = count(1)
+        self._queue = Queue()
+        self._thread = Thread(target=self._run, daemon=True)
+        self.orders = {}
+        self.trades = []
+        self.positions = {}
+
+    def register_callback(self, callback):
+        self.callback = callback
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+
+    def connect(self):
+        return 0
+
+    def subscribe(self, account):
+        return 0
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            due, func, args = item
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            func(*args)
+
+    def _later(self, delay, func, *args):
+        self._queue.put((time.perf_counter() + delay, func, args))
+
+    def order_stock_async(self, account, stock_code, order_type, order_volume, price_type, price,
+                          strategy_name='', order_remark=''):
+        seq = next(self._seq)
+        order = XtOrder(
+            account_id=account.account_id, stock_code=stock_code, order_id=next(self._order_id),
+            order_sysid='', order_time=int(time.time()), order_type=order_type,
+            order_volume=order_volume, price_type=price_type, price=price, traded_volume=0,
+            traded_price=0, order_status=xtconstant.ORDER_REPORTED, status_msg='',
+            strategy_name=strategy_name, order_remark=order_remark
+        )
+        self.orders[order.order_id] = order
+        response = XtOrderResponse(account_id=account.account_id, order_id=order.order_id,
+                                   strategy_name=strategy_name, order_remark=order_remark,
+                                   error_msg='', seq=seq)
+        self._later(config['response_delay'], self.callback.on_order_stock_async_response, response)
+        self._later(0, self.callback.on_stock_order, XtOrder(**order.__dict__))
+        self._later(config['fill_delay'], self._fill, order)
+        return seq
+
+    def _fill(self, order):
+        order.traded_volume = order.order_volume
+        order.traded_price = order.price
+        order.order_status = xtconstant.ORDER_SUCCEEDED
+        trade = XtTrade(
+            account_id=order.account_id, stock_code=order.stock_code, order_type=order.order_type,
+            traded_id=str(next(self._trade_id)), traded_time=int(time.time()),
+            traded_price=order.price, traded_volume=order.order_volume,
+            traded_amount=order.price * order.order_volume, order_id=order.order_id,
+            order_sysid='', strategy_name=order.strategy_name, order_remark=order.order_remark
+        )
+        self.trades.append(trade)
+        sign = 1 if order.order_type == xtconstant.STOCK_BUY else -1
+        position = self.positions.get(order.stock_code)
+        if position is None:
+            position = self.positions[order.stock_code] = XtPosition(
+                account_id=order.account_id, stock_code=order.stock_code, volume=0,
+                can_use_volume=0, open_price=order.price, market_value=0,
+                frozen_volume=0, on_road_volume=0, yesterday_volume=0, avg_price=order.price
+            )
+        position.volume += sign * order.order_volume
+        position.market_value = position.volume * order.price
+        self.callback.on_stock_trade(trade)
+        self.callback.on_stock_order(XtOrder(**order.__dict__))
+        self.callback.on_stock_position(XtPosition(**position.__dict__))
+
+    def cancel_order_stock_async(self, account, order_id):
+        seq = next(self._seq)
+        order = self.orders.get(order_id)
+        result = -1
+        if order is not None and order.order_status == xtconstant.ORDER_REPORTED:
+            order.order_status = xtconstant.ORDER_CANCELED
+            result = 0
+            self._later(0, self.callback.on_stock_order, XtOrder(**order.__dict__))
+        response = XtCancelOrderResponse(account_id=account.account_id, cancel_result=result,
+                                         order_id=order_id, order_sysid='', seq=seq)
+        self._later(config['response_delay'], self.callback.on_cancel_order_stock_async_response, response)
+        return seq
+
+    def query_stock_asset_async(self, account, callback):
+        market_value = sum(p.market_value for p in self.positions.values())
+        asset = XtAsset(account_id=account.account_id, cash=1e8, frozen_cash=0,
+                        market_value=market_value, total_asset=1e8 + market_value)
+        self._later(0, callback, asset)
+
+    def query_stock_positions_async(self, account, callback):
+        self._later(0, callback, [XtPosition(**p.__dict__) for p in self.positions.values()])
+
+    def query_stock_orders_async(self, account, callback, cancelable_only=False):
+        self._later(0, callback, [XtOrder(**o.__dict__) for o in self.orders.values()])
+
+    def query_stock_trades_async(self, account, callback):
+        self._later(0, callback, list(self.trades))
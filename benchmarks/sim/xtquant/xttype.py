@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :xttype.py
+@Time      :2023/4/21 10:12
+@Author    :fsksf
+"""
+
+
+class StockAccount:
+
+    def __init__(self, account_id, account_type='STOCK'):
+        self.account_id = account_id
+        self.account_type = account_type
+
+
+class _XtObject:
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.__dict__})'
+
+
+class XtAsset(_XtObject):
+    pass
+
+
+class XtOrder(_XtObject):
+    pass
+
+
+class XtTrade(_XtObject):
+    pass
+
+
+class XtPosition(_XtObject):
+    pass
+
+
+class XtOrderResponse(_XtObject):
+    pass
+
+
+class XtOrderError(_XtObject):
+    pass
+
+
+class XtCancelError(_XtObject):
+    pass
+
+
+class XtCancelOrderResponse(_XtObject):
+    pass
+
+
+class XtCreditOrder(_XtObject):
+    pass
+
+
+class XtCreditDeal(_XtObject):
+    pass
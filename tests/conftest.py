@@ -0,0 +1,13 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :conftest.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 没有安装QMT时用benchmarks/sim下的xtquant替身, dbf_export也在这里
+sys.path.append(os.path.join(ROOT, 'benchmarks', 'sim'))
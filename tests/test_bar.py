@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_bar.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import datetime
+
+import pytest
+
+from vnpy_qmt.bar import BarAggregator
+
+
+def ms(hour, minute, second=0):
+    return int(datetime.datetime(2023, 5, 15, hour, minute, second).timestamp() * 1000)
+
+
+def tick(t, price, volume):
+    return {'time': t, 'lastPrice': price, 'volume': volume, 'amount': volume * 10}
+
+
+@pytest.fixture
+def aggregator():
+    bars = {}
+    agg = BarAggregator(lambda window, window_bars: bars.setdefault(window, []).extend(window_bars), 'QMT',
+                        windows=[5])
+    return agg, bars
+
+
+def test_minute_bar(aggregator):
+    agg, bars = aggregator
+    agg.update({'600000.SH': [tick(ms(9, 30, 3), 10, 100), tick(ms(9, 30, 20), 10.3, 300)]})
+    agg.update({'600000.SH': [tick(ms(9, 30, 50), 9.9, 450)]})
+    assert not bars
+    agg.update({'600000.SH': [tick(ms(9, 31, 5), 10.1, 500)]})
+
+    bar, = bars[1]
+    assert bar.datetime == datetime.datetime(2023, 5, 15, 9, 30)
+    assert (bar.open_price, bar.high_price, bar.low_price, bar.close_price) == (10, 10.3, 9.9, 9.9)
+    # 当天第一笔在开盘第一分钟, 之前的累计量计入这根K线
+    assert bar.volume == 450
+    assert bar.turnover == 4500
+
+
+def test_auction_tick_belongs_to_first_bar(aggregator):
+    agg, bars = aggregator
+    agg.update({'600000.SH': [tick(ms(9, 25, 0), 10, 100)]})
+    agg.update({'600000.SH': [tick(ms(9, 30, 10), 10.2, 300), tick(ms(9, 31, 0), 10.1, 400)]})
+    bar, = bars[1]
+    assert bar.datetime == datetime.datetime(2023, 5, 15, 9, 30)
+    assert bar.open_price == 10
+    assert bar.volume == 300
+
+
+def test_zero_price_tick_volume_carried(aggregator):
+    agg, bars = aggregator
+    agg.update({'600000.SH': [tick(ms(9, 30, 3), 10, 100)]})
+    agg.update({'600000.SH': [tick(ms(9, 30, 30), 0, 300)]})
+    agg.update({'600000.SH': [tick(ms(9, 30, 50), 10.1, 400)]})
+    agg.update({'600000.SH': [tick(ms(9, 31, 5), 10.2, 500)]})
+    bar, = bars[1]
+    assert bar.low_price == 10
+    assert bar.volume == 400
+
+
+def test_late_tick_volume_goes_to_next_bar(aggregator):
+    agg, bars = aggregator
+    agg.update({'600000.SH': [tick(ms(9, 30, 3), 10, 100), tick(ms(9, 31, 5), 10, 200)]})
+    # 9:30已推出, 迟到的tick不改动它, 成交量随下一笔进入9:31
+    agg.update({'600000.SH': [tick(ms(9, 30, 59), 11, 250)]})
+    agg.update({'600000.SH': [tick(ms(9, 31, 30), 10, 300), tick(ms(9, 32, 0), 10, 300)]})
+    first, second = bars[1]
+    assert (first.volume, first.high_price) == (100, 10)
+    assert second.volume == 200
+    assert second.high_price == 10
+
+
+def test_codes_batched_independently(aggregator):
+    agg, bars = aggregator
+    agg.update({
+        '600000.SH': [tick(ms(9, 30, 3), 10, 100)],
+        '000001.SZ': [tick(ms(9, 30, 3), 20, 100), tick(ms(9, 31, 3), 21, 300)],
+    })
+    bar, = bars[1]
+    assert (bar.symbol, bar.volume) == ('000001', 100)
+    agg.update({'600000.SH': [tick(ms(9, 31, 3), 10, 200)]})
+    assert [b.symbol for b in bars[1]] == ['000001', '600000']
+
+
+def test_window_bar(aggregator):
+    agg, bars = aggregator
+    for minute in range(6):
+        agg.update({'600000.SH': [tick(ms(9, 30 + minute, 1), 10 + minute, 100 * (minute + 1))]})
+    bar, = bars[5]
+    assert bar.datetime == datetime.datetime(2023, 5, 15, 9, 30)
+    assert (bar.open_price, bar.high_price, bar.close_price) == (10, 14, 14)
+    assert bar.volume == 500
+    assert len(bars[1]) == 5
@@ -0,0 +1,82 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_file_handler.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import os
+
+import pytest
+
+from vnpy_qmt.file_handler import DbfCheckpoint, DbfTailer, ResultFileHandler
+import dbf_export
+
+
+@pytest.fixture
+def trade_path(tmp_path):
+    return dbf_export.trade_file_path(str(tmp_path))
+
+
+def test_tailer_reads_only_new_records(trade_path):
+    dbf_export.append_trades(trade_path, 3)
+    tailer = DbfTailer(trade_path)
+    rows = tailer.read_new()
+    assert [row['成交编号'] for row in rows] == ['0', '1', '2']
+    assert rows[1]['操作'] == '买入'
+    assert tailer.read_new() == []
+
+    dbf_export.append_trades(trade_path, 2, start=3)
+    assert [row['成交编号'] for row in tailer.read_new()] == ['3', '4']
+    assert tailer.position == 5
+
+
+def test_tailer_restarts_after_rewrite(trade_path):
+    dbf_export.append_trades(trade_path, 3)
+    tailer = DbfTailer(trade_path)
+    tailer.read_new()
+    os.remove(trade_path)
+    dbf_export.append_trades(trade_path, 2, start=10)
+    assert [row['成交编号'] for row in tailer.read_new()] == ['10', '11']
+
+
+def test_checkpoint_resumes(tmp_path, trade_path):
+    dbf_export.append_trades(trade_path, 3)
+    tailer = DbfTailer(trade_path)
+    tailer.read_new()
+    DbfCheckpoint(str(tmp_path)).save(trade_path, tailer.get_state())
+
+    dbf_export.append_trades(trade_path, 2, start=3)
+    # 重启后从断点继续, 不重复推送已处理的记录
+    tailer = DbfTailer(trade_path)
+    tailer.set_state(DbfCheckpoint(str(tmp_path)).get(trade_path))
+    assert [row['成交编号'] for row in tailer.read_new()] == ['3', '4']
+
+
+def test_checkpoint_ignored_for_replaced_file(tmp_path, trade_path):
+    dbf_export.append_trades(trade_path, 3)
+    tailer = DbfTailer(trade_path)
+    tailer.read_new()
+    state = tailer.get_state()
+
+    # 同样大小但首条记录不同, 说明文件被替换, 从头重读
+    os.remove(trade_path)
+    dbf_export.append_trades(trade_path, 3, start=20)
+    os.utime(trade_path, (state['mtime'] + 1, state['mtime'] + 1))
+    tailer = DbfTailer(trade_path)
+    tailer.set_state(state)
+    assert [row['成交编号'] for row in tailer.read_new()] == ['20', '21', '22']
+
+
+def test_bad_row_does_not_drop_batch(trade_path):
+    dbf_export.append_trades(trade_path, 4)
+    received, logs = [], []
+
+    def on_trade(trade):
+        if trade.tradeid == '1':
+            raise ValueError('bad row')
+        received.append(trade.tradeid)
+
+    handler = ResultFileHandler(None, on_trade, write_log=logs.append)
+    handler.on_trade_change(trade_path)
+    assert received == ['0', '2', '3']
+    assert len(logs) == 1
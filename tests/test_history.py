@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_history.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import os
+import datetime
+
+import numpy as np
+import pytest
+
+from vnpy_qmt.history import (
+    HISTORY_FIELDS, HistoryCache, HistoryService, merge_ranges, subtract_ranges, to_date_int
+)
+
+
+def make_columns(times, value):
+    times = np.array(times, dtype=np.int64)
+    return {name: times if name == 'time' else np.full(len(times), float(value)) for name in HISTORY_FIELDS}
+
+
+def minute_ms(day, minute):
+    return int(datetime.datetime(2023, 5, day, 9, 30 + minute).timestamp() * 1000)
+
+
+@pytest.mark.parametrize('start, end, covered, missing', [
+    (20230501, 20230531, [], [(20230501, 20230531)]),
+    (20230501, 20230531, [[20230501, 20230531]], []),
+    (20230501, 20230531, [[20230410, 20230505], [20230510, 20230520]],
+     [(20230506, 20230509), (20230521, 20230531)]),
+    # 跨月
+    (20230425, 20230505, [[20230427, 20230430]], [(20230425, 20230426), (20230501, 20230505)]),
+    (20230501, 20230510, [[20230601, 20230630]], [(20230501, 20230510)]),
+])
+def test_subtract_ranges(start, end, covered, missing):
+    assert subtract_ranges(start, end, covered) == missing
+
+
+def test_merge_ranges():
+    # 相邻的日期(含跨月)合并, 不相邻的保留
+    assert merge_ranges([[20230510, 20230520], [20230501, 20230505], [20230506, 20230508]]) == \
+        [[20230501, 20230508], [20230510, 20230520]]
+    assert merge_ranges([[20230401, 20230430], [20230501, 20230502]]) == [[20230401, 20230502]]
+    assert merge_ranges([[20230501, 20230531], [20230510, 20230512]]) == [[20230501, 20230531]]
+
+
+def test_cache_write_merges_and_reads_range(tmp_path):
+    cache = HistoryCache(str(tmp_path))
+    cache.write('600000.SH', '1m', make_columns([minute_ms(4, 1), minute_ms(4, 0)], 1))
+    cache.write('600000.SH', '1m', make_columns([minute_ms(4, 1), minute_ms(4, 2)], 2))
+    # 跨月分区
+    june = int(datetime.datetime(2023, 6, 1, 9, 31).timestamp() * 1000)
+    cache.write('600000.SH', '1m', make_columns([june], 3))
+
+    columns = cache.read('600000.SH', '1m', minute_ms(4, 0), june)
+    assert columns['open'].tolist() == [1, 2, 2, 3]
+    assert np.all(np.diff(columns['time']) > 0)
+    columns = cache.read('600000.SH', '1m', minute_ms(4, 1), minute_ms(4, 1))
+    assert columns['time'].tolist() == [minute_ms(4, 1)]
+    assert not len(cache.read('600001.SH', '1m', minute_ms(4, 0), minute_ms(4, 2))['time'])
+
+
+def test_cache_rewrite_keeps_earlier_reads(tmp_path):
+    cache = HistoryCache(str(tmp_path))
+    cache.write('600000.SH', '1m', make_columns([minute_ms(4, 0)], 1))
+    before = cache.read('600000.SH', '1m', minute_ms(4, 0), minute_ms(4, 5))
+    cache.write('600000.SH', '1m', make_columns([minute_ms(4, 0), minute_ms(4, 1)], 2))
+
+    # 读出的是复制的数组, 分区换成新版本后不受影响, 旧版本目录已清理
+    assert before['open'].tolist() == [1]
+    assert not isinstance(before['open'], np.memmap)
+    assert cache.read('600000.SH', '1m', minute_ms(4, 0), minute_ms(4, 5))['open'].tolist() == [2, 2]
+    assert os.listdir(tmp_path / '1m' / '600000.SH') == ['202305.2']
+
+
+def test_download_covers_only_returned_codes(tmp_path, monkeypatch):
+    pytest.importorskip('pandas')
+    import xtquant.xtdata
+
+    get_market_data_ex = xtquant.xtdata.get_market_data_ex
+
+    def partial(field_list, stock_list, **kwargs):
+        data = get_market_data_ex(field_list, stock_list, **kwargs)
+        data.pop('600001.SH')
+        return data
+
+    monkeypatch.setattr(xtquant.xtdata, 'get_market_data_ex', partial)
+    service = HistoryService(str(tmp_path))
+    end = datetime.datetime.now() - datetime.timedelta(days=30)
+    start = end - datetime.timedelta(days=30)
+    bars = service.load(['600000.SH', '600001.SH'], '1d', start, end)
+
+    assert len(bars['600000.SH']) > 0
+    assert not len(bars['600001.SH'])
+    # 覆盖到取回的最后一根日线, 之后的周末不计入
+    last = to_date_int(end - datetime.timedelta(days=3))
+    assert service.cache.get_missing('600000.SH', '1d', to_date_int(start), last) == []
+    assert service.cache.get_missing('600001.SH', '1d', to_date_int(start), to_date_int(end)) == \
+        [(to_date_int(start), to_date_int(end))]
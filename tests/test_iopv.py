@@ -0,0 +1,88 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_iopv.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import math
+
+import numpy as np
+import pytest
+
+from vnpy_qmt.iopv import IopvEngine
+
+
+def prices(mapping):
+    return {code: [{'lastPrice': price}] for code, price in mapping.items()}
+
+
+@pytest.fixture
+def engine():
+    results = []
+    engine = IopvEngine(results.extend, interval=0)
+    engine.add_baskets({
+        '510050.SSE': ('510050.SH', [('600000.SH', 100), ('600001.SH', 200)], 1000, 50),
+        # 同一成分出现两次时份额合并
+        '510300.SSE': ('510300.SH', [('600001.SH', 100), ('600002.SH', 300), ('600001.SH', 100)], 0, 0),
+    })
+    return engine, results
+
+
+def test_missing_components(engine):
+    engine, results = engine
+    engine.update(prices({'600000.SH': 10}))
+    iopv = engine.get_iopv('510050.SSE')
+    assert iopv.missing == 1
+    assert iopv.iopv == pytest.approx((100 * 10 + 50) / 1000)
+    assert engine.get_iopv('510300.SSE').missing == 2
+    # 只推送包含变价成分的篮子
+    assert [r.vt_symbol for r in results] == ['510050.SSE', '510300.SSE']
+    results.clear()
+    engine.update(prices({'600000.SH': 10.5}))
+    assert [r.vt_symbol for r in results] == ['510050.SSE']
+
+
+def test_incremental_matches_full(engine):
+    engine, results = engine
+    engine.update(prices({'600000.SH': 10, '600001.SH': 20, '600002.SH': 5, '510050.SH': 2.5}))
+    engine.update(prices({'600001.SH': 21, '600002.SH': 0}))
+    engine.update(prices({'600001.SH': 22, '600002.SH': 6}))
+
+    iopv = engine.get_iopv('510050.SSE')
+    assert iopv.missing == 0
+    assert iopv.iopv == pytest.approx((100 * 10 + 200 * 22 + 50) / 1000)
+    assert iopv.premium == pytest.approx(2.5 / iopv.iopv - 1)
+    # 申赎单位未知时为一篮子市值, 不计算溢价率
+    iopv = engine.get_iopv('510300.SSE')
+    assert iopv.iopv == pytest.approx(200 * 22 + 300 * 6)
+    assert math.isnan(iopv.premium)
+
+
+def test_recompile_keeps_prices(engine):
+    engine, results = engine
+    rng = np.random.default_rng(0)
+    codes = ['600000.SH', '600001.SH', '600002.SH']
+    for _ in range(50):
+        engine.update(prices({code: 10 + rng.random() for code in codes}))
+    values = engine.values.copy()
+    # 重新编译按当前价格全量重算, 与增量累加一致
+    engine.add_baskets({})
+    assert engine.values == pytest.approx(values)
+    assert engine.get_iopv('nonexistent') is None
+
+
+def test_flush_publishes_throttled_change():
+    results = []
+    engine = IopvEngine(results.extend, interval=60)
+    engine.add_baskets({'510050.SSE': ('510050.SH', [('600000.SH', 100)], 100, 0)})
+    engine.update(prices({'600000.SH': 10}))
+    assert [r.iopv for r in results] == [10]
+    # 节流期间的变化不推送, 之后没有tick也由定时flush推出
+    engine.update(prices({'600000.SH': 11}))
+    engine.flush()
+    assert len(results) == 1
+    engine.interval = 0
+    engine.flush()
+    assert [r.iopv for r in results] == [10, 11]
+    engine.flush()
+    assert len(results) == 2
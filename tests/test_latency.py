@@ -0,0 +1,25 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_latency.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+from threading import Thread
+
+from vnpy_qmt.latency import LatencyRecorder
+
+
+def test_exited_threads_are_folded():
+    recorder = LatencyRecorder()
+    recorder.record('tick', 0.001)
+    threads = [Thread(target=recorder.record, args=('tick', 0.002)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+
+    stats = recorder.get_stats()['tick']
+    assert stats['count'] == 21
+    assert stats['max'] == 2000
+    # 已退出线程的直方图并入汇总后不再保留
+    assert len(recorder._all) == 1
+    assert recorder.get_stats()['tick']['count'] == 21
@@ -0,0 +1,34 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_rate_limit.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import pytest
+
+from vnpy_qmt.rate_limit import TokenBucket
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=10, capacity=3)
+    now = bucket.last
+    for _ in range(3):
+        assert bucket.wait_time(now) == 0
+        bucket.consume()
+    assert bucket.wait_time(now) == pytest.approx(0.1)
+    # 50ms补充半个令牌
+    assert bucket.wait_time(now + 0.05) == pytest.approx(0.05)
+    assert bucket.wait_time(now + 0.1) == pytest.approx(0, abs=1e-9)
+    bucket.consume()
+    assert bucket.wait_time(now + 0.1) == pytest.approx(0.1)
+
+
+def test_token_bucket_capacity_caps_refill():
+    bucket = TokenBucket(rate=5)
+    assert bucket.capacity == 5
+    now = bucket.last
+    for _ in range(5):
+        bucket.consume()
+    # 空闲再久也只攒到capacity个
+    bucket.wait_time(now + 100)
+    assert bucket.tokens == 5
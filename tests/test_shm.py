@@ -0,0 +1,103 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :test_shm.py
+@Time      :2023/5/15 10:12
+@Author    :fsksf
+"""
+import os
+import datetime
+
+import numpy as np
+import pytest
+from vnpy.trader.constant import Exchange
+from vnpy.trader.object import TickData
+
+from vnpy_qmt.shm import SharedTickWriter, SharedTickReader
+
+
+CAPACITY = 8
+
+
+@pytest.fixture
+def ring():
+    name = f'vnpy_qmt_test_{os.getpid()}'
+    writer = SharedTickWriter(name, capacity=CAPACITY)
+    reader = SharedTickReader(name)
+    if os.name == 'posix':
+        # 读端在同一进程里注销了写端的登记, 补回去以免写端unlink时告警
+        from multiprocessing import resource_tracker
+        resource_tracker.register(writer.shm._name, 'shared_memory')
+    tick = TickData(gateway_name='QMT', symbol='600000', exchange=Exchange.SSE,
+                    datetime=datetime.datetime.now(), last_price=10.0)
+
+    def write(n):
+        for _ in range(n):
+            tick.volume = writer._count
+            writer.write(tick)
+
+    yield writer, reader, write
+    reader.close()
+    writer.close()
+
+
+def test_read_in_order(ring):
+    writer, reader, write = ring
+    write(5)
+    assert reader.read()['volume'].tolist() == [0, 1, 2, 3, 4]
+    write(5)
+    # 跨过环尾
+    assert reader.read()['volume'].tolist() == [5, 6, 7, 8, 9]
+    assert reader.lost == 0
+    assert not len(reader.read())
+
+
+def test_lagging_reader_skips_slot_being_written(ring):
+    writer, reader, write = ring
+    write(CAPACITY)
+    # 第0条所在的槽位就是写端下一条要写的位置, 不能再返回
+    data = reader.read()
+    assert data['volume'].tolist() == list(range(1, CAPACITY))
+    assert reader.lost == 1
+
+    write(3 * CAPACITY + 2)
+    data = reader.read()
+    count = 4 * CAPACITY + 2
+    assert data['volume'].tolist() == list(range(count - CAPACITY + 1, count))
+    # 两次各读到CAPACITY - 1条, 其余都计入丢失
+    assert reader.lost == count - 2 * (CAPACITY - 1)
+
+
+class _RacingRecords(np.ndarray):
+    """
+    读端切片时让写端再写若干条, 模拟拷贝期间写端绕回覆盖
+    """
+    write = None
+    n = 0
+
+    def __getitem__(self, item):
+        data = super().__getitem__(item)
+        if isinstance(item, slice) and self.n:
+            n, self.n = self.n, 0
+            self.write(n)
+        return data
+
+
+@pytest.mark.parametrize('racing', [1, 3, CAPACITY + 3])
+def test_records_overwritten_during_copy_are_dropped(ring, racing):
+    writer, reader, write = ring
+    write(CAPACITY - 2)
+    reader.read()
+    write(CAPACITY - 1)
+    records = reader.records.view(_RacingRecords)
+    records.write = write
+    records.n = racing
+    reader.records = records
+
+    start = reader.cursor
+    data = reader.read()
+    header = writer._count
+    volumes = [int(v) for v in data['volume']]
+    # 返回的记录连续, 且都不在写端已经或正在覆盖的槽位上
+    assert volumes == list(range(reader.cursor - len(volumes), reader.cursor))
+    assert all(v > header - CAPACITY for v in volumes)
+    assert reader.lost + len(volumes) == reader.cursor - start
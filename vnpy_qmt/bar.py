@@ -0,0 +1,313 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :bar.py
+@Time      :2023/5/4 9:52
+@Author    :fsksf
+"""
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from vnpy.trader.constant import Interval
+from vnpy.trader.object import BarData
+
+from vnpy_qmt.utils import TO_VN_Exchange_map, timestamp_to_datetime
+
+
+# 1分钟K线: EVENT_BAR + '1.' (+ vt_symbol), N分钟K线: EVENT_BAR + f'{N}.' (+ vt_symbol)
+EVENT_BAR = "eBar."
+
+# 本地时间相对UTC的分钟数, 与timestamp_to_datetime一致按本机时区
+LOCAL_OFFSET = -time.timezone // 60
+# 交易时段(当日分钟数): 上午9:30-11:30, 下午13:00-15:00
+AM_OPEN, AM_CLOSE, PM_OPEN, PM_CLOSE = 570, 690, 780, 900
+SESSION_MINUTES = 120
+
+OPEN, HIGH, LOW, CLOSE, VOLUME, TURNOVER = range(6)
+
+
+def session_minute(mod: np.ndarray) -> np.ndarray:
+    """
+    当日分钟数映射到所属K线的分钟:
+    集合竞价并入9:30, 11:30的收盘tick并入11:29, 午休期间的并入11:29, 15:00收盘集合竞价并入14:59
+    """
+    mod = mod.copy()
+    mod[mod < AM_OPEN] = AM_OPEN
+    mod[(mod >= AM_CLOSE) & (mod < PM_OPEN)] = AM_CLOSE - 1
+    mod[mod >= PM_CLOSE] = PM_CLOSE - 1
+    return mod
+
+
+def bar_end(key: np.ndarray) -> np.ndarray:
+    """
+    K线可以收盘的分钟, 上午和下午最后一根要等收盘那一分钟的tick
+    """
+    mod = key % 1440
+    return key + 1 + ((mod == AM_CLOSE - 1) | (mod == PM_CLOSE - 1))
+
+
+class _Window:
+    """
+    一个标的正在合成的N分钟K线
+    """
+    __slots__ = ('window_id', 'end_key', 'bar')
+
+    def __init__(self, window_id: int, end_key: int, bar: BarData):
+        self.window_id = window_id
+        self.end_key = end_key
+        self.bar = bar
+
+
+class BarAggregator:
+    """
+    共享的K线合成, 由MD.on_tick按批驱动.
+
+    每个代码一行状态(开高低收量额、当前K线分钟、累计成交量基准)存放在numpy数组中; 一批行情中
+    每个代码的第k笔组成一轮, 一轮内代码不重复, 整轮向量化更新. K线在该代码下一分钟的tick到来,
+    或flush时行情时钟越过收盘分钟时推出, 每根只推一次. N分钟K线由1分钟K线合成, 不跨午休.
+    """
+
+    def __init__(self, on_bars: Callable, gateway_name: str, windows: List[int] = None, grace: float = 3):
+        self._on_bars = on_bars
+        self.gateway_name = gateway_name
+        self.windows = sorted(n for n in set(windows or []) if n > 1)
+        self.grace = grace
+        self.index: Dict[str, int] = {}
+        self.codes: List[str] = []
+        self._symbols: List[Tuple] = []
+        size = 1024
+        self.state = np.zeros((size, 6))
+        self.key = np.full(size, -1, dtype=np.int64)
+        self.emitted = np.full(size, -1, dtype=np.int64)
+        self.day = np.full(size, -1, dtype=np.int64)
+        self.cum_volume = np.zeros(size)
+        self.cum_turnover = np.zeros(size)
+        # window -> 代码序号 -> 正在合成的N分钟K线
+        self._pending: Dict[int, Dict[int, _Window]] = {n: {} for n in self.windows}
+        # 行情时钟: 最新tick时间(毫秒)和收到它的时间
+        self._last_time = 0
+        self._last_seen = 0.0
+        self._last_flush_minute = 0
+        self._lock = Lock()
+
+    def _code_id(self, code: str) -> int:
+        i = self.index.get(code)
+        if i is None:
+            i = self.index[code] = len(self.codes)
+            self.codes.append(code)
+            symbol, suffix = code.rsplit('.', 1)
+            self._symbols.append((symbol, TO_VN_Exchange_map[suffix]))
+            if i >= len(self.key):
+                self._grow()
+        return i
+
+    def _grow(self):
+        size = len(self.key)
+        self.state = np.concatenate([self.state, np.zeros((size, 6))])
+        for name in ('key', 'emitted', 'day'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.full(size, -1, dtype=np.int64)]))
+        self.cum_volume = np.concatenate([self.cum_volume, np.zeros(size)])
+        self.cum_turnover = np.concatenate([self.cum_turnover, np.zeros(size)])
+
+    def update(self, datas: dict):
+        """
+        datas为xtquant推送的{qmt代码: [tick, ...]}, 每个代码的tick按时间先后
+        """
+        ids, ranks, times, prices, volumes, turnovers = [], [], [], [], [], []
+        with self._lock:
+            code_id = self._code_id
+            for code, data_list in datas.items():
+                i = code_id(code)
+                for k, data in enumerate(data_list):
+                    ids.append(i)
+                    ranks.append(k)
+                    times.append(data['time'])
+                    prices.append(data['lastPrice'])
+                    volumes.append(data['volume'])
+                    turnovers.append(data.get('amount', 0))
+            if not ids:
+                return
+            ids = np.array(ids, dtype=np.int64)
+            times = np.array(times, dtype=np.int64)
+            prices = np.array(prices, dtype=np.float64)
+            volumes = np.array(volumes, dtype=np.float64)
+            turnovers = np.array(turnovers, dtype=np.float64)
+            self._last_time = max(self._last_time, int(times.max()))
+            self._last_seen = time.monotonic()
+            bars = []
+            rounds = max(ranks) + 1
+            if rounds == 1:
+                self._apply(ids, times, prices, volumes, turnovers, bars)
+            else:
+                ranks = np.array(ranks)
+                for k in range(rounds):
+                    m = ranks == k
+                    self._apply(ids[m], times[m], prices[m], volumes[m], turnovers[m], bars)
+        self._publish(bars)
+
+    def _apply(self, ids, times, prices, volumes, turnovers, bars: List[Tuple[int, BarData]]):
+        minute = times // 60000 + LOCAL_OFFSET
+        day = minute // 1440
+        mod = minute - day * 1440
+        key = day * 1440 + session_minute(mod)
+        # 所属分钟已推出的迟到tick丢弃, 不更新累计量基准, 其成交量计入下一笔所在的K线
+        # 价格为0的tick(集合竞价、停牌快照)同样跳过且不更新基准, 其成交量由下一笔有效tick带入K线
+        keep = (key > self.emitted[ids]) & (prices > 0)
+        if not keep.all():
+            ids, day, mod, key = ids[keep], day[keep], mod[keep], key[keep]
+            prices, volumes, turnovers = prices[keep], volumes[keep], turnovers[keep]
+
+        # 累计量转增量; 当天第一笔如果在开盘第一分钟之后才收到, 之前的累计量不属于任何一根K线
+        new_day = day != self.day[ids]
+        dv = volumes - self.cum_volume[ids]
+        dt = turnovers - self.cum_turnover[ids]
+        first_full = new_day & (mod <= AM_OPEN)
+        dv[new_day] = np.where(first_full[new_day], volumes[new_day], 0)
+        dt[new_day] = np.where(first_full[new_day], turnovers[new_day], 0)
+        np.maximum(dv, 0, out=dv)
+        np.maximum(dt, 0, out=dt)
+        self.day[ids] = day
+        self.cum_volume[ids] = volumes
+        self.cum_turnover[ids] = turnovers
+
+        current = self.key[ids]
+        new = key > current
+        finished = new & (current >= 0)
+        if finished.any():
+            self._emit(ids[finished], bars)
+
+        state = self.state
+        if new.any():
+            new_ids = ids[new]
+            p = prices[new]
+            state[new_ids, OPEN] = p
+            state[new_ids, HIGH] = p
+            state[new_ids, LOW] = p
+            state[new_ids, CLOSE] = p
+            state[new_ids, VOLUME] = dv[new]
+            state[new_ids, TURNOVER] = dt[new]
+            self.key[new_ids] = key[new]
+        same = ~new
+        if same.any():
+            same_ids = ids[same]
+            p = prices[same]
+            state[same_ids, HIGH] = np.maximum(state[same_ids, HIGH], p)
+            state[same_ids, LOW] = np.minimum(state[same_ids, LOW], p)
+            state[same_ids, CLOSE] = p
+            state[same_ids, VOLUME] += dv[same]
+            state[same_ids, TURNOVER] += dt[same]
+
+    def _emit(self, ids: np.ndarray, bars: List[Tuple[int, BarData]]):
+        keys = self.key[ids]
+        rows = self.state[ids]
+        self.emitted[ids] = keys
+        self.key[ids] = -1
+        for i, key, row in zip(ids.tolist(), keys.tolist(), rows.tolist()):
+            symbol, exchange = self._symbols[i]
+            bar = BarData(
+                gateway_name=self.gateway_name,
+                symbol=symbol,
+                exchange=exchange,
+                datetime=timestamp_to_datetime((key - LOCAL_OFFSET) * 60000),
+                interval=Interval.MINUTE,
+                open_price=row[OPEN],
+                high_price=row[HIGH],
+                low_price=row[LOW],
+                close_price=row[CLOSE],
+                volume=row[VOLUME],
+                turnover=row[TURNOVER]
+            )
+            bars.append((1, bar))
+            for n in self.windows:
+                self._merge_window(n, i, key, bar, bars)
+
+    def _merge_window(self, n: int, i: int, key: int, bar: BarData, bars: List[Tuple[int, BarData]]):
+        day, mod = divmod(key, 1440)
+        session = 0 if mod < AM_CLOSE else 1
+        offset = mod - (AM_OPEN if session == 0 else PM_OPEN)
+        window_id = (day * 2 + session) * SESSION_MINUTES + offset // n
+        pending = self._pending[n]
+        window = pending.get(i)
+        if window is not None and window.window_id != window_id:
+            bars.append((n, pending.pop(i).bar))
+            window = None
+        if window is None:
+            first = offset // n * n
+            end_key = key - offset + min(first + n, SESSION_MINUTES) - 1
+            window_bar = BarData(
+                gateway_name=bar.gateway_name,
+                symbol=bar.symbol,
+                exchange=bar.exchange,
+                datetime=timestamp_to_datetime((key - offset + first - LOCAL_OFFSET) * 60000),
+                interval=Interval.MINUTE,
+                open_price=bar.open_price,
+                high_price=bar.high_price,
+                low_price=bar.low_price,
+                close_price=bar.close_price,
+                volume=bar.volume,
+                turnover=bar.turnover
+            )
+            window = pending[i] = _Window(window_id, end_key, window_bar)
+        else:
+            window_bar = window.bar
+            window_bar.high_price = max(window_bar.high_price, bar.high_price)
+            window_bar.low_price = min(window_bar.low_price, bar.low_price)
+            window_bar.close_price = bar.close_price
+            window_bar.volume += bar.volume
+            window_bar.turnover += bar.turnover
+        if key >= window.end_key:
+            bars.append((n, pending.pop(i).bar))
+
+    def flush(self):
+        """
+        定时调用, 行情时钟越过收盘分钟(含grace秒)的K线直接推出, 不再等下一笔tick
+        """
+        with self._lock:
+            if not self._last_time:
+                return
+            now = self._last_time + (time.monotonic() - self._last_seen - self.grace) * 1000
+            now_minute = int(now // 60000) + LOCAL_OFFSET
+            if now_minute == self._last_flush_minute:
+                return
+            self._last_flush_minute = now_minute
+            bars = []
+            n = len(self.codes)
+            keys = self.key[:n]
+            due = np.flatnonzero((keys >= 0) & (bar_end(keys) <= now_minute))
+            if len(due):
+                self._emit(due, bars)
+            for window, pending in self._pending.items():
+                for i in [i for i, w in pending.items() if bar_end(w.end_key) <= now_minute]:
+                    bars.append((window, pending.pop(i).bar))
+        self._publish(bars)
+
+    def _publish(self, bars: List[Tuple[int, BarData]]):
+        if not bars:
+            return
+        grouped: Dict[int, List[BarData]] = {}
+        for window, bar in bars:
+            grouped.setdefault(window, []).append(bar)
+        for window, window_bars in grouped.items():
+            self._on_bars(window, window_bars)
+
+
+if __name__ == '__main__':
+    # 合成耗时的微基准: 5000个代码, 每批每个代码一笔, 共40批
+    import datetime
+
+    codes = [f'{600000 + i}.SH' for i in range(5000)]
+    emitted = []
+    aggregator = BarAggregator(lambda window, bars: emitted.extend(bars), 'QMT', [5])
+    base = int(datetime.datetime.combine(datetime.date.today(), datetime.time(9, 30)).timestamp() * 1000)
+    batches = [
+        {code: [{'time': base + k * 3000 + i, 'lastPrice': 10 + k % 7 * 0.01, 'volume': 100 * k}]
+         for i, code in enumerate(codes)}
+        for k in range(40)
+    ]
+    t = time.perf_counter()
+    for datas in batches:
+        aggregator.update(datas)
+    cost = (time.perf_counter() - t) / (len(batches) * len(codes))
+    print(f'每个tick耗时 {cost * 1e6:.2f}us, 推出{len(emitted)}根K线')
@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :basket.py
+@Time      :2023/3/21 13:27
+@Author    :fsksf
+"""
+from copy import copy
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Set
+
+from vnpy.trader.constant import Status
+
+
+EVENT_BASKET_PROGRESS = "eBasketProgress."
+
+
+STATUS_FIELD = {
+    Status.SUBMITTING: 'outstanding',
+    Status.NOTTRADED: 'outstanding',
+    Status.PARTTRADED: 'partial',
+    Status.ALLTRADED: 'filled',
+    Status.CANCELLED: 'cancelled',
+    Status.REJECTED: 'rejected'
+}
+
+
+@dataclass
+class BasketProgress:
+    """
+    篮子整体执行进度, 各状态的腿数之和等于total
+    """
+    basket_id: str
+    vt_symbol: str
+    reference: str = ""
+    total: int = 0
+    outstanding: int = 0
+    partial: int = 0
+    filled: int = 0
+    cancelled: int = 0
+    rejected: int = 0
+    traded_volume: float = 0
+    traded_notional: float = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.outstanding == 0 and self.partial == 0
+
+
+class BasketTracker:
+    """
+    按篮子汇总腿的委托和成交, 每次更新只改动对应计数.
+    腿的委托归档时调用discard, 全部腿归档后移除该篮子
+    """
+
+    def __init__(self, on_progress: Callable):
+        self._on_progress = on_progress
+        self.baskets: Dict[str, BasketProgress] = {}
+        # 委托号 -> 篮子号
+        self._leg_basket: Dict[str, str] = {}
+        # 委托号 -> 当前所在的状态计数字段
+        self._leg_field: Dict[str, str] = {}
+        self._tradeids: Dict[str, Set[str]] = {}
+        # 篮子号 -> 未归档的腿数
+        self._legs: Dict[str, int] = {}
+
+    def add_basket(self, basket_id: str, vt_symbol: str, orderids: List[str], reference: str = ""):
+        progress = BasketProgress(
+            basket_id=basket_id,
+            vt_symbol=vt_symbol,
+            reference=reference,
+            total=len(orderids),
+            outstanding=len(orderids)
+        )
+        self.baskets[basket_id] = progress
+        self._tradeids[basket_id] = set()
+        self._legs[basket_id] = len(orderids)
+        for orderid in orderids:
+            self._leg_basket[orderid] = basket_id
+            self._leg_field[orderid] = 'outstanding'
+        self._on_progress(copy(progress))
+
+    def get_basket_id(self, orderid: str) -> str:
+        return self._leg_basket.get(orderid)
+
+    def on_order(self, orderid: str, status: Status):
+        basket_id = self._leg_basket.get(orderid)
+        if basket_id is None:
+            return
+        field = STATUS_FIELD.get(status)
+        old_field = self._leg_field.get(orderid)
+        progress = self.baskets.get(basket_id)
+        if field is None or old_field is None or progress is None or field == old_field:
+            return
+        setattr(progress, old_field, getattr(progress, old_field) - 1)
+        setattr(progress, field, getattr(progress, field) + 1)
+        self._leg_field[orderid] = field
+        self._on_progress(copy(progress))
+
+    def on_trade(self, orderid: str, tradeid: str, price: float, volume: float):
+        basket_id = self._leg_basket.get(orderid)
+        if basket_id is None:
+            return
+        tradeids = self._tradeids.get(basket_id)
+        progress = self.baskets.get(basket_id)
+        if tradeids is None or progress is None or tradeid in tradeids:
+            # 主推和查询可能重复收到同一笔成交
+            return
+        tradeids.add(tradeid)
+        progress.traded_volume += volume
+        progress.traded_notional += price * volume
+        self._on_progress(copy(progress))
+
+    def discard(self, orderid: str):
+        basket_id = self._leg_basket.pop(orderid, None)
+        if basket_id is None:
+            return
+        self._leg_field.pop(orderid, None)
+        legs = self._legs.get(basket_id, 0) - 1
+        if legs > 0:
+            self._legs[basket_id] = legs
+            return
+        self._legs.pop(basket_id, None)
+        self.baskets.pop(basket_id, None)
+        self._tradeids.pop(basket_id, None)
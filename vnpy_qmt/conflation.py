@@ -0,0 +1,65 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :conflation.py
+@Time      :2023/3/9 14:02
+@Author    :fsksf
+"""
+import time
+from collections import defaultdict
+from threading import Thread, Lock
+from typing import Callable, Dict
+
+from vnpy.trader.object import TickData
+
+
+class TickConflater:
+    """
+    tick合并: 每个标的只保留最新快照, 事件队列空闲时立即推送, 否则按间隔推送
+    """
+
+    def __init__(self, on_tick: Callable, interval: float, queue_size: Callable = None):
+        self._on_tick = on_tick
+        self.interval = interval
+        self._queue_size = queue_size
+        self._latest: Dict[str, TickData] = {}
+        self._lock = Lock()
+        # 每个标的被合并掉的tick数
+        self.dropped: Dict[str, int] = defaultdict(int)
+        self._active = False
+        self._thread: Thread = None
+
+    def start(self):
+        self._active = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._active = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def put(self, tick: TickData):
+        with self._lock:
+            vt_symbol = tick.vt_symbol
+            if vt_symbol in self._latest:
+                self.dropped[vt_symbol] += 1
+            self._latest[vt_symbol] = tick
+        if self._queue_size is not None and self._queue_size() == 0:
+            self.flush()
+
+    def flush(self):
+        # 在锁内推送, 保证同一标的不会先推新tick再推旧tick
+        with self._lock:
+            if not self._latest:
+                return
+            latest = self._latest
+            self._latest = {}
+            for tick in latest.values():
+                self._on_tick(tick)
+
+    def _run(self):
+        while self._active:
+            time.sleep(self.interval)
+            self.flush()
@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :contract_cache.py
+@Time      :2023/3/6 10:21
+@Author    :fsksf
+"""
+import os
+import pickle
+import datetime
+from typing import Dict, List, Tuple
+
+
+class ContractCache:
+    """
+    标的信息本地缓存. 当日的缓存直接使用; 往日的缓存保留名称、最小变动价位、品种等静态字段和
+    不支持的代码, 涨跌停价和ETF篮子每天变化, 需要重新查询
+
+    contracts: qmt代码 -> (symbol, exchange, name, product, pricetick, limit_up, limit_down)
+    baskets:   qmt代码 -> [(exchange, name, share, symbol, cash_substitute), ...]
+    units:     ETF的qmt代码 -> (申赎单位, 现金差额)
+    skipped:   不支持的qmt代码, 增量刷新时不再查询
+    failed:    查询出错的qmt代码, 下次刷新时重新查询
+    sectors:   板块 -> qmt代码列表, 用于判断板块成分是否变化
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.date = datetime.date.today().strftime('%Y%m%d')
+        self.contracts: Dict[str, Tuple] = {}
+        self.baskets: Dict[str, List[Tuple]] = {}
+        self.units: Dict[str, Tuple[float, float]] = {}
+        self.skipped = set()
+        self.failed = set()
+        self.sectors: Dict[str, List[str]] = {}
+        # 加载的是往日缓存, contracts中的涨跌停价已过期
+        self.stale = False
+
+    def load(self) -> bool:
+        """
+        加载缓存, 往日的缓存不加载篮子, stale置为True
+        """
+        try:
+            with open(self.file_path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        self.contracts = data['contracts']
+        self.skipped = data['skipped']
+        self.failed = data.get('failed', set())
+        self.sectors = data['sectors']
+        if data.get('date') != self.date:
+            self.stale = True
+            return True
+        self.baskets = data['baskets']
+        self.units = data.get('units', {})
+        return True
+
+    def save(self):
+        data = {
+            'date': self.date,
+            'contracts': self.contracts,
+            'baskets': self.baskets,
+            'units': self.units,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'sectors': self.sectors
+        }
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.file_path)
+
+    @staticmethod
+    def _membership(sectors: Dict[str, List[str]]) -> Dict[str, Tuple[str, ...]]:
+        membership: Dict[str, List[str]] = {}
+        for sector, symbols in sectors.items():
+            for symbol in symbols:
+                membership.setdefault(symbol, []).append(sector)
+        return {symbol: tuple(s) for symbol, s in membership.items()}
+
+    def update_sectors(self, sectors: Dict[str, List[str]]) -> List[str]:
+        """
+        更新板块成分, 返回需要重新查询的qmt代码(新增、所属板块变化或上次查询出错)
+        """
+        old = self._membership(self.sectors)
+        new = self._membership(sectors)
+        for symbol in old.keys() - new.keys():
+            self.contracts.pop(symbol, None)
+            self.baskets.pop(symbol, None)
+            self.units.pop(symbol, None)
+            self.skipped.discard(symbol)
+            self.failed.discard(symbol)
+        self.sectors = sectors
+        return [symbol for symbol, s in new.items() if old.get(symbol) != s or symbol in self.failed]
+
+    def add_contract(self, qmt_symbol: str, record: Tuple):
+        self.skipped.discard(qmt_symbol)
+        self.failed.discard(qmt_symbol)
+        self.contracts[qmt_symbol] = record
+
+    def add_basket(self, qmt_symbol: str, components: List[Tuple], unit: float = 0, cash: float = 0):
+        self.baskets[qmt_symbol] = components
+        self.units[qmt_symbol] = (unit, cash)
+
+    def skip(self, qmt_symbol: str):
+        self.contracts.pop(qmt_symbol, None)
+        self.baskets.pop(qmt_symbol, None)
+        self.units.pop(qmt_symbol, None)
+        self.failed.discard(qmt_symbol)
+        self.skipped.add(qmt_symbol)
+
+    def fail(self, qmt_symbol: str):
+        """
+        查询出错, 旧记录作废
+        """
+        self.contracts.pop(qmt_symbol, None)
+        self.baskets.pop(qmt_symbol, None)
+        self.units.pop(qmt_symbol, None)
+        self.failed.add(qmt_symbol)
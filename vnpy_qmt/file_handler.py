@@ -4,8 +4,14 @@
 @Time      :2022/12/12 13:46
 @Author    :fsksf
 """
+import os
+import json
+import zlib
+import time
+import struct
 import datetime
-from typing import Callable
+from threading import Lock, Thread, Event
+from typing import Callable, Dict, List, Tuple
 from enum import Enum
 import dbf
 from vnpy.trader.constant import Status, Direction
@@ -15,75 +21,418 @@ from vnpy_qmt.utils import TO_VN_Exchange_map
 from watchdog.events import FileSystemEventHandler, FileModifiedEvent
 
 
+class DbfTailer:
+    """
+    dbf增量读取器: 表头只解析一次, 之后按字节偏移只解码新追加的定长记录
+    """
+
+    def __init__(self, path: str, codepage: str = 'cp936'):
+        self.path = path
+        self.codepage = codepage
+        # 已处理的记录条数
+        self.position = 0
+        self.header_length = 0
+        self.record_length = 0
+        # (字段名, 类型, 记录内偏移, 长度, 小数位)
+        self.fields: List[Tuple[str, str, int, int, int]] = []
+        # 文件大小、修改时间和首条记录的crc, 用于重启后判断文件是否被截断或替换
+        self.size = 0
+        self.mtime = 0.0
+        self.first_crc = None
+        self._verify = False
+
+    def get_state(self) -> dict:
+        return {
+            "position": self.position,
+            "size": self.size,
+            "mtime": self.mtime,
+            "first_crc": self.first_crc
+        }
+
+    def set_state(self, state: dict):
+        """
+        从断点恢复, 文件变小或变旧说明已被截断/替换, 此时全量重读
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        if st.st_size < state['size'] or st.st_mtime < state['mtime']:
+            return
+        self.position = state['position']
+        self.size = state['size']
+        self.mtime = state['mtime']
+        self.first_crc = state['first_crc']
+        self._verify = True
+
+    def _parse_header(self, f, header_length: int, record_length: int):
+        f.seek(32)
+        raw = f.read(header_length - 32)
+        fields = []
+        offset = 1  # 第一个字节是删除标记
+        for i in range(0, len(raw) - 31, 32):
+            desc = raw[i: i + 32]
+            if desc[0] == 0x0D:
+                break
+            name = desc[:11].split(b'\x00', 1)[0].decode(self.codepage).strip().upper()
+            typ = chr(desc[11])
+            length = desc[16]
+            decimal = desc[17]
+            fields.append((name, typ, offset, length, decimal))
+            offset += length
+        self.fields = fields
+        self.header_length = header_length
+        self.record_length = record_length
+
+    def _decode_value(self, raw: bytes, typ: str, decimal: int):
+        if typ in 'NF':
+            raw = raw.strip()
+            if not raw:
+                return None
+            try:
+                return float(raw) if decimal else int(raw)
+            except ValueError:
+                return None
+        return raw.rstrip(b' \x00').decode(self.codepage, errors='replace')
+
+    def _decode_record(self, record: bytes) -> dict:
+        row = {}
+        for name, typ, offset, length, decimal in self.fields:
+            row[name] = self._decode_value(record[offset: offset + length], typ, decimal)
+        return row
+
+    def read_new(self) -> List[dict]:
+        """
+        返回上次读取之后新追加的记录
+        """
+        with open(self.path, 'rb') as f:
+            header = f.read(32)
+            if len(header) < 32:
+                return []
+            count, header_length, record_length = struct.unpack('<IHH', header[4:12])
+            if header_length != self.header_length or record_length != self.record_length:
+                self._parse_header(f, header_length, record_length)
+            # 只读取已经完整写入的记录
+            st = os.fstat(f.fileno())
+            self.size = st.st_size
+            self.mtime = st.st_mtime
+            count = min(count, max(st.st_size - header_length, 0) // record_length)
+            if self._verify:
+                self._verify = False
+                f.seek(header_length)
+                if self.first_crc != zlib.crc32(f.read(record_length)):
+                    self.position = 0
+            if count < self.position:
+                # 文件被重写, 从头开始
+                self.position = 0
+            if count == self.position:
+                return []
+            f.seek(header_length + self.position * record_length)
+            data = f.read((count - self.position) * record_length)
+        if self.position == 0:
+            self.first_crc = zlib.crc32(data[:record_length])
+        rows = []
+        for start in range(0, len(data) - record_length + 1, record_length):
+            self.position += 1
+            record = data[start: start + record_length]
+            if record[:1] == b'*':
+                # 已删除的记录
+                continue
+            rows.append(self._decode_record(record))
+        return rows
+
+
+class DbfCheckpoint:
+    """
+    dbf读取进度的持久化, 按交易日分文件, 原子写入
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.date = datetime.date.today().strftime('%Y%m%d')
+        self.states: Dict[str, dict] = self._load()
+
+    @property
+    def file_path(self):
+        return os.path.join(self.folder, f'qmt_dbf_cursor_{self.date}.json')
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _roll(self):
+        today = datetime.date.today().strftime('%Y%m%d')
+        if today != self.date:
+            self.date = today
+            self.states = self._load()
+
+    def get(self, path: str) -> dict:
+        self._roll()
+        return self.states.get(path)
+
+    def save(self, path: str, state: dict):
+        self._roll()
+        self.states[path] = state
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.states, f)
+        os.replace(tmp_path, self.file_path)
+
+
+class DbfOrderWriter:
+    """
+    dbf下单文件的异步写入: 委托先进队列, 后台线程被唤醒后把队列中的委托一批写入.
+    每批重新打开文件, 记录数以QMT或其它进程改动后的文件为准.
+    写入出错的委托隔retry_interval秒重试, 超过max_retries次后交给on_error(record, error);
+    打开或关闭文件出错时record为None
+    """
+
+    def __init__(self, path: str, on_error: Callable, max_retries: int = 3, retry_interval: float = 0.5):
+        self.path = path
+        self._on_error = on_error
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        # (委托, 已失败次数)
+        self._queue: List[Tuple[dict, int]] = []
+        self._lock = Lock()
+        self._wakeup = Event()
+        # 入队耗时统计(秒)
+        self.enqueue_count = 0
+        self.enqueue_total = 0.0
+        self.enqueue_max = 0.0
+        self.failed_count = 0
+        self._active = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, record: dict) -> float:
+        start = time.perf_counter()
+        with self._lock:
+            self._queue.append((record, 0))
+            cost = time.perf_counter() - start
+            self.enqueue_count += 1
+            self.enqueue_total += cost
+            if cost > self.enqueue_max:
+                self.enqueue_max = cost
+        self._wakeup.set()
+        return cost
+
+    def flush(self, final: bool = False) -> bool:
+        """
+        写出队列中的委托, 有需要稍后重试的返回False. final为True时不再重试
+        """
+        with self._lock:
+            items = self._queue
+            self._queue = []
+        if not items:
+            return True
+        failed = []
+        try:
+            table = dbf.Table(self.path)
+            table.open(mode=dbf.READ_WRITE)
+        except Exception as e:
+            # 文件被占用等, 整批重试
+            failed = [(record, attempts + 1, e) for record, attempts in items]
+        else:
+            for record, attempts in items:
+                try:
+                    table.append(record)
+                except Exception as e:
+                    failed.append((record, attempts + 1, e))
+            try:
+                table.close()
+            except Exception as e:
+                self._on_error(None, e)
+        retry = []
+        for record, attempts, error in failed:
+            if attempts < self.max_retries and not final:
+                retry.append((record, attempts))
+            else:
+                self.failed_count += 1
+                self._on_error(record, error)
+        if retry:
+            with self._lock:
+                self._queue[:0] = retry
+        return not retry
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._active:
+                return
+            if not self.flush():
+                time.sleep(self.retry_interval)
+                self._wakeup.set()
+
+    def close(self):
+        self._active = False
+        self._wakeup.set()
+        self._thread.join()
+        self.flush(final=True)
+
+
 class ResultFileHandler(FileSystemEventHandler):
 
-    def __init__(self, on_order: Callable, on_trade: Callable):
+    def __init__(self, on_order: Callable, on_trade: Callable, checkpoint: DbfCheckpoint = None,
+                 coalesce_window: float = 0.02, latency=None, write_log: Callable = print):
+        self._latency = latency
+        self._write_log = write_log
         self._on_order = on_order
-        self._order_p = 0
         self._on_trade = on_trade
-        self._trade_p = 0
+        self._tailers: Dict[str, DbfTailer] = {}
+        self._checkpoint = checkpoint
+        # 文件名 -> 处理函数, 交易日切换时重建
+        self._dispatch: Dict[str, Callable] = {}
+        self._roll_at = 0.0
+        # 同一文件在窗口期内的多次修改事件只读一次
+        self._coalesce_window = coalesce_window
+        self._pending: Dict[str, Callable] = {}
+        self._pending_lock = Lock()
+        self._process_lock = Lock()
+        # 合并后的读取都在同一个常驻线程里做, 不为每次修改新建线程
+        self._pending_event = Event()
+        self._worker: Thread = None
+
+    def _build_dispatch(self):
+        now = datetime.datetime.now()
+        self._dispatch = {
+            'XT_DBF_ORDER_result.dbf': self.on_order_result,
+            f'XT_CJCX_Stock_{now.strftime("%Y%m%d")}.dbf': self.on_trade_change,
+        }
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        self._roll_at = tomorrow.timestamp()
+
+    def get_tailer(self, path) -> DbfTailer:
+        tailer = self._tailers.get(path)
+        if tailer is None:
+            tailer = DbfTailer(path, codepage='cp936')
+            if self._checkpoint is not None:
+                state = self._checkpoint.get(path)
+                if state:
+                    tailer.set_state(state)
+            self._tailers[path] = tailer
+        return tailer
+
+    def read_new(self, path) -> Tuple[DbfTailer, List[dict]]:
+        tailer = self.get_tailer(path)
+        rows = tailer.read_new()
+        if rows and self._latency is not None:
+            # 文件修改时间到解析完成
+            self._latency.record('dbf_parse', time.time() - tailer.mtime)
+        return tailer, rows
+
+    def save_checkpoint(self, tailer: DbfTailer):
+        if self._checkpoint is not None:
+            self._checkpoint.save(tailer.path, tailer.get_state())
 
     def on_modified(self, event: FileModifiedEvent):
+        if time.time() >= self._roll_at:
+            self._build_dispatch()
         path = event.src_path
-        if path.endswith('XT_DBF_ORDER_result.dbf'):
-            self.on_order_result(path)
-        if path.endswith(f'XT_CJCX_Stock_{datetime.datetime.now().strftime("%Y%m%d")}.dbf'):
-            self.on_trade_change(path)
+        func = self._dispatch.get(os.path.basename(path))
+        if func is None:
+            return
+        if self._coalesce_window <= 0:
+            with self._process_lock:
+                self._process(path, func)
+            return
+        with self._pending_lock:
+            self._pending[path] = func
+            if self._worker is None:
+                self._worker = Thread(target=self._run, daemon=True)
+                self._worker.start()
+        self._pending_event.set()
+
+    def _run(self):
+        while True:
+            self._pending_event.wait()
+            # 等待窗口期, 收拢这段时间内的修改事件; 之后到来的事件会再次set
+            time.sleep(self._coalesce_window)
+            self._pending_event.clear()
+            self._flush_pending()
+
+    def _flush_pending(self):
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = {}
+        with self._process_lock:
+            for path, func in pending.items():
+                self._process(path, func)
+
+    def _process(self, path, func: Callable):
+        try:
+            func(path)
+        except Exception as e:
+            # 读取本身失败时进度没有前进, 下次修改事件会重试
+            self._write_log(f'读取{path}失败: {e!r}')
 
     def on_trade_change(self, path):
-        result_table = dbf.Table(path, codepage='cp936')
-        with result_table.open(mode=dbf.READ_ONLY) as f:
-            for i, row in enumerate(f):
-                if i < self._trade_p:
-                    continue
-                self._trade_p += 1
-                if row['投资备注'].strip() == "":
-                    continue
-                caozuo = row['操作'].strip()
-                if caozuo == '买入':
-                    direction = Direction.LONG
-                else:
-                    direction = Direction.SHORT
-                trade = TradeData(
-                    symbol=row['证券代码'].strip(),
-                    exchange=TO_VN_Exchange_map[row['证券市场'].strip()],
-                    orderid=row['投资备注'].strip(),
-                    direction=direction,
-                    price=float(row['成交价格'].strip()),
-                    volume=int(row['成交数量'].strip()),
-                    gateway_name='QMT',
-                    datetime=datetime.datetime.strptime(row['成交日期'].strip() + " " + row['成交时间'].strip(),
-                                                        '%Y%m%d %H:%M:%S'),
-                    tradeid=row['成交编号'].strip(),
-                )
-                self._on_trade(trade)
+        tailer, rows = self.read_new(path)
+        if not rows:
+            return
+        for row in rows:
+            # 单条记录出错只记日志, 不影响同一批的其余记录
+            try:
+                self._process_trade_row(row)
+            except Exception as e:
+                self._write_log(f'成交记录处理失败 {row}: {e!r}')
+        self.save_checkpoint(tailer)
+
+    def _process_trade_row(self, row: dict):
+        if row['投资备注'].strip() == "":
+            return
+        caozuo = row['操作'].strip()
+        if caozuo == '买入':
+            direction = Direction.LONG
+        else:
+            direction = Direction.SHORT
+        trade = TradeData(
+            symbol=row['证券代码'].strip(),
+            exchange=TO_VN_Exchange_map[row['证券市场'].strip()],
+            orderid=row['投资备注'].strip(),
+            direction=direction,
+            price=float(row['成交价格'].strip()),
+            volume=int(row['成交数量'].strip()),
+            gateway_name='QMT',
+            datetime=datetime.datetime.strptime(row['成交日期'].strip() + " " + row['成交时间'].strip(),
+                                                '%Y%m%d %H:%M:%S'),
+            tradeid=row['成交编号'].strip(),
+        )
+        self._on_trade(trade)
 
     def on_order_result(self, path):
-        result_table = dbf.Table(path, codepage='cp936')
-        with result_table.open(mode=dbf.READ_ONLY) as f:
-            for i, row in enumerate(f):
-                if i < self._order_p:
-                    continue
-                self._order_p += 1
-                try:
-                    xt_order_id = str(row.ORDERNUM).strip()
-                except ValueError:
-                    xt_order_id = '-1'
-                task_process = row.TASKPRO
-                try:
-                    traded, _ = task_process.split('/')
-                    traded = int(traded)
-                except ValueError:
-                    traded = 0
-                d = {
-                    "xt_order_id": xt_order_id,
-                    "msg": str(row.MESSAGE).strip(),
-                    "status": str(row.STATUS).strip(),
-                    "task_status": str(row.TASKSTATUS).strip(),
-                    "note": str(row.NOTE).strip(),
-                    "traded": traded
-                }
-                self._on_order(d)
+        tailer, rows = self.read_new(path)
+        if not rows:
+            return
+        for row in rows:
+            try:
+                self._process_order_row(row)
+            except Exception as e:
+                self._write_log(f'文件单结果处理失败 {row}: {e!r}')
+        self.save_checkpoint(tailer)
+
+    def _process_order_row(self, row: dict):
+        order_num = row['ORDERNUM']
+        xt_order_id = '-1' if order_num is None else str(order_num).strip()
+        task_process = row['TASKPRO']
+        try:
+            traded, _ = task_process.split('/')
+            traded = int(traded)
+        except ValueError:
+            traded = 0
+        d = {
+            "xt_order_id": xt_order_id,
+            "msg": str(row['MESSAGE']).strip(),
+            "status": str(row['STATUS']).strip(),
+            "task_status": str(row['TASKSTATUS']).strip(),
+            "note": str(row['NOTE']).strip(),
+            "traded": traded
+        }
+        self._on_order(d)
 
 
 class TaskStatus(Enum):
@@ -0,0 +1,331 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :history.py
+@Time      :2023/5/8 10:26
+@Author    :fsksf
+"""
+import os
+import json
+import shutil
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import xtquant.xtdata
+from vnpy.trader.constant import Interval
+from vnpy.trader.object import BarData
+
+from vnpy_qmt.bar import LOCAL_OFFSET
+from vnpy_qmt.utils import to_vn_contract, timestamp_to_datetime
+
+
+HISTORY_FIELDS = ('time', 'open', 'high', 'low', 'close', 'volume', 'amount')
+PERIOD_MAP = {
+    Interval.MINUTE: '1m',
+    Interval.HOUR: '1h',
+    Interval.DAILY: '1d',
+    Interval.WEEKLY: '1w',
+}
+TO_VN_INTERVAL = {v: k for k, v in PERIOD_MAP.items()}
+
+
+def to_date_int(dt) -> int:
+    return dt.year * 10000 + dt.month * 100 + dt.day
+
+
+def from_date_int(d: int) -> datetime.date:
+    return datetime.date(d // 10000, d // 100 % 100, d % 100)
+
+
+def subtract_ranges(start: int, end: int, covered: List[List[int]]) -> List[Tuple[int, int]]:
+    """
+    [start, end]中不在covered里的日期区间, 日期均为YYYYMMDD整数, 区间两端都包含
+    """
+    missing = []
+    cursor = from_date_int(start)
+    last = from_date_int(end)
+    for a, b in covered:
+        a, b = from_date_int(a), from_date_int(b)
+        if b < cursor:
+            continue
+        if a > last:
+            break
+        if a > cursor:
+            missing.append((to_date_int(cursor), to_date_int(a - datetime.timedelta(days=1))))
+        cursor = max(cursor, b + datetime.timedelta(days=1))
+        if cursor > last:
+            break
+    if cursor <= last:
+        missing.append((to_date_int(cursor), end))
+    return missing
+
+
+def merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+    merged = []
+    for a, b in sorted(ranges):
+        if merged and from_date_int(a) <= from_date_int(merged[-1][1]) + datetime.timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return merged
+
+
+class HistoryCache:
+    """
+    本地K线缓存, 按列存放: 周期/代码/分区.版本/列名.npy, 日线以上按年分区, 其余按月分区.
+    分区整体写入新版本目录后改名生效, 不覆盖已有文件, 读取总是取最新版本, 旧版本在下次写入时清理.
+    读取时用mmap只载入请求的时间段并复制出来, 不持有打开的文件. 每个周期一个coverage.json,
+    记录各代码已下载过的日期区间.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._coverage: Dict[str, Dict[str, List[List[int]]]] = {}
+
+    def _coverage_path(self, period: str) -> str:
+        return os.path.join(self.folder, period, 'coverage.json')
+
+    def coverage(self, period: str) -> Dict[str, List[List[int]]]:
+        coverage = self._coverage.get(period)
+        if coverage is None:
+            try:
+                with open(self._coverage_path(period), 'r', encoding='utf-8') as f:
+                    coverage = json.load(f)
+            except (OSError, ValueError):
+                coverage = {}
+            self._coverage[period] = coverage
+        return coverage
+
+    def get_missing(self, code: str, period: str, start: int, end: int) -> List[Tuple[int, int]]:
+        return subtract_ranges(start, end, self.coverage(period).get(code, []))
+
+    def add_coverage(self, code: str, period: str, start: int, end: int):
+        if start > end:
+            return
+        coverage = self.coverage(period)
+        coverage[code] = merge_ranges(coverage.get(code, []) + [[start, end]])
+
+    def save_coverage(self, period: str):
+        path = self._coverage_path(period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.coverage(period), f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def partition_keys(period: str, times: np.ndarray) -> np.ndarray:
+        local = (times + LOCAL_OFFSET * 60000).astype('datetime64[ms]')
+        if period in ('1d', '1w'):
+            return local.astype('datetime64[Y]').astype(np.int64) + 1970
+        months = local.astype('datetime64[M]').astype(np.int64)
+        return (months // 12 + 1970) * 100 + months % 12 + 1
+
+    def _code_folder(self, code: str, period: str) -> str:
+        return os.path.join(self.folder, period, code)
+
+    @staticmethod
+    def _partitions(code_folder: str) -> Dict[int, List[Tuple[int, str]]]:
+        """
+        分区 -> [(版本, 目录名), ...], 版本从新到旧; 没有版本号的旧目录视为版本0, 未完成的.tmp目录忽略
+        """
+        partitions = defaultdict(list)
+        if os.path.isdir(code_folder):
+            for name in os.listdir(code_folder):
+                parts = name.split('.')
+                if len(parts) > 2 or not all(part.isdigit() for part in parts):
+                    continue
+                version = int(parts[1]) if len(parts) == 2 else 0
+                partitions[int(parts[0])].append((version, name))
+        for versions in partitions.values():
+            versions.sort(reverse=True)
+        return partitions
+
+    @staticmethod
+    def _load_partition(folder: str, mmap_mode=None) -> Dict[str, np.ndarray]:
+        return {
+            name: np.load(os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode)
+            for name in HISTORY_FIELDS
+        }
+
+    def write(self, code: str, period: str, columns: Dict[str, np.ndarray]):
+        """
+        按分区合并写入, 同一时间的K线以新数据为准
+        """
+        times = columns['time']
+        if not len(times):
+            return
+        keys = self.partition_keys(period, times)
+        code_folder = self._code_folder(code, period)
+        partitions = self._partitions(code_folder)
+        for key in np.unique(keys).tolist():
+            m = keys == key
+            new = {name: columns[name][m] for name in HISTORY_FIELDS}
+            versions = partitions.get(key, [])
+            if versions:
+                old = self._load_partition(os.path.join(code_folder, versions[0][1]))
+                merged = {name: np.concatenate([new[name], old[name]]) for name in HISTORY_FIELDS}
+                # unique保留第一次出现的, 新数据在前
+                _, index = np.unique(merged['time'], return_index=True)
+                new = {name: merged[name][index] for name in HISTORY_FIELDS}
+            else:
+                order = np.argsort(new['time'], kind='stable')
+                new = {name: new[name][order] for name in HISTORY_FIELDS}
+            # 整个分区写入新目录再改名, 目标目录不存在, 改名是原子的; 旧版本可能仍被读取方打开, 不覆盖
+            version = versions[0][0] + 1 if versions else 1
+            folder = os.path.join(code_folder, f'{key}.{version}')
+            tmp_folder = f'{folder}.{os.getpid()}.tmp'
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            os.makedirs(tmp_folder)
+            for name in HISTORY_FIELDS:
+                np.save(os.path.join(tmp_folder, name + '.npy'), new[name])
+            os.rename(tmp_folder, folder)
+            # 删除失败(Windows上仍被打开)的留到下次写入再清理
+            for _, name in versions:
+                shutil.rmtree(os.path.join(code_folder, name), ignore_errors=True)
+
+    def read(self, code: str, period: str, start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+        """
+        读取[start_ms, end_ms]的各列, 返回的是复制出来的数组, 不引用缓存文件
+        """
+        code_folder = self._code_folder(code, period)
+        parts = defaultdict(list)
+        first, last = self.partition_keys(period, np.array([start_ms, end_ms], dtype=np.int64)).tolist()
+        for key, versions in sorted(self._partitions(code_folder).items()):
+            if not first <= key <= last:
+                continue
+            partition = self._read_partition(code_folder, versions, start_ms, end_ms)
+            for field in HISTORY_FIELDS:
+                parts[field].append(partition[field])
+        return {
+            name: np.concatenate(parts[name]) if parts[name] else
+            np.zeros(0, dtype=np.int64 if name == 'time' else np.float64)
+            for name in HISTORY_FIELDS
+        }
+
+    def _read_partition(self, code_folder: str, versions: List[Tuple[int, str]],
+                        start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+        # 列出目录后其他写入方可能已经换上新版本并删掉旧的, 找不到时重新列出
+        for _ in range(3):
+            try:
+                partition = self._load_partition(os.path.join(code_folder, versions[0][1]), mmap_mode='r')
+            except FileNotFoundError:
+                key = int(versions[0][1].split('.')[0])
+                versions = self._partitions(code_folder).get(key)
+                if not versions:
+                    break
+                continue
+            times = partition['time']
+            a = np.searchsorted(times, start_ms, 'left')
+            b = np.searchsorted(times, end_ms, 'right')
+            return {field: np.array(partition[field][a:b]) for field in HISTORY_FIELDS}
+        return {name: np.zeros(0, dtype=np.int64 if name == 'time' else np.float64) for name in HISTORY_FIELDS}
+
+
+class HistoryBars:
+    """
+    一个代码的历史K线, 按需从缓存读取. 可以当作BarData的序列使用, 也可以直接取numpy列或DataFrame
+    """
+
+    def __init__(self, cache: HistoryCache, code: str, period: str, start_ms: int, end_ms: int,
+                 gateway_name: str = 'QMT'):
+        self.cache = cache
+        self.code = code
+        self.period = period
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.gateway_name = gateway_name
+        self._columns: Dict[str, np.ndarray] = None
+
+    @property
+    def columns(self) -> Dict[str, np.ndarray]:
+        if self._columns is None:
+            self._columns = self.cache.read(self.code, self.period, self.start_ms, self.end_ms)
+        return self._columns
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        columns = self.columns
+        symbol, exchange = to_vn_contract(self.code)
+        return BarData(
+            gateway_name=self.gateway_name,
+            symbol=symbol,
+            exchange=exchange,
+            datetime=timestamp_to_datetime(int(columns['time'][index])),
+            interval=TO_VN_INTERVAL.get(self.period),
+            open_price=float(columns['open'][index]),
+            high_price=float(columns['high'][index]),
+            low_price=float(columns['low'][index]),
+            close_price=float(columns['close'][index]),
+            volume=float(columns['volume'][index]),
+            turnover=float(columns['amount'][index])
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        df = pd.DataFrame(self.columns)
+        df.index = pd.to_datetime(df['time'] + LOCAL_OFFSET * 60000, unit='ms')
+        return df
+
+
+class HistoryService:
+    """
+    历史K线查询: 先查覆盖索引, 只把缺失的日期区间用xtdata批量下载; 缺失区间相同的代码合并成一次请求.
+    当天的数据还在变化, 不计入覆盖区间, 每次都会重新下载. 只有确实取回数据的代码才记录覆盖,
+    覆盖到取回的最后一根K线所在日; 下载失败或断线时没有数据返回, 下次查询会再次下载.
+    """
+
+    def __init__(self, folder: str, gateway_name: str = 'QMT', batch_size: int = 500):
+        self.cache = HistoryCache(folder)
+        self.gateway_name = gateway_name
+        self.batch_size = batch_size
+
+    def load(self, codes: List[str], period: str, start: datetime.datetime,
+             end: datetime.datetime = None) -> Dict[str, HistoryBars]:
+        end = end or datetime.datetime.now()
+        start_date, end_date = to_date_int(start), to_date_int(end)
+        groups: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+        for code in codes:
+            for missing in self.cache.get_missing(code, period, start_date, end_date):
+                groups[missing].append(code)
+        for (a, b), group in groups.items():
+            for i in range(0, len(group), self.batch_size):
+                self.download(group[i: i + self.batch_size], period, a, b)
+        if groups:
+            self.cache.save_coverage(period)
+        start_ms = int(start.timestamp() * 1000)
+        end_ms = int(end.timestamp() * 1000)
+        return {
+            code: HistoryBars(self.cache, code, period, start_ms, end_ms, self.gateway_name)
+            for code in codes
+        }
+
+    def download(self, codes: List[str], period: str, start: int, end: int):
+        start_time, end_time = f'{start}000000', f'{end}235959'
+        xtquant.xtdata.download_history_data2(codes, period, start_time, end_time)
+        data = xtquant.xtdata.get_market_data_ex(
+            [], codes, period=period, start_time=start_time, end_time=end_time
+        )
+        covered_end = min(end, to_date_int(datetime.date.today() - datetime.timedelta(days=1)))
+        for code in codes:
+            df = data.get(code)
+            if df is None or not len(df):
+                continue
+            columns = {
+                name: np.asarray(df[name].values, dtype=np.int64 if name == 'time' else np.float64)
+                for name in HISTORY_FIELDS
+            }
+            self.cache.write(code, period, columns)
+            last_date = to_date_int(timestamp_to_datetime(int(columns['time'].max())))
+            self.cache.add_coverage(code, period, start, min(covered_end, last_date))
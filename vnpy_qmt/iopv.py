@@ -0,0 +1,250 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :iopv.py
+@Time      :2023/4/24 9:36
+@Author    :fsksf
+"""
+import time
+from datetime import datetime
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+
+EVENT_ETF_IOPV = "eEtfIopv."
+
+
+@dataclass
+class EtfIopv:
+    """
+    ETF参考净值, 申赎单位未知时iopv为一篮子成分市值, 不计算溢价率
+    """
+    vt_symbol: str
+    iopv: float
+    last_price: float
+    # 溢价率 last_price / iopv - 1
+    premium: float
+    # 还没有价格的成分数, 大于0时iopv偏低
+    missing: int
+    datetime: datetime = None
+
+
+class IopvEngine:
+    """
+    ETF实时参考净值.
+
+    所有篮子编译成按成分排序的(成分序号, 篮子序号, 份额)三个数组, 每批tick只对价格变化的成分
+    取出对应区段, 用bincount把 份额*价格变化 累加到篮子市值上, 只有包含这些成分的篮子被标记.
+    推送按interval节流, 每次只推送被标记的篮子; 节流期间剩下的由flush定时推出.
+    """
+
+    def __init__(self, on_iopv: Callable, interval: float = 0.2):
+        self._on_iopv = on_iopv
+        self.interval = interval
+        # etf vt_symbol -> (etf qmt代码, [(成分qmt代码, 份额)], 申赎单位, 现金差额)
+        self.baskets: Dict[str, Tuple[str, List[Tuple[str, float]], float, float]] = {}
+        # qmt代码 -> 价格序号
+        self.symbol_index: Dict[str, int] = {}
+        self.prices = np.full(0, np.nan)
+        self.etfs: List[str] = []
+        self._etf_price_index = np.zeros(0, dtype=np.int64)
+        self._units = np.zeros(0)
+        self._cash = np.zeros(0)
+        self.values = np.zeros(0)
+        self.missing = np.zeros(0, dtype=np.int64)
+        self._dirty = np.zeros(0, dtype=bool)
+        # 按成分序号排序的篮子序号和份额, 成分i的区段为[_indptr[i], _indptr[i+1])
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._entry_basket = np.zeros(0, dtype=np.int64)
+        self._entry_share = np.zeros(0)
+        # 价格序号 -> 以其为ETF本身的篮子序号, 不是ETF为-1
+        self._etf_of = np.zeros(0, dtype=np.int64)
+        self._lock = Lock()
+        self._last_publish = 0.0
+
+    def add_baskets(self, baskets: Dict[str, Tuple[str, List[Tuple[str, float]], float, float]]):
+        """
+        新增或替换篮子后重新编译, 已有的价格保留
+        """
+        with self._lock:
+            self.baskets.update(baskets)
+            self._compile()
+
+    def _price_index(self, code: str) -> int:
+        i = self.symbol_index.get(code)
+        if i is None:
+            i = self.symbol_index[code] = len(self.symbol_index)
+        return i
+
+    def _compile(self):
+        etfs = sorted(self.baskets)
+        comp_ids, basket_ids, shares = [], [], []
+        etf_price_index = []
+        for b, vt_symbol in enumerate(etfs):
+            etf_code, components, _, _ = self.baskets[vt_symbol]
+            etf_price_index.append(self._price_index(etf_code))
+            merged: Dict[int, float] = {}
+            for code, share in components:
+                i = self._price_index(code)
+                merged[i] = merged.get(i, 0) + share
+            for i, share in merged.items():
+                comp_ids.append(i)
+                basket_ids.append(b)
+                shares.append(share)
+
+        n = len(self.symbol_index)
+        prices = np.full(n, np.nan)
+        prices[:len(self.prices)] = self.prices
+        self.prices = prices
+
+        comp_ids = np.array(comp_ids, dtype=np.int64)
+        order = np.argsort(comp_ids, kind='stable')
+        self._entry_basket = np.array(basket_ids, dtype=np.int64)[order]
+        self._entry_share = np.array(shares, dtype=np.float64)[order]
+        self._indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(comp_ids, minlength=n), out=self._indptr[1:])
+
+        self.etfs = etfs
+        nb = len(etfs)
+        self._etf_price_index = np.array(etf_price_index, dtype=np.int64)
+        self._etf_of = np.full(n, -1, dtype=np.int64)
+        self._etf_of[self._etf_price_index] = np.arange(nb)
+        self._units = np.array([self.baskets[s][2] for s in etfs], dtype=np.float64)
+        self._cash = np.array([self.baskets[s][3] for s in etfs], dtype=np.float64)
+
+        # 按当前价格整体重算一次
+        entry_prices = prices[comp_ids[order]]
+        known = ~np.isnan(entry_prices)
+        self.values = np.bincount(self._entry_basket[known], weights=self._entry_share[known] * entry_prices[known],
+                                  minlength=nb).astype(np.float64)
+        self.missing = np.bincount(self._entry_basket[~known], minlength=nb).astype(np.int64)
+        self._dirty = np.ones(nb, dtype=bool)
+
+    def update(self, datas: dict):
+        """
+        datas为xtquant推送的{qmt代码: [tick, ...]}, 每个代码取最后一笔的价格
+        """
+        index = self.symbol_index
+        idx = []
+        px = []
+        for code, data_list in datas.items():
+            i = index.get(code)
+            if i is not None and data_list:
+                idx.append(i)
+                px.append(data_list[-1]['lastPrice'])
+        if not idx:
+            return
+        with self._lock:
+            self._apply(np.array(idx, dtype=np.int64), np.array(px, dtype=np.float64))
+        now = time.monotonic()
+        if now - self._last_publish >= self.interval:
+            self._last_publish = now
+            self.publish()
+
+    def _apply(self, idx: np.ndarray, new: np.ndarray):
+        prices = self.prices
+        old = prices[idx]
+        changed = (old != new) & (new > 0)
+        if not changed.any():
+            return
+        idx = idx[changed]
+        new = new[changed]
+        old = old[changed]
+        prices[idx] = new
+
+        etf_baskets = self._etf_of[idx]
+        self._dirty[etf_baskets[etf_baskets >= 0]] = True
+
+        starts = self._indptr[idx]
+        lengths = self._indptr[idx + 1] - starts
+        total = lengths.sum()
+        if not total:
+            return
+        # 各成分区段拼接后的下标
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        baskets = self._entry_basket[offsets]
+        was_missing = np.isnan(old)
+        delta = np.repeat(new - np.where(was_missing, 0, old), lengths) * self._entry_share[offsets]
+        nb = len(self.etfs)
+        self.values += np.bincount(baskets, weights=delta, minlength=nb)
+        if was_missing.any():
+            self.missing -= np.bincount(baskets, weights=np.repeat(was_missing, lengths),
+                                        minlength=nb).astype(np.int64)
+        self._dirty[baskets] = True
+
+    def _make(self, b: int, now: datetime) -> EtfIopv:
+        unit = self._units[b]
+        value = self.values[b] + self._cash[b]
+        iopv = value / unit if unit > 0 else value
+        last_price = self.prices[self._etf_price_index[b]]
+        if unit > 0 and iopv > 0 and last_price > 0:
+            premium = last_price / iopv - 1
+        else:
+            premium = np.nan
+        return EtfIopv(
+            vt_symbol=self.etfs[b],
+            iopv=float(iopv),
+            last_price=float(last_price),
+            premium=float(premium),
+            missing=int(self.missing[b]),
+            datetime=now
+        )
+
+    def flush(self):
+        """
+        定时调用, 节流期间变化的篮子之后没有新tick到来时也能推出
+        """
+        now = time.monotonic()
+        if self._dirty.any() and now - self._last_publish >= self.interval:
+            self._last_publish = now
+            self.publish()
+
+    def publish(self):
+        with self._lock:
+            dirty = np.flatnonzero(self._dirty)
+            if not len(dirty):
+                return
+            self._dirty[dirty] = False
+            now = datetime.now()
+            results = [self._make(b, now) for b in dirty]
+        self._on_iopv(results)
+
+    def get_iopv(self, vt_symbol: str) -> EtfIopv:
+        with self._lock:
+            if vt_symbol not in self.baskets:
+                return None
+            b = self.etfs.index(vt_symbol)
+            return self._make(b, datetime.now())
+
+
+if __name__ == '__main__':
+    # 更新耗时的微基准: 50个ETF, 每个300只成分, 每批500只股票变价
+    rng = np.random.default_rng(0)
+    stocks = [f'{600000 + i}.SH' for i in range(2000)]
+    engine = IopvEngine(lambda results: None, interval=0.2)
+    engine.add_baskets({
+        f'{510000 + i}.SSE': (
+            f'{510000 + i}.SH',
+            [(stocks[j], 100 * (1 + j % 5)) for j in rng.choice(len(stocks), 300, replace=False)],
+            100000, 0
+        )
+        for i in range(50)
+    })
+    batches = [
+        {stocks[j]: [{'lastPrice': 10 + rng.random()}] for j in rng.choice(len(stocks), 500, replace=False)}
+        for _ in range(100)
+    ]
+    n = 0
+    t = time.perf_counter()
+    for _ in range(10):
+        for datas in batches:
+            engine.update(datas)
+            n += 1
+    print(f'每批更新耗时 {(time.perf_counter() - t) / n * 1e6:.1f}us')
+    exact = np.array([
+        sum(share * engine.prices[engine.symbol_index[code]] for code, share in engine.baskets[s][1])
+        for s in engine.etfs
+    ])
+    print(f'增量与全量重算最大误差 {np.abs(engine.values - exact).max():.2e}')
@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :latency.py
+@Time      :2023/4/18 11:05
+@Author    :fsksf
+"""
+from threading import local, Lock, Thread, current_thread
+from typing import Dict, List, Tuple
+
+
+# 小于16us逐个分桶, 之后每个2的幂次分8个桶, 误差不超过12.5%
+BUCKET_COUNT = 16 + 8 * 40
+
+
+def bucket_index(us: int) -> int:
+    if us < 16:
+        return us if us > 0 else 0
+    shift = us.bit_length() - 4
+    return 16 + (shift - 1) * 8 + (us >> shift) - 8
+
+
+def bucket_upper(index: int) -> int:
+    if index < 16:
+        return index
+    shift = (index - 16) // 8 + 1
+    mantissa = (index - 16) % 8 + 8
+    return (mantissa + 1) << shift
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.max = 0
+
+    def record(self, seconds: float):
+        us = int(seconds * 1000000)
+        self.counts[min(bucket_index(us), BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        if us > self.max:
+            self.max = us
+
+    def merge(self, other: "LatencyHistogram"):
+        counts = self.counts
+        for i, n in enumerate(other.counts):
+            if n:
+                counts[i] += n
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> int:
+        if not self.count:
+            return 0
+        target = self.count * p
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(bucket_upper(i), self.max)
+        return self.max
+
+
+class LatencyRecorder:
+    """
+    各线程写自己的直方图, 记录时不加锁; 读取时合并所有线程的直方图, 已退出线程的并入_retired后丢弃.
+    时间统一用秒, 输出为微秒.
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._lock = Lock()
+        self._all: List[Tuple[Thread, Dict[str, LatencyHistogram]]] = []
+        self._retired: Dict[str, LatencyHistogram] = {}
+
+    def _histograms(self) -> Dict[str, LatencyHistogram]:
+        histograms = getattr(self._local, 'histograms', None)
+        if histograms is None:
+            histograms = self._local.histograms = {}
+            with self._lock:
+                self._all.append((current_thread(), histograms))
+        return histograms
+
+    def record(self, name: str, seconds: float):
+        histograms = self._histograms()
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def get_stats(self) -> Dict[str, dict]:
+        merged: Dict[str, LatencyHistogram] = {}
+        with self._lock:
+            # 线程退出后不会再写, 合并进_retired, 避免短命线程的直方图一直累积
+            alive = []
+            for thread, histograms in self._all:
+                if thread.is_alive():
+                    alive.append((thread, histograms))
+                    continue
+                for name, histogram in histograms.items():
+                    self._retired.setdefault(name, LatencyHistogram()).merge(histogram)
+            self._all = alive
+            for name, histogram in self._retired.items():
+                merged.setdefault(name, LatencyHistogram()).merge(histogram)
+        for _, histograms in alive:
+            for name, histogram in list(histograms.items()):
+                merged.setdefault(name, LatencyHistogram()).merge(histogram)
+        return {
+            name: {
+                "count": h.count,
+                "p50": h.percentile(0.5),
+                "p99": h.percentile(0.99),
+                "max": h.max
+            }
+            for name, h in sorted(merged.items())
+        }
+
+    def format_stats(self) -> str:
+        return ' | '.join(
+            f'{name} n={s["count"]} p50={s["p50"]}us p99={s["p99"]}us max={s["max"]}us'
+            for name, s in self.get_stats().items()
+        )
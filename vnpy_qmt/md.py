@@ -8,7 +8,10 @@ import datetime
 import asyncio
 import time
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
 from vnpy.trader.gateway import BaseGateway
+from vnpy.trader.utility import get_file_path, get_folder_path
 from vnpy.trader.constant import (
     Exchange, Product
 )
@@ -22,159 +25,502 @@ import xtquant.xttype
 from vnpy_qmt.utils import (
     From_VN_Exchange_map, TO_VN_Exchange_map, to_vn_contract,
     TO_VN_Product, to_vn_product, timestamp_to_datetime,
-    to_qmt_code
+    to_qmt_code, to_vn_min_volume
 )
+from vnpy_qmt.contract_cache import ContractCache
+from vnpy_qmt.conflation import TickConflater
+from vnpy_qmt.tick_buffer import TickBuffers
+from vnpy_qmt.shm import SharedTickWriter
+from vnpy_qmt.iopv import IopvEngine
+from vnpy_qmt.tick_recorder import TickRecorder
+from vnpy_qmt.replay import TickReplayer
+from vnpy_qmt.bar import BarAggregator
+from vnpy_qmt.history import HistoryService
 
 
 class MD:
 
+    SECTORS = ['上期所', '上证A股', '上证B股', '上证期权', '中金所', '创业板', '大商所',
+               '沪市ETF', '沪市指数', '沪深A股',
+               '沪深B股', '沪深ETF', '沪深指数', '深市ETF',
+               '深市基金', '深市指数', '深证A股', '深证B股', '深证期权', '科创板', '科创板CDR',
+               '连续合约']
+    # 标的查询线程数和每批推送的合约数
+    LOAD_WORKERS = 8
+    LOAD_BATCH = 500
+
     def __init__(self, gateway):
         self.gateway = gateway
         self.th = None
         self.limit_ups = {}
         self.limit_downs = {}
+        self._tick_templates = {}
+        # 全推模式下只做一次全市场订阅, 按已订阅集合过滤
+        self.whole_quote = False
+        self.subscribed = set()
+        self.subscribe_ids = {}
+        self.conflater: TickConflater = None
+        self.tick_buffers: TickBuffers = None
+        self.shm_writer: SharedTickWriter = None
+        self.iopv: IopvEngine = None
+        # ETF vt_symbol -> (申赎单位, 现金差额)
+        self.etf_units = {}
+        self.recorder: TickRecorder = None
+        self.replayer: TickReplayer = None
+        self.bars: BarAggregator = None
+        self.history: HistoryService = None
+
+    def start_replay(self, date: str, codes: List[str] = None, speed: float = 0):
+        """
+        把记录的tick按实时行情同样的路径推送, date为YYYYMMDD
+        """
+        self.stop_replay()
+        self.replayer = TickReplayer(
+            self.on_replay_tick, str(get_folder_path('qmt_ticks')), date, codes, speed,
+            on_finish=lambda stats: self.write_log(f'回放结束 {stats}')
+        )
+        self.write_log(f'开始回放 {date} {len(self.replayer.codes)}个代码 速度{speed or "全速"}')
+        self.replayer.start()
+
+    def stop_replay(self):
+        if self.replayer is not None:
+            self.replayer.stop()
 
     def close(self) -> None:
-        pass
+        self.stop_replay()
+        if self.conflater is not None:
+            self.conflater.stop()
+        if self.shm_writer is not None:
+            self.shm_writer.close()
+            self.shm_writer = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.write_log(f'tick记录完成 {self.recorder.get_stats()}')
+            self.recorder = None
 
     def subscribe(self, req: SubscribeRequest) -> None:
-
-        return xtquant.xtdata.subscribe_quote(
-            stock_code=f'{req.symbol}.{From_VN_Exchange_map[req.exchange]}',
+        code = f'{req.symbol}.{From_VN_Exchange_map[req.exchange]}'
+        if self.whole_quote:
+            self.subscribed.add(code)
+            return
+        if code in self.subscribe_ids:
+            return
+        seq = xtquant.xtdata.subscribe_quote(
+            stock_code=code,
             period='tick',
             callback=self.on_tick
         )
+        self.subscribe_ids[code] = seq
+        return seq
+
+    def unsubscribe(self, req: SubscribeRequest) -> None:
+        code = f'{req.symbol}.{From_VN_Exchange_map[req.exchange]}'
+        if self.whole_quote:
+            self.subscribed.discard(code)
+            return
+        seq = self.subscribe_ids.pop(code, None)
+        if seq is not None:
+            xtquant.xtdata.unsubscribe_quote(seq)
+
+    def subscribe_whole_quote(self):
+        self.whole_quote = True
+        # 之前逐个订阅的转入全推
+        for code, seq in self.subscribe_ids.items():
+            xtquant.xtdata.unsubscribe_quote(seq)
+            self.subscribed.add(code)
+        self.subscribe_ids.clear()
+        markets = [From_VN_Exchange_map[exchange] for exchange in self.gateway.exchanges]
+        xtquant.xtdata.subscribe_whole_quote(markets, callback=self.on_whole_quote)
+        self.write_log(f'全推行情订阅 {markets}')
+
+    def on_whole_quote(self, datas):
+        """
+        全推回调每个代码只有一个快照, 转成on_tick的格式
+        """
+        subscribed = self.subscribed
+        datas = {code: [data] for code, data in datas.items() if code in subscribed}
+        if datas:
+            self.on_tick(datas)
 
     def connect(self, setting: dict) -> None:
+        self.history = HistoryService(str(get_folder_path('qmt_history')), self.gateway.gateway_name)
+        capacity = int(setting.get('tick缓存条数', 0))
+        if capacity > 0:
+            self.tick_buffers = TickBuffers(capacity)
+        shm_name = setting.get('共享内存行情', '')
+        if shm_name:
+            self.shm_writer = SharedTickWriter(shm_name)
+            self.write_log(f'tick写入共享内存 {shm_name}')
+        interval = int(setting.get('行情合并(毫秒)', 0))
+        if interval > 0:
+            self.conflater = TickConflater(
+                self.gateway.on_tick, interval / 1000,
+                queue_size=self.gateway.event_engine._queue.qsize
+            )
+            self.conflater.start()
+        if setting.get('记录tick', '否') == '是':
+            self.recorder = TickRecorder(str(get_folder_path('qmt_ticks')))
+            self.recorder.start()
+            self.write_log(f'tick记录到 {self.recorder.folder}')
+        bar_windows = str(setting.get('K线周期(分钟)', '')).strip()
+        if bar_windows:
+            windows = [int(n) for n in bar_windows.replace('，', ',').split(',') if n.strip()]
+            self.bars = BarAggregator(self.gateway.on_bars, self.gateway.gateway_name, windows)
+            self.write_log(f'合成K线 1分钟 {self.bars.windows}')
+        iopv_interval = int(setting.get('ETF净值推送(毫秒)', 0))
+        if iopv_interval > 0:
+            self.iopv = IopvEngine(self.gateway.on_iopv, iopv_interval / 1000)
+        if setting.get('全推行情', '否') == '是':
+            self.subscribe_whole_quote()
         self.th = Thread(target=self.get_contract)
         self.th.start()
         return
 
     def get_contract(self):
         self.write_log('开始获取标的信息')
-        contract_ids = set()
-        bk = ['上期所', '上证A股', '上证B股', '上证期权', '中金所', '创业板', '大商所',
-              '沪市ETF', '沪市指数', '沪深A股',
-              '沪深B股', '沪深ETF', '沪深指数', '深市ETF',
-              '深市基金', '深市指数', '深证A股', '深证B股', '深证期权', '科创板', '科创板CDR',
-              '连续合约']
-        for sector in bk:
-            print(sector)
-            stock_list = xtquant.xtdata.get_stock_list_in_sector(sector_name=sector)
-            for symbol in stock_list:
-                if symbol in contract_ids:
-                    continue
-                contract_ids.add(symbol)
-                info = xtquant.xtdata.get_instrument_detail(symbol)
-                contract_type = xtquant.xtdata.get_instrument_type(symbol)
-                if info is None or contract_type is None:
-                    continue
+        start = time.perf_counter()
+        cache = ContractCache(str(get_file_path('qmt_contract_cache.pkl')))
+        if cache.load():
+            self.load_cache(cache)
+        sectors = {
+            sector: xtquant.xtdata.get_stock_list_in_sector(sector_name=sector)
+            for sector in self.SECTORS
+        }
+        symbols = cache.update_sectors(sectors)
+        # 往日缓存中的标的只刷新当日字段, 不支持的代码仍然跳过
+        records = {}
+        if cache.stale:
+            changed = set(symbols)
+            records = {symbol: record for symbol, record in cache.contracts.items() if symbol not in changed}
+            symbols = symbols + list(records)
+        total = len(symbols)
+        contracts = []
+        components = []
+        failed = 0
+        unsupported = []
+        with ThreadPoolExecutor(max_workers=self.LOAD_WORKERS) as executor:
+            futures = {
+                executor.submit(self.fetch_contract, symbol, records.get(symbol)): symbol
+                for symbol in symbols
+            }
+            for n, future in enumerate(as_completed(futures), 1):
+                # 单个标的查询或解析出错只跳过该标的
                 try:
-                    exchange = TO_VN_Exchange_map[info['ExchangeID']]
-                except KeyError:
-                    print('本gateway不支持的标的', symbol)
-                    continue
-                if exchange not in self.gateway.exchanges:
-                    continue
-                product = to_vn_product(contract_type)
-                if product not in self.gateway.TRADE_TYPE:
-                    continue
-
-                c = ContractData(
-                    gateway_name=self.gateway.gateway_name,
-                    symbol=info['InstrumentID'],
-                    exchange=exchange,
-                    name=info['InstrumentName'],
-                    product=product,
-                    pricetick=info['PriceTick'],
-                    size=100,
-                    min_volume=100
-                )
-                self.limit_ups[c.vt_symbol] = info['UpStopPrice']
-                self.limit_downs[c.vt_symbol] = info['DownStopPrice']
-                self.gateway.on_contract(c)
-                if product == Product.ETF:
-                    self.get_etf_info(c)
-        self.write_log('获取标的信息完成')
-
-    def get_etf_info(self, contract):
-        self.write_log(f'获取etf {contract.vt_symbol} 篮子信息')
-        qmt_symbol = to_qmt_code(contract.symbol, contract.exchange)
-        info = xtquant.xtdata.get_etf_info(qmt_symbol)
+                    result = future.result()
+                    if result[1] is not None and result[2] is None:
+                        unsupported.append(result[0])
+                    self.apply_contract(result, cache, contracts, components)
+                except Exception as e:
+                    failed += 1
+                    cache.fail(futures[future])
+                    self.write_log(f'查询标的 {futures[future]} 出错: {e!r}')
+                if len(contracts) >= self.LOAD_BATCH or n == total:
+                    self.flush_contracts(contracts, components)
+                    contracts, components = [], []
+                    self.write_log(f'查询标的 {n}/{total}, 耗时{time.perf_counter() - start:.1f}s')
+        cache.save()
+        if unsupported:
+            self.write_log(f'本gateway不支持的标的{len(unsupported)}个: {unsupported[:10]}')
+        self.write_log(f'获取标的信息完成, 缓存{len(cache.contracts)}个, 增量查询{total}个, 出错{failed}个, '
+                       f'耗时{time.perf_counter() - start:.1f}s')
+
+    def flush_contracts(self, contracts: List[ContractData], components: List[BasketComponent]):
+        # 名称和涨跌停价可能变化, 让tick模板重建
+        self._tick_templates.clear()
+        self.gateway.on_contracts(contracts)
+        for comp in components:
+            self.gateway.on_basket_component(comp)
+        if self.iopv is not None and components:
+            self.update_iopv_baskets(components)
+
+    def update_iopv_baskets(self, components: List[BasketComponent]):
+        baskets = {}
+        skipped = []
+        for comp in components:
+            etf_symbol, etf_exchange = comp.basket_name.rsplit('.', 1)
+            basket = baskets.get(comp.basket_name)
+            if basket is None:
+                unit, cash = self.etf_units.get(comp.basket_name, (0, 0))
+                basket = baskets[comp.basket_name] = [
+                    to_qmt_code(etf_symbol, Exchange(etf_exchange)), [], unit, cash
+                ]
+            # 只订阅沪深行情, 其它市场的成分和份额为0的成分没有价格, 按替代金额计入现金
+            if comp.share > 0 and comp.exchange in self.gateway.exchanges:
+                basket[1].append((to_qmt_code(comp.symbol, comp.exchange), comp.share))
+            else:
+                basket[3] += comp.cash_substitute
+                skipped.append(f'{comp.basket_name}:{comp.symbol}.{comp.exchange.value}')
+        if skipped:
+            self.write_log(f'ETF净值 {len(skipped)}个成分按现金替代计入: {", ".join(skipped[:10])}'
+                           f'{" ..." if len(skipped) > 10 else ""}')
+        self.iopv.add_baskets({name: tuple(basket) for name, basket in baskets.items()})
+
+    def load_cache(self, cache: ContractCache):
+        """
+        往日的缓存只推送合约, 涨跌停价等查询刷新后再设置
+        """
+        contracts = []
+        for symbol, exchange, name, product, pricetick, limit_up, limit_down in cache.contracts.values():
+            c = ContractData(
+                gateway_name=self.gateway.gateway_name,
+                symbol=symbol,
+                exchange=Exchange(exchange),
+                name=name,
+                product=Product(product),
+                pricetick=pricetick,
+                size=100,
+                min_volume=to_vn_min_volume(Product(product))
+            )
+            if not cache.stale:
+                self.limit_ups[c.vt_symbol] = limit_up
+                self.limit_downs[c.vt_symbol] = limit_down
+            contracts.append(c)
+        components = []
+        for qmt_symbol, comps in cache.baskets.items():
+            symbol, exchange = to_vn_contract(qmt_symbol)
+            basket_name = f'{symbol}.{exchange.value}'
+            self.etf_units[basket_name] = cache.units.get(qmt_symbol, (0, 0))
+            # 旧版本缓存的成分没有现金替代金额
+            for comp_exchange, name, share, comp_symbol, *cash_substitute in comps:
+                components.append(self.new_component(
+                    basket_name, Exchange(comp_exchange), name, share, comp_symbol,
+                    cash_substitute[0] if cash_substitute else 0
+                ))
+        self.flush_contracts(contracts, components)
+        self.write_log(f'从{"往日" if cache.stale else "当日"}缓存加载{len(cache.contracts)}个标的')
+
+    def fetch_contract(self, symbol, record: tuple = None):
+        """
+        在线程池中执行, 只做xtdata查询和过滤, 不修改任何状态.
+        record为往日缓存中的记录时, 交易所和品种沿用缓存, 不再查询品种也不再过滤
+        """
+        info = xtquant.xtdata.get_instrument_detail(symbol)
+        if info is None:
+            return symbol, None, None, None, None
+        if record is not None:
+            exchange, product = Exchange(record[1]), Product(record[3])
+        else:
+            contract_type = xtquant.xtdata.get_instrument_type(symbol)
+            if contract_type is None:
+                return symbol, None, None, None, None
+            exchange = TO_VN_Exchange_map.get(info['ExchangeID'])
+            if exchange is None:
+                # 不支持的交易所返回info而exchange为None, 由加载线程汇总记录
+                return symbol, info, None, None, None
+            if exchange not in self.gateway.exchanges:
+                return symbol, None, None, None, None
+            product = to_vn_product(contract_type)
+            if product not in self.gateway.TRADE_TYPE:
+                return symbol, None, None, None, None
+        etf_info = None
+        if product == Product.ETF:
+            etf_info = xtquant.xtdata.get_etf_info(symbol)
+        return symbol, info, exchange, product, etf_info
+
+    def apply_contract(self, result, cache: ContractCache,
+                       contracts: List[ContractData], components: List[BasketComponent]):
+        symbol, info, exchange, product, etf_info = result
+        if info is None or exchange is None:
+            cache.skip(symbol)
+            return
+
+        c = ContractData(
+            gateway_name=self.gateway.gateway_name,
+            symbol=info['InstrumentID'],
+            exchange=exchange,
+            name=info['InstrumentName'],
+            product=product,
+            pricetick=info['PriceTick'],
+            size=100,
+            min_volume=to_vn_min_volume(product)
+        )
+        self.limit_ups[c.vt_symbol] = info['UpStopPrice']
+        self.limit_downs[c.vt_symbol] = info['DownStopPrice']
+        contracts.append(c)
+        cache.add_contract(symbol, (
+            c.symbol, c.exchange.value, c.name, c.product.value, c.pricetick,
+            info['UpStopPrice'], info['DownStopPrice']
+        ))
+        if etf_info is not None:
+            # 增量刷新时篮子可能已从缓存加载过
+            self.gateway.clear_basket(c.vt_symbol)
+            comps = self.parse_etf_info(c, etf_info)
+            components.extend(comps)
+            unit = etf_info.get('reportUnit') or 0
+            cash = etf_info.get('cashBalance') or 0
+            self.etf_units[c.vt_symbol] = (unit, cash)
+            cache.add_basket(symbol, [
+                (comp.exchange.value, comp.name, comp.share, comp.symbol, comp.cash_substitute) for comp in comps
+            ], unit, cash)
+
+    def new_component(self, basket_name, exchange, name, share, symbol, cash_substitute=0) -> BasketComponent:
+        return BasketComponent(
+            gateway_name=self.gateway.gateway_name,
+            basket_name=basket_name,
+            exchange=exchange,
+            name=name,
+            share=share,
+            cash_substitute=cash_substitute,
+            premium_ratio=0,
+            redemption_cash_substitute=0,
+            symbol=symbol,
+            substitute_flag=1
+        )
+
+    def parse_etf_info(self, contract, info) -> List[BasketComponent]:
         stocks = info['stocks']
 
+        components = []
         for stock_code, stock_comp in stocks.items():
             xt_ex = stock_comp['componentExchID']
             if xt_ex is None:
                 continue
             else:
                 vn_exchange = TO_VN_Exchange_map[xt_ex]
-            bc = BasketComponent(
-                gateway_name=self.gateway.gateway_name,
-                basket_name=contract.vt_symbol,
-                exchange=vn_exchange,
-                name=stock_comp['componentName'],
-                share=stock_comp['componentVolume'],
-                cash_substitute=0,
-                premium_ratio=0,
-                redemption_cash_substitute=0,
-                symbol=stock_comp['componentCode'],
-                substitute_flag=1
+            bc = self.new_component(
+                contract.vt_symbol, vn_exchange, stock_comp['componentName'],
+                stock_comp['componentVolume'], stock_comp['componentCode'],
+                stock_comp.get('ReplaceBalance') or 0
             )
-            self.gateway.on_basket_component(bc)
+            components.append(bc)
+        return components
+
+    def get_tick_template(self, code):
+        """
+        每个标的只算一次代码、交易所、名称和涨跌停价, 作为构造TickData的模板
+        """
+        template = self._tick_templates.get(code)
+        if template is not None:
+            return template
+        symbol, suffix = code.rsplit('.')
+        exchange = TO_VN_Exchange_map[suffix]
+        tick = TickData(
+            gateway_name=self.gateway.gateway_name,
+            symbol=symbol,
+            exchange=exchange,
+            datetime=None,
+            limit_down=0,
+            limit_up=0
+        )
+        contract = self.gateway.get_contract(tick.vt_symbol)
+        if contract:
+            tick.name = contract.name
+        tick.limit_up = self.limit_ups.get(tick.vt_symbol, None)
+        tick.limit_down = self.limit_downs.get(tick.vt_symbol, None)
+        template = tick.__dict__
+        if contract:
+            # 合约还没加载完的不缓存, 下次再取
+            self._tick_templates[code] = template
+        return template
 
-    def on_tick(self, datas):
+    def convert_ticks(self, datas) -> List[TickData]:
+        ticks = []
+        new_tick = TickData.__new__
+        buffers = self.tick_buffers
         for code, data_list in datas.items():
-            symbol, suffix = code.rsplit('.')
-            exchange = TO_VN_Exchange_map[suffix]
+            template = self.get_tick_template(code)
+            vt_symbol = template['vt_symbol']
             for data in data_list:
-                ask_price = data['askPrice']
-                ask_vol = data['askVol']
-                bid_price = data['bidPrice']
-                bid_vol = data['bidVol']
-
-                tick = TickData(
-                    gateway_name=self.gateway.gateway_name,
-                    symbol=symbol,
-                    exchange=exchange,
-                    datetime=timestamp_to_datetime(data['time']),
-                    last_price=data['lastPrice'],
-                    volume=data['volume'],
-                    open_price=data['open'],
-                    high_price=data['high'],
-                    low_price=data['low'],
-                    pre_close=data['lastClose'],
-                    limit_down=0,
-                    limit_up=0,
-                    ask_price_1=ask_price[0],
-                    ask_price_2=ask_price[1],
-                    ask_price_3=ask_price[2],
-                    ask_price_4=ask_price[3],
-                    ask_price_5=ask_price[4],
-
-                    ask_volume_1=ask_vol[0],
-                    ask_volume_2=ask_vol[1],
-                    ask_volume_3=ask_vol[2],
-                    ask_volume_4=ask_vol[3],
-                    ask_volume_5=ask_vol[4],
-
-                    bid_price_1=bid_price[0],
-                    bid_price_2=bid_price[1],
-                    bid_price_3=bid_price[2],
-                    bid_price_4=bid_price[3],
-                    bid_price_5=bid_price[4],
-
-                    bid_volume_1=bid_vol[0],
-                    bid_volume_2=bid_vol[1],
-                    bid_volume_3=bid_vol[2],
-                    bid_volume_4=bid_vol[3],
-                    bid_volume_5=bid_vol[4],
-                )
-                contract = self.gateway.get_contract(tick.vt_symbol)
-                if contract:
-                    tick.name = contract.name
-                tick.limit_up = self.limit_ups.get(tick.vt_symbol, None)
-                tick.limit_down = self.limit_downs.get(tick.vt_symbol, None)
-                self.gateway.on_tick(tick)
+                if buffers is not None:
+                    buffers.append(vt_symbol, data)
+                d = template.copy()
+                d['datetime'] = timestamp_to_datetime(data['time'])
+                d['last_price'] = data['lastPrice']
+                d['volume'] = data['volume']
+                d['open_price'] = data['open']
+                d['high_price'] = data['high']
+                d['low_price'] = data['low']
+                d['pre_close'] = data['lastClose']
+                (d['ask_price_1'], d['ask_price_2'], d['ask_price_3'],
+                 d['ask_price_4'], d['ask_price_5']) = data['askPrice'][:5]
+                (d['ask_volume_1'], d['ask_volume_2'], d['ask_volume_3'],
+                 d['ask_volume_4'], d['ask_volume_5']) = data['askVol'][:5]
+                (d['bid_price_1'], d['bid_price_2'], d['bid_price_3'],
+                 d['bid_price_4'], d['bid_price_5']) = data['bidPrice'][:5]
+                (d['bid_volume_1'], d['bid_volume_2'], d['bid_volume_3'],
+                 d['bid_volume_4'], d['bid_volume_5']) = data['bidVol'][:5]
+                tick = new_tick(TickData)
+                tick.__dict__ = d
+                ticks.append(tick)
+        return ticks
+
+    def on_replay_tick(self, datas):
+        """
+        回放的tick不再记录, 也不计入交易所到收到的延迟
+        """
+        self.on_tick(datas, replay=True)
+
+    def on_tick(self, datas, replay: bool = False):
+        received = time.time()
+        start = time.perf_counter()
+        if self.conflater is not None:
+            on_tick = self.conflater.put
+        else:
+            on_tick = self.gateway.on_tick
+        shm_writer = self.shm_writer
+        ticks = self.convert_ticks(datas)
+        converted = time.perf_counter()
+        for tick in ticks:
+            if shm_writer is not None:
+                shm_writer.write(tick)
+            on_tick(tick)
+        end = time.perf_counter()
+        if not ticks:
+            return
+        latency = self.gateway.latency
+        if not replay:
+            # 每个代码取最后一笔计算交易所时间到收到的延迟
+            for data_list in datas.values():
+                if data_list:
+                    latency.record('tick_exchange', received - data_list[-1]['time'] / 1000)
+        latency.record('tick_convert', (converted - start) / len(ticks))
+        latency.record('tick_dispatch', end - start)
+        if self.iopv is not None:
+            self.iopv.update(datas)
+            latency.record('iopv_update', time.perf_counter() - end)
+        if self.bars is not None:
+            bar_start = time.perf_counter()
+            self.bars.update(datas)
+            latency.record('bar_update', time.perf_counter() - bar_start)
+        recorder = self.recorder
+        if recorder is not None and not replay:
+            record_start = time.perf_counter()
+            recorder.record(datas)
+            latency.record('tick_record', time.perf_counter() - record_start)
+
     def write_log(self, msg):
-        self.gateway.write_log(f"[ md ] {msg}")
\ No newline at end of file
+        self.gateway.write_log(f"[ md ] {msg}")
+
+
+if __name__ == '__main__':
+    # tick转换的微基准, 不需要连接QMT
+    from vnpy_qmt.latency import LatencyRecorder
+
+    class _Gateway:
+        gateway_name = 'QMT'
+        latency = LatencyRecorder()
+
+        def get_contract(self, vt_symbol):
+            return ContractData(gateway_name='QMT', symbol=vt_symbol.split('.')[0], exchange=Exchange.SSE,
+                                name='', product=Product.EQUITY, size=100, pricetick=0.01)
+
+        def on_tick(self, tick):
+            pass
+
+    md = MD(_Gateway())
+    now = int(time.time() * 1000)
+    datas = {
+        f'{600000 + i}.SH': [{
+            'time': now, 'lastPrice': 10.0, 'volume': 1000, 'open': 9.9, 'high': 10.1,
+            'low': 9.8, 'lastClose': 9.95, 'askPrice': [10.01, 10.02, 10.03, 10.04, 10.05],
+            'askVol': [1, 2, 3, 4, 5], 'bidPrice': [9.99, 9.98, 9.97, 9.96, 9.95],
+            'bidVol': [1, 2, 3, 4, 5]
+        }] * 10
+        for i in range(500)
+    }
+    n = 20
+    t = time.perf_counter()
+    for _ in range(n):
+        md.on_tick(datas)
+    cost = (time.perf_counter() - t) / (n * 500 * 10)
+    print(f'每个tick耗时 {cost * 1e6:.2f}us')
@@ -0,0 +1,144 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :order_store.py
+@Time      :2023/4/3 10:08
+@Author    :fsksf
+"""
+import os
+import csv
+import time
+import datetime
+from collections import defaultdict, deque
+from threading import Lock
+from typing import Dict, List, Set, Tuple
+
+from vnpy.trader.constant import Status
+from vnpy.trader.object import OrderData, TradeData
+
+
+ACTIVE_STATUSES = {Status.SUBMITTING, Status.NOTTRADED, Status.PARTTRADED}
+
+
+class OrderStore:
+    """
+    委托和成交的存储.
+
+    按vt_symbol、reference索引活动委托, 按状态索引全部委托; 委托进入终态超过retention秒后
+    连同其成交一起移出内存, 追加写到当日的归档csv.
+    用法与dict相同, 原地修改了委托对象后需调用refresh重建索引.
+    """
+
+    def __init__(self, retention: float = 3600, archive_folder: str = None):
+        self.retention = retention
+        self.archive_folder = archive_folder
+        self.orders: Dict[str, OrderData] = {}
+        self.trades: Dict[str, TradeData] = {}
+        self.active_by_symbol: Dict[str, Set[str]] = defaultdict(set)
+        self.active_by_reference: Dict[str, Set[str]] = defaultdict(set)
+        self.by_status: Dict[Status, Set[str]] = defaultdict(set)
+        # orderid -> 建索引时的(status, vt_symbol, reference)
+        self._indexed: Dict[str, Tuple] = {}
+        self._trades_by_order: Dict[str, List[str]] = defaultdict(list)
+        # (进入终态的时间, orderid)
+        self._terminal: deque = deque()
+        self._lock = Lock()
+
+    def __setitem__(self, orderid: str, order: OrderData):
+        with self._lock:
+            self.orders[orderid] = order
+            self._index(orderid, order)
+
+    def __getitem__(self, orderid: str) -> OrderData:
+        return self.orders[orderid]
+
+    def __contains__(self, orderid: str) -> bool:
+        return orderid in self.orders
+
+    def __len__(self):
+        return len(self.orders)
+
+    def get(self, orderid: str, default=None) -> OrderData:
+        return self.orders.get(orderid, default)
+
+    def values(self):
+        return list(self.orders.values())
+
+    def refresh(self, order: OrderData):
+        with self._lock:
+            if self.orders.get(order.orderid) is order:
+                self._index(order.orderid, order)
+
+    def _index(self, orderid: str, order: OrderData):
+        key = (order.status, order.vt_symbol, order.reference)
+        old = self._indexed.get(orderid)
+        if old == key:
+            return
+        if old is not None:
+            old_status, old_symbol, old_reference = old
+            self.by_status[old_status].discard(orderid)
+            if old_status in ACTIVE_STATUSES:
+                self.active_by_symbol[old_symbol].discard(orderid)
+                self.active_by_reference[old_reference].discard(orderid)
+        self._indexed[orderid] = key
+        self.by_status[order.status].add(orderid)
+        if order.status in ACTIVE_STATUSES:
+            self.active_by_symbol[order.vt_symbol].add(orderid)
+            self.active_by_reference[order.reference].add(orderid)
+        elif old is None or old[0] in ACTIVE_STATUSES:
+            self._terminal.append((time.monotonic(), orderid))
+
+    def add_trade(self, trade: TradeData):
+        with self._lock:
+            self.trades[trade.tradeid] = trade
+            self._trades_by_order[trade.orderid].append(trade.tradeid)
+
+    def get_active_orders(self, vt_symbol: str = None, reference: str = None) -> List[OrderData]:
+        with self._lock:
+            if vt_symbol is not None:
+                orderids = self.active_by_symbol.get(vt_symbol, ())
+                if reference is not None:
+                    orderids = [i for i in orderids if i in self.active_by_reference.get(reference, ())]
+            elif reference is not None:
+                orderids = self.active_by_reference.get(reference, ())
+            else:
+                orderids = [i for s in ACTIVE_STATUSES for i in self.by_status.get(s, ())]
+            return [self.orders[i] for i in orderids]
+
+    def get_orders_by_status(self, status: Status) -> List[OrderData]:
+        with self._lock:
+            return [self.orders[i] for i in self.by_status.get(status, ())]
+
+    def expire(self) -> List[OrderData]:
+        """
+        移除终态超过保留时间的委托及其成交, 返回被移除的委托
+        """
+        deadline = time.monotonic() - self.retention
+        expired = []
+        with self._lock:
+            while self._terminal and self._terminal[0][0] <= deadline:
+                _, orderid = self._terminal.popleft()
+                order = self.orders.get(orderid)
+                if order is None or order.status in ACTIVE_STATUSES:
+                    continue
+                del self.orders[orderid]
+                status, _, _ = self._indexed.pop(orderid)
+                self.by_status[status].discard(orderid)
+                for tradeid in self._trades_by_order.pop(orderid, ()):
+                    self.trades.pop(tradeid, None)
+                expired.append(order)
+        if expired and self.archive_folder:
+            self.archive(expired)
+        return expired
+
+    def archive(self, orders: List[OrderData]):
+        date = datetime.date.today().strftime('%Y%m%d')
+        path = os.path.join(self.archive_folder, f'qmt_orders_{date}.csv')
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            for order in orders:
+                writer.writerow([
+                    order.orderid, order.vt_symbol, getattr(order.direction, 'value', ''),
+                    getattr(order.type, 'value', ''), order.price, order.volume, order.traded,
+                    getattr(order.status, 'value', ''),
+                    order.datetime, order.reference
+                ])
@@ -12,7 +12,7 @@ from vnpy.trader.event import (
     EVENT_TICK, EVENT_UNIMPORTANT_TICK
 )
 from vnpy.trader.constant import (
-    Product, Direction, OrderType, Exchange
+    Product, Direction, OrderType, Exchange, Interval
 
 )
 from vnpy.trader.gateway import BaseGateway
@@ -21,18 +21,41 @@ from vnpy.trader.object import (
     CancelRequest,
     SubscribeRequest,
     ContractData,
-    BasketComponent
+    BasketComponent,
+    BarData,
+    HistoryRequest
 )
 
 from vnpy_qmt.md import MD
 from vnpy_qmt.td import TD
+from vnpy_qmt.utils import to_qmt_code
+from vnpy_qmt.basket import BasketProgress, EVENT_BASKET_PROGRESS
+from vnpy_qmt.latency import LatencyRecorder
+from vnpy_qmt.iopv import EtfIopv, EVENT_ETF_IOPV
+from vnpy_qmt.bar import EVENT_BAR
+from vnpy_qmt.history import HistoryBars, PERIOD_MAP
 
 
 class QmtGateway(BaseGateway):
 
     default_setting: Dict[str, str] = {
         "交易账号": "",
-        "mini路径": ""
+        "mini路径": "",
+        "全推行情": ["否", "是"],
+        "行情合并(毫秒)": 0,
+        "tick缓存条数": 0,
+        "共享内存行情": "",
+        "对账间隔(秒)": 60,
+        "委托保留(秒)": 3600,
+        "单笔最大金额": 0,
+        "单标的每秒委托": 0,
+        "每秒委托总数": 0,
+        "每秒限速": 0,
+        "单标的每秒限速": 0,
+        "延迟日志间隔(秒)": 60,
+        "ETF净值推送(毫秒)": 0,
+        "记录tick": ["否", "是"],
+        "K线周期(分钟)": ""
     }
 
     TRADE_TYPE = (Product.ETF, Product.EQUITY, Product.BOND, Product.INDEX)
@@ -41,56 +64,90 @@ class QmtGateway(BaseGateway):
     def __init__(self, event_engine: EventEngine, gateway_name: str = 'QMT'):
         super(QmtGateway, self).__init__(event_engine, gateway_name)
         self.contracts: Dict[str, ContractData] = {}
+        self.latency = LatencyRecorder()
+        self.latency_log_interval = 60
+        self.latency_log_count = 0
         self.md = MD(self)
         self.td = TD(self)
         self.components: Dict[str, List[BasketComponent]] = defaultdict(list)
-        self.count = -1
+        # 篮子下单用的成分腿: (symbol, exchange, qmt代码, 份额), 只含与ETF同市场且份额大于0的
+        self.basket_legs: Dict[str, List[tuple]] = {}
+        self.basket_count = 0
         self.event_engine.register(EVENT_TIMER, self.process_timer_event)
 
 
     def connect(self, setting: dict) -> None:
+        self.latency_log_interval = int(setting.get('延迟日志间隔(秒)', 60))
         self.md.connect(setting)
         self.td.connect(setting)
 
     def close(self) -> None:
-        pass
+        self.md.close()
+        self.td.close()
 
     def subscribe(self, req: SubscribeRequest) -> None:
         return self.md.subscribe(req)
 
+    def unsubscribe(self, req: SubscribeRequest) -> None:
+        return self.md.unsubscribe(req)
+
     def send_order(self, req: OrderRequest) -> str:
         return self.td.send_order(req)
 
     def send_basket_order(self, req: OrderRequest):
-
-        order_list = []
         if req.direction == Direction.BUY_BASKET:
             direction = Direction.LONG
         else:
             direction = Direction.SHORT
-        comp_list = self.components.get(req.vt_symbol)
-        if comp_list is None:
+        legs = self.basket_legs.get(req.vt_symbol)
+        if legs is None:
             self.write_log(f'找不到 {req.vt_symbol} 对应的篮子')
-            return (None, None)
-        for comp in comp_list:
-            vol = int(comp.share * req.volume)
-            if vol <= 0:
-                # 份额有等于0的情况
-                continue
-            if comp.exchange != req.exchange:
-                # 篮子只下与ETF同市场的
-                continue
-            rq = OrderRequest(
-                symbol=comp.symbol,
-                direction=direction,
-                type=OrderType.BestOrLimit,
-                volume=vol,
-                offset=req.offset,
-                reference=req.reference,
-                exchange=comp.exchange
-            )
-            order_list.append(self.td.send_order)
-        return order_list
+            return []
+        self.basket_count += 1
+        basket_id = f'{req.vt_symbol}.{self.basket_count}'
+        return self.td.send_basket_order(
+            basket_id, req.vt_symbol, legs, req.volume, direction, OrderType.BestOrLimit, req.reference
+        )
+
+    def on_basket_progress(self, progress: BasketProgress):
+        self.event_engine.put(Event(EVENT_BASKET_PROGRESS, progress))
+        self.event_engine.put(Event(EVENT_BASKET_PROGRESS + progress.basket_id, progress))
+
+    def get_basket_progress(self, basket_id: str) -> BasketProgress:
+        return self.td.basket_tracker.baskets.get(basket_id)
+
+    def on_iopv(self, results: List[EtfIopv]):
+        for iopv in results:
+            self.event_engine.put(Event(EVENT_ETF_IOPV, iopv))
+            self.event_engine.put(Event(EVENT_ETF_IOPV + iopv.vt_symbol, iopv))
+
+    def on_bars(self, window: int, bars: List[BarData]):
+        event_type = f'{EVENT_BAR}{window}.'
+        for bar in bars:
+            self.event_engine.put(Event(event_type, bar))
+            self.event_engine.put(Event(event_type + bar.vt_symbol, bar))
+
+    def get_iopv(self, vt_symbol: str) -> EtfIopv:
+        """
+        ETF最新参考净值和溢价率, 未开启ETF净值推送时返回None
+        """
+        if self.md.iopv is None:
+            return None
+        return self.md.iopv.get_iopv(vt_symbol)
+
+    def get_tick_window(self, vt_symbol: str, n: int = None):
+        """
+        最近n条tick的numpy视图, 未开启tick缓存或无数据时返回None
+        """
+        if self.md.tick_buffers is None:
+            return None
+        return self.md.tick_buffers.last(vt_symbol, n)
+
+    def get_active_orders(self, vt_symbol: str = None, reference: str = None):
+        return self.td.get_active_orders(vt_symbol, reference)
+
+    def get_order_queue_stats(self) -> dict:
+        return self.td.get_order_queue_stats()
 
     def cancel_order(self, req: CancelRequest) -> None:
         return self.td.cancel_order(req.orderid)
@@ -107,30 +164,101 @@ class QmtGateway(BaseGateway):
     def query_trade(self):
         self.td.query_trade()
 
+    def query_history(self, req: HistoryRequest) -> HistoryBars:
+        """
+        返回的HistoryBars按需读取本地缓存, 可当作BarData列表使用
+        """
+        result = self.load_history([req.vt_symbol], req.interval, req.start, req.end)
+        return result.get(req.vt_symbol, [])
+
+    def load_history(self, vt_symbols: List[str], interval: Interval, start, end=None) -> Dict[str, HistoryBars]:
+        """
+        批量加载多个标的的历史K线, 只下载本地缓存缺失的日期区间
+        """
+        period = PERIOD_MAP.get(interval)
+        if period is None or self.md.history is None:
+            self.write_log(f'不支持的K线周期 {interval} 或尚未连接')
+            return {}
+        codes = {}
+        for vt_symbol in vt_symbols:
+            symbol, exchange = vt_symbol.rsplit('.', 1)
+            codes[to_qmt_code(symbol, Exchange(exchange))] = vt_symbol
+        result = self.md.history.load(list(codes), period, start, end)
+        return {codes[code]: bars for code, bars in result.items()}
+
     def on_contract(self, contract):
         self.contracts[contract.vt_symbol] = contract
         super(QmtGateway, self).on_contract(contract)
 
+    def on_contracts(self, contracts: List[ContractData]):
+        """
+        批量推送合约, 先整体更新本地合约表, 使get_contract立即可用
+        """
+        self.contracts.update((c.vt_symbol, c) for c in contracts)
+        for contract in contracts:
+            super(QmtGateway, self).on_contract(contract)
+
     def on_basket_component(self, comp: BasketComponent):
         self.components[comp.basket_name].append(comp)
+        legs = self.basket_legs.setdefault(comp.basket_name, [])
+        # 份额有等于0的情况, 篮子只下与ETF同市场的
+        if comp.share > 0 and comp.basket_name.endswith(f'.{comp.exchange.value}'):
+            legs.append((comp.symbol, comp.exchange, to_qmt_code(comp.symbol, comp.exchange), comp.share))
         evt = Event(EVENT_BASKET_COMPONENT, comp)
         self.event_engine.put(evt)
 
+    def clear_basket(self, vt_symbol):
+        self.components.pop(vt_symbol, None)
+        self.basket_legs.pop(vt_symbol, None)
+
     def get_contract(self, vt_symbol):
         return self.contracts.get(vt_symbol)
 
     def process_timer_event(self, event) -> None:
+        if self.md.bars is not None:
+            self.md.bars.flush()
+        if self.md.iopv is not None:
+            self.md.iopv.flush()
         if not self.td.inited:
             return
-        if self.count == -1:
-            self.query_trade()
-        self.count += 1
-        if self.count < 21:
-            return
-        self.query_account()
-        self.query_position()
-        self.query_order()
-        self.count = 0
+        self.td.sync.on_timer()
+        self.td.expire_orders()
+        self.td.expire_latency()
+        if self.latency_log_interval > 0:
+            self.latency_log_count += 1
+            if self.latency_log_count >= self.latency_log_interval:
+                self.latency_log_count = 0
+                self.write_log(f'延迟统计 事件队列{self.event_engine._queue.qsize()} {self.latency.format_stats()}')
+                if self.md.recorder is not None:
+                    self.write_log(f'tick记录 {self.md.recorder.get_stats()}')
+
+    def start_replay(self, date: str, codes: List[str] = None, speed: float = 0):
+        """
+        回放某日记录的tick, speed为1按实际时间, 大于1为倍速, 0为全速
+        """
+        self.md.start_replay(date, codes, speed)
+
+    def stop_replay(self):
+        self.md.stop_replay()
+
+    def get_replay_stats(self) -> dict:
+        if self.md.replayer is None:
+            return None
+        return self.md.replayer.get_stats()
+
+    def get_recorder_stats(self) -> dict:
+        """
+        tick记录的积压、已写入和丢弃条数, 未开启时返回None
+        """
+        if self.md.recorder is None:
+            return None
+        return self.md.recorder.get_stats()
+
+    def get_latency_stats(self) -> dict:
+        """
+        各环节延迟的p50/p99/max, 单位微秒
+        """
+        return self.latency.get_stats()
 
     def write_log(self, msg):
         super(QmtGateway, self).write_log(f"[QMT] {msg}")
@@ -0,0 +1,157 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :rate_limit.py
+@Time      :2023/4/14 16:20
+@Author    :fsksf
+"""
+import time
+import heapq
+import traceback
+from itertools import count
+from threading import Thread, Condition
+from typing import Callable, Dict, List
+
+
+PRIORITY_CANCEL = 0
+PRIORITY_ORDER = 1
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """
+        补充令牌, 返回还需等待多久才有一个令牌
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class OrderRateLimiter:
+    """
+    委托/撤单限速: 账户级和单标的令牌桶, 撤单优先于新委托, 由专门线程按令牌发出.
+    发出时抛出的异常交给on_error(key, error)
+    """
+
+    def __init__(self, account_rate: float, symbol_rate: float = 0, on_error: Callable = None):
+        self._on_error = on_error
+        self.account_bucket = TokenBucket(account_rate)
+        self.symbol_rate = symbol_rate
+        self.symbol_buckets: Dict[str, TokenBucket] = {}
+        # (优先级, 序号, 入队时间, key, vt_symbol, func, args)
+        self._heap: List[tuple] = []
+        self._seq = count()
+        # 仍在队列中的key, 撤掉的从这里删除, 出队时跳过
+        self._pending = set()
+        self._cond = Condition()
+        # 排队等待时间统计(秒)
+        self.sent_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._active = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key, vt_symbol: str, priority: int, func: Callable, *args):
+        with self._cond:
+            heapq.heappush(self._heap, (priority, next(self._seq), time.monotonic(), key, vt_symbol, func, args))
+            self._pending.add(key)
+            self._cond.notify()
+
+    def remove(self, key) -> bool:
+        """
+        从队列中撤掉还没发出的请求, 成功返回True
+        """
+        with self._cond:
+            if key in self._pending:
+                self._pending.discard(key)
+                return True
+            return False
+
+    def get_stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "sent": self.sent_count,
+            "avg_wait": self.wait_total / self.sent_count if self.sent_count else 0,
+            "max_wait": self.wait_max
+        }
+
+    def _symbol_bucket(self, vt_symbol: str) -> TokenBucket:
+        bucket = self.symbol_buckets.get(vt_symbol)
+        if bucket is None:
+            bucket = self.symbol_buckets[vt_symbol] = TokenBucket(self.symbol_rate)
+        return bucket
+
+    def _next(self, now: float):
+        """
+        取出第一个可以发出的请求, 单标的令牌不足的跳过, 返回(请求, 需等待的秒数)
+        """
+        wait = self.account_bucket.wait_time(now)
+        if wait:
+            return None, wait
+        skipped = []
+        item = None
+        wait = 1.0
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            key = candidate[3]
+            if key not in self._pending:
+                continue
+            if self.symbol_rate:
+                symbol_wait = self._symbol_bucket(candidate[4]).wait_time(now)
+                if symbol_wait:
+                    wait = min(wait, symbol_wait)
+                    skipped.append(candidate)
+                    continue
+                self._symbol_bucket(candidate[4]).consume()
+            item = candidate
+            break
+        for candidate in skipped:
+            heapq.heappush(self._heap, candidate)
+        if item is None:
+            return None, wait if skipped else None
+        self.account_bucket.consume()
+        self._pending.discard(item[3])
+        return item, 0
+
+    def _run(self):
+        while self._active:
+            with self._cond:
+                item, wait = self._next(time.monotonic())
+                if item is None:
+                    self._cond.wait(wait)
+                    continue
+            _, _, enqueue_time, _, _, func, args = item
+            waited = time.monotonic() - enqueue_time
+            self.sent_count += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+            try:
+                func(*args)
+            except Exception as e:
+                if self._on_error is None:
+                    traceback.print_exc()
+                else:
+                    self._on_error(item[3], e)
+
+    def close(self):
+        with self._cond:
+            self._active = False
+            self._cond.notify()
+        self._thread.join()
@@ -0,0 +1,242 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :replay.py
+@Time      :2023/4/28 10:40
+@Author    :fsksf
+"""
+import os
+import time
+from threading import Thread
+from typing import Callable, Dict, Iterator, List
+
+import numpy as np
+
+from vnpy_qmt.tick_recorder import (
+    BLOCK_HEADER, BLOCK_MAGIC, FILE_SUFFIX, RECORD_DTYPE, decode_block, list_codes
+)
+
+
+def iter_blocks(path: str) -> Iterator[np.ndarray]:
+    """
+    逐块读取记录文件, 不一次载入整天的数据
+    """
+    size = BLOCK_HEADER.size
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(size)
+            if len(header) < size:
+                return
+            magic, n, length = BLOCK_HEADER.unpack(header)
+            payload = f.read(length)
+            if magic != BLOCK_MAGIC or len(payload) < length:
+                return
+            yield decode_block(n, payload)
+
+
+class _Cursor:
+
+    def __init__(self, blocks: Iterator[np.ndarray]):
+        self.blocks = blocks
+        self.rows = np.zeros(0, dtype=RECORD_DTYPE)
+        self.pos = 0
+        self.load()
+
+    def load(self) -> bool:
+        for rows in self.blocks:
+            if len(rows):
+                self.rows = rows
+                self.pos = 0
+                return True
+        self.rows = None
+        return False
+
+    @property
+    def next_time(self):
+        return self.rows['time'][self.pos]
+
+    def take(self, end: int) -> List[np.ndarray]:
+        """
+        取出时间小于end的记录
+        """
+        taken = []
+        while self.rows is not None:
+            stop = self.pos + int(np.searchsorted(self.rows['time'][self.pos:], end))
+            if stop > self.pos:
+                taken.append(self.rows[self.pos:stop])
+            if stop < len(self.rows):
+                self.pos = stop
+                break
+            self.load()
+        return taken
+
+
+class TickReplayer:
+    """
+    回放TickRecorder记录的tick, 按xtquant推送的{qmt代码: [tick, ...]}格式调用on_tick.
+
+    各代码的文件逐块读取, 每次合并slice_ms毫秒内的数据按时间排序, 再按batch_ms切成批.
+    speed为1按实际时间回放, 大于1按倍速, 0为不等待全速回放; 超过max_gap秒的间隔(如午休)会被跳过.
+    """
+
+    def __init__(self, on_tick: Callable, folder: str, date: str, codes: List[str] = None,
+                 speed: float = 0, batch_ms: int = 1000, slice_ms: int = 60000, max_gap: float = 60,
+                 on_finish: Callable = None):
+        self.on_tick = on_tick
+        self.on_finish = on_finish
+        self.folder = folder
+        self.date = date
+        self.codes = codes or list_codes(folder, date)
+        self.speed = speed
+        self.batch_ms = batch_ms
+        self.slice_ms = slice_ms
+        self.max_gap = max_gap
+        self.tick_count = 0
+        self.batch_count = 0
+        self.elapsed = 0.0
+        self._active = False
+        self._thread: Thread = None
+
+    def start(self):
+        self._active = True
+        self._thread = Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._active = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def get_stats(self) -> dict:
+        return {
+            "ticks": self.tick_count,
+            "batches": self.batch_count,
+            "elapsed": self.elapsed,
+            "ticks_per_second": self.tick_count / self.elapsed if self.elapsed else 0
+        }
+
+    def run(self):
+        self._active = True
+        start = time.perf_counter()
+        cursors: Dict[int, _Cursor] = {}
+        for i, code in enumerate(self.codes):
+            path = os.path.join(self.folder, self.date, code + FILE_SUFFIX)
+            if os.path.exists(path):
+                cursor = _Cursor(iter_blocks(path))
+                if cursor.rows is not None:
+                    cursors[i] = cursor
+        # 回放时间轴: 跳过长间隔后的行情时间(毫秒)与开始回放时的墙钟时间
+        clock = None
+        while cursors and self._active:
+            begin = min(cursor.next_time for cursor in cursors.values())
+            end = begin + self.slice_ms
+            parts = []
+            ids = []
+            for i, cursor in list(cursors.items()):
+                for rows in cursor.take(end):
+                    parts.append(rows)
+                    ids.append(np.full(len(rows), i, dtype=np.int32))
+                if cursor.rows is None:
+                    del cursors[i]
+            rows = np.concatenate(parts)
+            ids = np.concatenate(ids)
+            order = np.argsort(rows['time'], kind='stable')
+            clock = self._replay_slice(rows[order], ids[order], clock)
+        self.elapsed = time.perf_counter() - start
+        self._active = False
+        if self.on_finish is not None:
+            self.on_finish(self.get_stats())
+
+    def _replay_slice(self, rows: np.ndarray, ids: np.ndarray, clock):
+        codes = self.codes
+        times = rows['time'].tolist()
+        columns = {
+            'time': times,
+            'lastPrice': rows['last_price'].tolist(),
+            'open': rows['open'].tolist(),
+            'high': rows['high'].tolist(),
+            'low': rows['low'].tolist(),
+            'lastClose': rows['pre_close'].tolist(),
+            'volume': rows['volume'].tolist(),
+            'amount': rows['amount'].tolist(),
+            'askPrice': rows['ask_price'].tolist(),
+            'askVol': rows['ask_volume'].tolist(),
+            'bidPrice': rows['bid_price'].tolist(),
+            'bidVol': rows['bid_volume'].tolist(),
+        }
+        keys = list(columns)
+        values = list(zip(*columns.values()))
+        ids = ids.tolist()
+        batch_ms = self.batch_ms or 1
+        keys_of = np.asarray(rows['time']) // batch_ms
+        bounds = np.flatnonzero(np.diff(keys_of)) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(rows)]
+        for a, b in zip(starts, ends):
+            if not self._active:
+                break
+            if self.speed > 0:
+                clock = self._wait(times[a], clock)
+            datas = {}
+            for k in range(a, b):
+                code = codes[ids[k]]
+                data = dict(zip(keys, values[k]))
+                data_list = datas.get(code)
+                if data_list is None:
+                    datas[code] = [data]
+                else:
+                    data_list.append(data)
+            self.on_tick(datas)
+            self.tick_count += b - a
+            self.batch_count += 1
+        return clock
+
+    def _wait(self, tick_time: int, clock):
+        """
+        clock为(上一批行情时间, 对应的墙钟时间), 按speed等待到这一批的墙钟时间
+        """
+        now = time.perf_counter()
+        if clock is None:
+            return tick_time, now
+        last_time, last_wall = clock
+        gap = (tick_time - last_time) / 1000
+        if gap > self.max_gap:
+            return tick_time, now
+        target = last_wall + gap / self.speed
+        if target > now:
+            time.sleep(target - now)
+        return tick_time, target
+
+
+if __name__ == '__main__':
+    # 先记录再全速回放, 统计每秒回放的tick数
+    import datetime
+    import tempfile
+    from vnpy_qmt.tick_recorder import TickRecorder
+
+    folder = tempfile.mkdtemp()
+    recorder = TickRecorder(folder)
+    recorder.start()
+    now = int(time.time() * 1000)
+    codes = [f'{600000 + i}.SH' for i in range(500)]
+    for k in range(200):
+        recorder.record({
+            code: [{
+                'time': now + k * 3000 + i, 'lastPrice': 10.0, 'volume': 1000 * k, 'amount': 0.0,
+                'open': 9.9, 'high': 10.1, 'low': 9.8, 'lastClose': 9.95,
+                'askPrice': [10.01, 10.02, 10.03, 10.04, 10.05], 'askVol': [1, 2, 3, 4, 5],
+                'bidPrice': [9.99, 9.98, 9.97, 9.96, 9.95], 'bidVol': [1, 2, 3, 4, 5]
+            }]
+            for i, code in enumerate(codes)
+        })
+    recorder.close()
+    received = []
+    replayer = TickReplayer(lambda datas: received.append(len(datas)), folder,
+                            datetime.date.today().strftime('%Y%m%d'))
+    replayer.run()
+    stats = replayer.get_stats()
+    print(f'回放{stats["ticks"]}个tick, {stats["batches"]}批, {stats["ticks_per_second"]:,.0f} ticks/s')
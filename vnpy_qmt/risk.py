@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :risk.py
+@Time      :2023/4/10 9:51
+@Author    :fsksf
+"""
+import time
+from typing import Dict, Optional
+
+from vnpy.trader.constant import Direction, OrderType
+from vnpy.trader.object import ContractData, OrderRequest
+
+from vnpy_qmt.order_store import OrderStore
+
+
+class RiskGate:
+    """
+    下单前的本地风控, 检查不通过时返回原因, 通过返回None.
+    参数为0表示不检查该项.
+    """
+
+    def __init__(self, contracts: Dict[str, ContractData], limit_ups: Dict[str, float],
+                 limit_downs: Dict[str, float], orders: OrderStore):
+        self.contracts = contracts
+        self.limit_ups = limit_ups
+        self.limit_downs = limit_downs
+        self.orders = orders
+        # 单笔最大金额
+        self.max_notional = 0
+        # 单标的每秒委托笔数, 全部委托每秒笔数
+        self.symbol_rate = 0
+        self.total_rate = 0
+        self._second = 0
+        self._total_count = 0
+        self._symbol_counts: Dict[str, int] = {}
+
+    def check(self, req: OrderRequest) -> Optional[str]:
+        vt_symbol = req.vt_symbol
+        contract = self.contracts.get(vt_symbol)
+        if contract is None:
+            return '找不到合约'
+        price = req.price
+        volume = req.volume
+        if volume <= 0:
+            return f'委托数量{volume}不合法'
+        # 整手单位按品种: 股票、基金100, 债券10
+        if req.direction == Direction.LONG and contract.min_volume and volume % contract.min_volume:
+            return f'买入数量{volume}不是{contract.min_volume}的整数倍'
+
+        if req.type == OrderType.LIMIT:
+            limit_up = self.limit_ups.get(vt_symbol)
+            if limit_up and price > limit_up + 1e-6:
+                return f'价格{price}高于涨停价{limit_up}'
+            limit_down = self.limit_downs.get(vt_symbol)
+            if limit_down and price < limit_down - 1e-6:
+                return f'价格{price}低于跌停价{limit_down}'
+            pricetick = contract.pricetick
+            if pricetick:
+                n = price / pricetick
+                if abs(n - round(n)) > 1e-6:
+                    return f'价格{price}不是最小变动价位{pricetick}的整数倍'
+            if self.max_notional and price * volume > self.max_notional:
+                return f'委托金额{price * volume:.2f}超过上限{self.max_notional}'
+            if self.is_self_trade(req):
+                return '与本账户未成交的反向委托可能自成交'
+
+        second = int(time.monotonic())
+        if second != self._second:
+            self._second = second
+            self._total_count = 0
+            self._symbol_counts.clear()
+        if self.total_rate and self._total_count >= self.total_rate:
+            return f'每秒委托超过{self.total_rate}笔'
+        count = self._symbol_counts.get(vt_symbol, 0)
+        if self.symbol_rate and count >= self.symbol_rate:
+            return f'{vt_symbol}每秒委托超过{self.symbol_rate}笔'
+        self._total_count += 1
+        self._symbol_counts[vt_symbol] = count + 1
+        return None
+
+    def is_self_trade(self, req: OrderRequest) -> bool:
+        # 只遍历该标的的活动委托
+        for order in self.orders.get_active_orders(req.vt_symbol):
+            if req.direction == Direction.LONG:
+                if order.direction == Direction.SHORT and order.price <= req.price:
+                    return True
+            elif req.direction == Direction.SHORT:
+                if order.direction == Direction.LONG and order.price >= req.price:
+                    return True
+        return False
+
+
+if __name__ == '__main__':
+    # 风控检查耗时的微基准
+    from vnpy.trader.constant import Exchange, Product
+
+    contract = ContractData(gateway_name='QMT', symbol='600000', exchange=Exchange.SSE, name='',
+                            product=Product.EQUITY, size=100, pricetick=0.01, min_volume=100)
+    gate = RiskGate({contract.vt_symbol: contract}, {contract.vt_symbol: 11.0},
+                    {contract.vt_symbol: 9.0}, OrderStore())
+    gate.max_notional = 1e7
+    req = OrderRequest(symbol='600000', exchange=Exchange.SSE, direction=Direction.LONG,
+                       type=OrderType.LIMIT, volume=1000, price=10.01)
+    n = 100000
+    t = time.perf_counter()
+    for _ in range(n):
+        gate.check(req)
+    print(f'每笔风控检查耗时 {(time.perf_counter() - t) / n * 1e6:.2f}us')
@@ -0,0 +1,200 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :shm.py
+@Time      :2023/3/16 9:38
+@Author    :fsksf
+"""
+import os
+import time
+import datetime
+from multiprocessing import shared_memory
+from typing import Iterator
+
+import numpy as np
+from vnpy.trader.constant import Exchange
+from vnpy.trader.object import TickData
+
+
+SHM_TICK_DTYPE = np.dtype([
+    ('vt_symbol', 'S24'),
+    ('time', 'f8'),
+    ('last_price', 'f8'),
+    ('volume', 'f8'),
+    ('open_price', 'f8'),
+    ('high_price', 'f8'),
+    ('low_price', 'f8'),
+    ('pre_close', 'f8'),
+    ('limit_up', 'f8'),
+    ('limit_down', 'f8'),
+    ('bid_price', 'f8', (5,)),
+    ('bid_volume', 'f8', (5,)),
+    ('ask_price', 'f8', (5,)),
+    ('ask_volume', 'f8', (5,)),
+])
+# 头部: 已写入条数, 容量, 单条字节数
+HEADER_SIZE = 64
+
+
+class SharedTickWriter:
+    """
+    把转换好的tick写进共享内存环形队列, 只允许一个写进程
+    """
+
+    def __init__(self, name: str, capacity: int = 65536):
+        size = HEADER_SIZE + capacity * SHM_TICK_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 上次异常退出残留的同名共享内存
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.capacity = capacity
+        self.header = np.ndarray((3,), dtype='i8', buffer=self.shm.buf)
+        self.header[:] = (0, capacity, SHM_TICK_DTYPE.itemsize)
+        self.records = np.ndarray((capacity,), dtype=SHM_TICK_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self._count = 0
+
+    def write(self, tick: TickData):
+        self.records[self._count % self.capacity] = (
+            tick.vt_symbol.encode(), tick.datetime.timestamp(), tick.last_price, tick.volume,
+            tick.open_price, tick.high_price, tick.low_price, tick.pre_close,
+            tick.limit_up or 0, tick.limit_down or 0,
+            (tick.bid_price_1, tick.bid_price_2, tick.bid_price_3, tick.bid_price_4, tick.bid_price_5),
+            (tick.bid_volume_1, tick.bid_volume_2, tick.bid_volume_3, tick.bid_volume_4, tick.bid_volume_5),
+            (tick.ask_price_1, tick.ask_price_2, tick.ask_price_3, tick.ask_price_4, tick.ask_price_5),
+            (tick.ask_volume_1, tick.ask_volume_2, tick.ask_volume_3, tick.ask_volume_4, tick.ask_volume_5),
+        )
+        # 先写数据再更新计数, 读端以计数为准
+        self._count += 1
+        self.header[0] = self._count
+
+    def close(self):
+        del self.header, self.records
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedTickReader:
+    """
+    在其它进程中挂载共享内存读取tick, 不经过xtquant也不做序列化
+    """
+
+    def __init__(self, name: str, gateway_name: str = 'QMT'):
+        self.shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # 读端退出时不应删除写端创建的共享内存
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.gateway_name = gateway_name
+        self.header = np.ndarray((3,), dtype='i8', buffer=self.shm.buf)
+        self.capacity = int(self.header[1])
+        if int(self.header[2]) != SHM_TICK_DTYPE.itemsize:
+            raise ValueError('共享内存tick格式与当前版本不一致')
+        self.records = np.ndarray((self.capacity,), dtype=SHM_TICK_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+        # 从当前位置开始读
+        self.cursor = int(self.header[0])
+        # 读得太慢被覆盖掉的条数
+        self.lost = 0
+
+    def read(self) -> np.ndarray:
+        """
+        返回上次读取之后的新记录(拷贝).
+        计数为count时写端可能正在写第count条, 它所在的槽位是第count - capacity条,
+        所以只有[count - capacity + 1, count)是完整的
+        """
+        count = int(self.header[0])
+        oldest = count - self.capacity + 1
+        if self.cursor < oldest:
+            self.lost += oldest - self.cursor
+            self.cursor = oldest
+        if count == self.cursor:
+            return self.records[:0].copy()
+        start = self.cursor % self.capacity
+        end = count % self.capacity
+        if start < end:
+            data = self.records[start:end].copy()
+        else:
+            data = np.concatenate((self.records[start:], self.records[:end]))
+        # 拷贝期间被写端覆盖或正在覆盖的记录丢弃
+        overwritten = int(self.header[0]) - self.capacity + 1 - self.cursor
+        if overwritten > 0:
+            overwritten = min(overwritten, len(data))
+            data = data[overwritten:]
+            self.lost += overwritten
+        self.cursor = count
+        return data
+
+    def to_tick(self, record) -> TickData:
+        symbol, exchange = record['vt_symbol'].decode().rsplit('.', 1)
+        bid_price, bid_volume = record['bid_price'], record['bid_volume']
+        ask_price, ask_volume = record['ask_price'], record['ask_volume']
+        return TickData(
+            gateway_name=self.gateway_name,
+            symbol=symbol,
+            exchange=Exchange(exchange),
+            datetime=datetime.datetime.fromtimestamp(record['time']),
+            last_price=record['last_price'],
+            volume=record['volume'],
+            open_price=record['open_price'],
+            high_price=record['high_price'],
+            low_price=record['low_price'],
+            pre_close=record['pre_close'],
+            limit_up=record['limit_up'],
+            limit_down=record['limit_down'],
+            bid_price_1=bid_price[0], bid_price_2=bid_price[1], bid_price_3=bid_price[2],
+            bid_price_4=bid_price[3], bid_price_5=bid_price[4],
+            bid_volume_1=bid_volume[0], bid_volume_2=bid_volume[1], bid_volume_3=bid_volume[2],
+            bid_volume_4=bid_volume[3], bid_volume_5=bid_volume[4],
+            ask_price_1=ask_price[0], ask_price_2=ask_price[1], ask_price_3=ask_price[2],
+            ask_price_4=ask_price[3], ask_price_5=ask_price[4],
+            ask_volume_1=ask_volume[0], ask_volume_2=ask_volume[1], ask_volume_3=ask_volume[2],
+            ask_volume_4=ask_volume[3], ask_volume_5=ask_volume[4],
+        )
+
+    def ticks(self, interval: float = 0.001) -> Iterator[TickData]:
+        """
+        持续读取并转换成TickData
+        """
+        while True:
+            data = self.read()
+            if not len(data):
+                time.sleep(interval)
+                continue
+            for record in data:
+                yield self.to_tick(record)
+
+    def close(self):
+        del self.header, self.records
+        self.shm.close()
+
+
+def _demo_read(name, n):
+    reader = SharedTickReader(name)
+    reader.cursor = 0
+    got = 0
+    while got + reader.lost < n:
+        got += len(reader.read())
+    print(f'读到 {got} 条, 丢失 {reader.lost} 条')
+    reader.close()
+
+
+if __name__ == '__main__':
+    # 用假行情源在本机验证: 主进程写, 另起一个独立进程读
+    import sys
+    import subprocess
+
+    writer = SharedTickWriter('vnpy_qmt_demo', capacity=1 << 16)
+    n = 100000
+    p = subprocess.Popen([sys.executable, '-c', f'from vnpy_qmt.shm import _demo_read; _demo_read("vnpy_qmt_demo", {n})'])
+    time.sleep(1)
+    tick = TickData(gateway_name='QMT', symbol='600000', exchange=Exchange.SSE,
+                    datetime=datetime.datetime.now(), last_price=10.0)
+    t = time.perf_counter()
+    for i in range(n):
+        tick.volume = i
+        writer.write(tick)
+    print(f'写入耗时 {(time.perf_counter() - t) / n * 1e6:.2f}us/条')
+    p.wait()
+    writer.close()
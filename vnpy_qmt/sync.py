@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :sync.py
+@Time      :2023/3/27 15:12
+@Author    :fsksf
+"""
+import time
+from typing import Callable, Dict
+
+
+class SyncTask:
+
+    def __init__(self, name: str, func: Callable, interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        # 0表示启动后立即查询一次
+        self.next_run = 0.0
+
+
+class SyncScheduler:
+    """
+    账户、持仓、委托、成交以主推为准, 快照查询只用来对账.
+    对账发现差异说明主推有遗漏, 缩短间隔; 没有差异则逐步放宽到上限.
+    差异只算主推维护的状态(数量、可用、冻结、现金、委托状态和成交), 市值、总资产等随行情变化的字段不算.
+    """
+
+    def __init__(self, interval: float = 60, min_interval: float = 5, max_interval: float = 240):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tasks: Dict[str, SyncTask] = {}
+
+    def set_interval(self, interval: float):
+        self.interval = interval
+        self.max_interval = interval * 4
+        for task in self.tasks.values():
+            task.interval = interval
+
+    def add_task(self, name: str, func: Callable, interval: float = None):
+        self.tasks[name] = SyncTask(name, func, interval or self.interval)
+
+    def on_timer(self):
+        now = time.monotonic()
+        for task in self.tasks.values():
+            if now < task.next_run:
+                continue
+            task.next_run = now + task.interval
+            task.func()
+
+    def on_result(self, name: str, diffs: int):
+        """
+        快照回报处理完后调用, diffs为快照中主推维护的状态与本地不一致的条数
+        """
+        task = self.tasks.get(name)
+        if task is None:
+            return
+        if diffs:
+            task.interval = max(self.min_interval, task.interval / 2)
+        else:
+            task.interval = min(self.max_interval, task.interval * 2)
+        task.next_run = time.monotonic() + task.interval
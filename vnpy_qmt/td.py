@@ -5,19 +5,28 @@
 @Author    :fsksf
 """
 import os
+import time
 import random
+from threading import RLock
+from collections import defaultdict
 from typing import Dict
-import dbf
 import datetime
 import xtquant.xttrader
+from xtquant import xtconstant
 from watchdog.observers import Observer
-from vnpy_qmt.file_handler import ResultFileHandler, TaskStatus_Status_Map
+from vnpy_qmt.file_handler import ResultFileHandler, DbfCheckpoint, DbfOrderWriter, TaskStatus_Status_Map
+from vnpy_qmt.basket import BasketTracker
+from vnpy_qmt.sync import SyncScheduler
+from vnpy_qmt.order_store import OrderStore
+from vnpy_qmt.risk import RiskGate
+from vnpy_qmt.rate_limit import OrderRateLimiter, PRIORITY_ORDER, PRIORITY_CANCEL
 from xtquant.xttrader import XtQuantTraderCallback, XtQuantTrader
 from xtquant.xttype import (
     XtTrade, XtAsset, XtOrder, XtOrderError, XtCreditOrder, XtOrderResponse,
     XtPosition, XtCreditDeal, XtCancelError, XtCancelOrderResponse, StockAccount
 )
-from vnpy.trader.constant import Direction, Status, Product
+from vnpy.trader.constant import Direction, Status, Product, Exchange, OrderType
+from vnpy.trader.utility import get_folder_path
 from vnpy.trader.object import (
     AccountData, TradeData, OrderData, OrderRequest, PositionData
 )
@@ -28,6 +37,9 @@ from vnpy_qmt.utils import (to_vn_product, to_vn_contract, to_qmt_code,
 
 class TD(XtQuantTraderCallback):
 
+    # 超过这么多秒仍没有回报或主推的延迟统计项丢弃
+    LATENCY_TIMEOUT = 60
+
     def __init__(self, gateway, *args, **kwargs):
         super(TD, self).__init__(*args, **kwargs)
         self.gateway = gateway
@@ -38,11 +50,38 @@ class TD(XtQuantTraderCallback):
         self.mini_path = None
         self.dbf_dir = None
         self.inited = False
-        self.orders: Dict[str, OrderData] = {}
-        self.traders: Dict[str, TradeData] = {}
+        self.orders = OrderStore()
+        self.traders: Dict[str, TradeData] = self.orders.trades
+        # 当日已归档委托的qmt委托号, 对账快照只含当日委托, 换日时清空
+        self._archived_ids = set()
+        self._archived_date = datetime.date.today()
         self.orderid_vnoid_map = {}
         self.vnoid_orderid_map = {}
         self.dbf_monitor = Observer()
+        # 最近一次篮子下单首笔和末笔委托发出的耗时(秒)
+        self.basket_timing = None
+        self.leg_count = 0
+        self.basket_tracker = BasketTracker(self.gateway.on_basket_progress)
+        self.dbf_writer: DbfOrderWriter = None
+        self.positions: Dict[str, PositionData] = {}
+        self.account_data: AccountData = None
+        # 快照变化检测用的指纹, 指纹不变时不构造对象也不推送.
+        # 资金和持仓的指纹为(主推维护的字段, 随行情变化的字段), 只有前者变化才算对账差异
+        self._order_fps: Dict[int, tuple] = {}
+        self._position_fps: Dict[str, tuple] = {}
+        self._asset_fp: tuple = None
+        self.sync = SyncScheduler()
+        self.risk = RiskGate(gateway.contracts, gateway.md.limit_ups, gateway.md.limit_downs, self.orders)
+        self.risk_count = 0
+        # 限速排队发出的委托: 本地委托号在发出前分配, 发出后用seq对应回来
+        self.limiter: OrderRateLimiter = None
+        self.queued_count = 0
+        self.seq_orderid: Dict[int, str] = {}
+        # 发出委托和登记seq在同一把锁内完成, 下单回报要先拿到锁, 保证回报到达时已能对应到本地委托
+        self._send_lock = RLock()
+        # 延迟统计: seq -> 发出时间, qmt委托号 -> 发出时间(等待第一次委托主推)
+        self._send_times: Dict[int, float] = {}
+        self._first_push_times: Dict[int, float] = {}
 
     def connect(self, settings: dict):
         account = settings['交易账号']
@@ -66,10 +105,27 @@ class TD(XtQuantTraderCallback):
             self.inited = True
         else:
             self.write_log(f'订阅账户【失败】： {sub_msg}')
-        eh = ResultFileHandler(self._on_dbf_order_callback, self._on_dbf_trade_callback)
+        checkpoint = DbfCheckpoint(str(get_folder_path('qmt')))
+        eh = ResultFileHandler(self._on_dbf_order_callback, self._on_dbf_trade_callback, checkpoint,
+                               latency=self.gateway.latency, write_log=self.write_log)
         self.dbf_monitor.schedule(event_handler=eh, path=self.dbf_dir, recursive=False)
         self.dbf_monitor.start()
         self.write_log('监控dbf文件单目录中...')
+        self.sync.set_interval(float(settings.get('对账间隔(秒)', 60)))
+        self.orders.retention = float(settings.get('委托保留(秒)', 3600))
+        self.orders.archive_folder = str(get_folder_path('qmt'))
+        self.risk.max_notional = float(settings.get('单笔最大金额', 0))
+        self.risk.symbol_rate = int(settings.get('单标的每秒委托', 0))
+        self.risk.total_rate = int(settings.get('每秒委托总数', 0))
+        # 只有普通委托和撤单走限速队列; 篮子下单要求各腿连续发出, 申赎走dbf文件单, 都不受限速
+        account_rate = float(settings.get('每秒限速', 0))
+        if account_rate > 0:
+            self.limiter = OrderRateLimiter(account_rate, float(settings.get('单标的每秒限速', 0)),
+                                            on_error=self._on_queue_error)
+        self.sync.add_task('trade', self.query_trade)
+        self.sync.add_task('account', self.query_account)
+        self.sync.add_task('position', self.query_position)
+        self.sync.add_task('order', self.query_order)
 
     def get_order_remark(self):
         mark = f'{str(self.session_id)}.dbf{self.count}'
@@ -82,32 +138,156 @@ class TD(XtQuantTraderCallback):
     def send_order(self, req: OrderRequest):
         if req.direction in (Direction.PURCHASE, Direction.REDEMPTION):
             return self.PURCHASE_REDEMPTION(req)
-        else:
-            return self.normal_order(req)
+        reason = self.risk.check(req)
+        if reason:
+            return self.reject_order(req, reason)
+        if self.limiter is not None:
+            return self.queue_order(req)
+        return self.normal_order(req)
+
+    def queue_order(self, req: OrderRequest):
+        """
+        委托先进限速队列, 立即返回本地委托号
+        """
+        self.queued_count += 1
+        orderid = f'q{self.queued_count}'
+        order = req.create_order_data(orderid, self.gateway.gateway_name)
+        order.status = Status.SUBMITTING
+        self.orders[orderid] = order
+        self.limiter.submit(orderid, req.vt_symbol, PRIORITY_ORDER, self._send_queued_order, req, orderid)
+        return order.vt_orderid
+
+    def _send_queued_order(self, req: OrderRequest, orderid: str):
+        start = time.perf_counter()
+        with self._send_lock:
+            seq = self.trader.order_stock_async(
+                account=self.account,
+                stock_code=to_qmt_code(symbol=req.symbol, exchange=req.exchange),
+                order_type=From_VN_Trade_Type[req.direction],
+                price_type=from_vn_price_type(req),
+                order_volume=int(req.volume),
+                price=req.price,
+                order_remark='',
+            )
+            self.seq_orderid[seq] = orderid
+            self.on_order_sent(seq, start)
+
+    def _on_queue_error(self, key, error: Exception):
+        """
+        在限速线程中调用: 委托发送失败时拒单, 撤单发送失败只记日志
+        """
+        if isinstance(key, tuple):
+            self.write_log(f'撤单发送失败 {key[1]} {error!r}')
+            return
+        self.write_log(f'【委托发送失败】 {key} {error!r}')
+        order = self.orders.get(key)
+        if order is not None:
+            order.status = Status.REJECTED
+            self.orders.refresh(order)
+            self.gateway.on_order(order)
+
+    def on_order_sent(self, seq, start: float):
+        self.gateway.latency.record('order_send', time.perf_counter() - start)
+        self._send_times[seq] = start
+
+    def reject_order(self, req: OrderRequest, reason: str):
+        """
+        本地风控拒单, 不发往QMT
+        """
+        self.risk_count += 1
+        orderid = f'risk{self.risk_count}'
+        order = req.create_order_data(orderid, self.gateway.gateway_name)
+        order.status = Status.REJECTED
+        self.orders[orderid] = order
+        self.write_log(f'【风控拒单】 {req.vt_symbol} {reason}')
+        self.gateway.on_order(order)
+        return order.vt_orderid
 
     def normal_order(self, req: OrderRequest):
-        seq = self.trader.order_stock_async(
-            account=self.account,
-            stock_code=to_qmt_code(symbol=req.symbol, exchange=req.exchange),
-            order_type=From_VN_Trade_Type[req.direction],
-            price_type=from_vn_price_type(req),
-            order_volume=int(req.volume),
-            price=req.price,
-            order_remark='',
-        )
-        order = OrderData(gateway_name=self.gateway.gateway_name,
-                          symbol=req.symbol,
-                          exchange=req.exchange,
-                          orderid=str(seq),
-                          type=req.type,
-                          direction=req.direction,
-                          offset=req.offset,
-                          volume=req.volume,
-                          price=req.price,
-                          status=Status.SUBMITTING)
-        self.orders[order.orderid] = order
+        start = time.perf_counter()
+        # 本地委托要在回报到达前建立, 否则会把回报后的状态覆盖回SUBMITTING
+        with self._send_lock:
+            seq = self.trader.order_stock_async(
+                account=self.account,
+                stock_code=to_qmt_code(symbol=req.symbol, exchange=req.exchange),
+                order_type=From_VN_Trade_Type[req.direction],
+                price_type=from_vn_price_type(req),
+                order_volume=int(req.volume),
+                price=req.price,
+                order_remark='',
+            )
+            self.on_order_sent(seq, start)
+            order = OrderData(gateway_name=self.gateway.gateway_name,
+                              symbol=req.symbol,
+                              exchange=req.exchange,
+                              orderid=str(seq),
+                              type=req.type,
+                              direction=req.direction,
+                              offset=req.offset,
+                              volume=req.volume,
+                              price=req.price,
+                              reference=req.reference,
+                              status=Status.SUBMITTING)
+            self.orders[order.orderid] = order
         return self.get_vn_orderid(seq)
 
+    def send_basket_order(self, basket_id, vt_symbol, legs, volume, direction, order_type, reference=''):
+        """
+        篮子下单: 先建立所有腿的本地委托和篮子进度, 再连续发出异步委托, 尽量减小各腿之间的时间差.
+        腿的本地委托号在发出前分配, 发出后用seq对应回来, 回报和主推不会被后建立的本地委托覆盖
+        """
+        xt_order_type = From_VN_Trade_Type[direction]
+        if order_type == OrderType.BestOrLimit:
+            price_types = {
+                Exchange.SSE: xtconstant.MARKET_SH_CONVERT_5_LIMIT,
+                Exchange.SZSE: xtconstant.MARKET_SZ_CONVERT_5_CANCEL
+            }
+        else:
+            price_types = defaultdict(lambda: xtconstant.LATEST_PRICE)
+        pending = []
+        vt_orderids = []
+        for symbol, exchange, qmt_code, share in legs:
+            vol = int(share * volume)
+            if vol <= 0:
+                continue
+            self.leg_count += 1
+            orderid = f'b{self.leg_count}'
+            order = OrderData(gateway_name=self.gateway.gateway_name,
+                              symbol=symbol,
+                              exchange=exchange,
+                              orderid=orderid,
+                              type=order_type,
+                              direction=direction,
+                              volume=vol,
+                              price=0,
+                              reference=reference,
+                              status=Status.SUBMITTING)
+            self.orders[orderid] = order
+            pending.append((orderid, qmt_code, vol, price_types[exchange]))
+            vt_orderids.append(order.vt_orderid)
+        self.basket_tracker.add_basket(basket_id, vt_symbol, [p[0] for p in pending], reference)
+
+        order_stock_async = self.trader.order_stock_async
+        account = self.account
+        send_lock = self._send_lock
+        seq_orderid = self.seq_orderid
+        send_times = self._send_times
+        start = time.perf_counter()
+        first = None
+        for orderid, qmt_code, vol, price_type in pending:
+            with send_lock:
+                seq = order_stock_async(account, qmt_code, xt_order_type, vol, price_type, 0, reference, '')
+                seq_orderid[seq] = orderid
+                send_times[seq] = start
+            if first is None:
+                first = time.perf_counter()
+        last = time.perf_counter()
+        if pending:
+            self.basket_timing = (first - start, last - start)
+            self.write_log(f'篮子下单{len(pending)}笔, 首笔{(first - start) * 1000:.3f}ms, '
+                           f'末笔{(last - start) * 1000:.3f}ms')
+        return vt_orderids
+
     def PURCHASE_REDEMPTION(self, req: OrderRequest):
         """
         申赎
@@ -135,23 +315,100 @@ class TD(XtQuantTraderCallback):
                           offset=req.offset,
                           volume=req.volume,
                           price=req.price,
+                          reference=req.reference,
                           status=Status.SUBMITTING)
         self.orders[note] = order
         self.gateway.on_order(order)
-        tb = dbf.Table(os.path.join(self.dbf_dir, "XT_DBF_ORDER.dbf"))
-        with tb.open(mode=dbf.READ_WRITE) as f:
-            f.append(order_)
-        tb.close()
+        if self.dbf_writer is None:
+            self.dbf_writer = DbfOrderWriter(os.path.join(self.dbf_dir, "XT_DBF_ORDER.dbf"), self._on_dbf_write_error)
+        self.dbf_writer.put(order_)
         return f"{self.gateway.gateway_name}.{note}"
 
+    def _on_dbf_write_error(self, record: dict, error: Exception):
+        """
+        在dbf写入线程中调用, 写不进文件的申赎委托直接拒单
+        """
+        if record is None:
+            self.write_log(f'dbf下单文件出错: {error!r}')
+            return
+        self.write_log(f'【申赎委托写入失败】 {record["stock_code"]} {record["note"]} {error!r}')
+        order = self.orders.get(record['note'])
+        if order is not None:
+            order.status = Status.REJECTED
+            self.orders.refresh(order)
+            self.gateway.on_order(order)
+
+    def close(self):
+        if self.limiter is not None:
+            self.limiter.close()
+            stats = self.limiter.get_stats()
+            self.write_log(f'限速队列发出{stats["sent"]}笔, 平均等待{stats["avg_wait"] * 1000:.1f}ms, '
+                           f'最大{stats["max_wait"] * 1000:.1f}ms, 剩余{stats["depth"]}笔')
+        if self.dbf_writer is not None:
+            writer = self.dbf_writer
+            self.dbf_writer = None
+            writer.close()
+            if writer.enqueue_count:
+                self.write_log(f'dbf申赎委托{writer.enqueue_count}笔, 平均入队'
+                               f'{writer.enqueue_total / writer.enqueue_count * 1e6:.1f}us, '
+                               f'最大{writer.enqueue_max * 1e6:.1f}us, 写入失败{writer.failed_count}笔')
+
+    def expire_orders(self):
+        """
+        归档终态超过保留时间的委托, 同时清理委托号映射、指纹和篮子进度
+        """
+        today = datetime.date.today()
+        if today != self._archived_date:
+            self._archived_date = today
+            self._archived_ids.clear()
+        for order in self.orders.expire():
+            self.basket_tracker.discard(order.orderid)
+            xt_order_id = self.vnoid_orderid_map.pop(order.orderid, None)
+            if xt_order_id is None:
+                continue
+            self.orderid_vnoid_map.pop(xt_order_id, None)
+            self._order_fps.pop(xt_order_id, None)
+            self._archived_ids.add(xt_order_id)
+
+    def expire_latency(self):
+        """
+        清理一直没有等到回报或主推的发出时间, 如出错或断线的委托
+        """
+        deadline = time.perf_counter() - self.LATENCY_TIMEOUT
+        for times in (self._send_times, self._first_push_times):
+            for key, sent in list(times.items()):
+                if sent < deadline:
+                    times.pop(key, None)
+
+    def get_active_orders(self, vt_symbol: str = None, reference: str = None):
+        return self.orders.get_active_orders(vt_symbol, reference)
+
     def cancel_order(self, order_id):
+        if self.limiter is not None and self.limiter.remove(order_id):
+            # 还在排队没发出的直接本地撤销
+            order = self.orders.get(order_id)
+            order.status = Status.CANCELLED
+            self.orders.refresh(order)
+            self.gateway.on_order(order)
+            return
         qmt_order_id = self.vnoid_orderid_map.get(order_id)
         if qmt_order_id is None:
             return 
+        if self.limiter is not None:
+            order = self.orders.get(order_id)
+            vt_symbol = order.vt_symbol if order else ''
+            self.limiter.submit(('cancel', order_id), vt_symbol, PRIORITY_CANCEL,
+                                self.trader.cancel_order_stock_async, self.account, qmt_order_id)
+            return
         return self.trader.cancel_order_stock_async(account=self.account, order_id=qmt_order_id)
 
+    def get_order_queue_stats(self) -> dict:
+        if self.limiter is None:
+            return {}
+        return self.limiter.get_stats()
+
     def query_account(self):
-        return self.trader.query_stock_asset_async(self.account, callback=self.on_stock_asset)
+        return self.trader.query_stock_asset_async(self.account, callback=self.on_stock_asset_callback)
 
     def query_position(self):
         return self.trader.query_stock_positions_async(self.account, callback=self.on_stock_positions_callback)
@@ -166,6 +423,14 @@ class TD(XtQuantTraderCallback):
         pass
 
     def on_stock_asset(self, asset: XtAsset):
+        """
+        有变化时推送, 返回现金、冻结资金是否变化; 只有总资产、市值随行情变化时照常推送, 返回False
+        """
+        state = (asset.cash, asset.frozen_cash)
+        fp = (state, (asset.total_asset, asset.market_value))
+        old_fp = self._asset_fp
+        if fp == old_fp:
+            return False
         account = AccountData(
             accountid=asset.account_id,
             frozen=asset.frozen_cash,
@@ -173,23 +438,45 @@ class TD(XtQuantTraderCallback):
             position=asset.market_value,
             gateway_name=self.gateway.gateway_name
         )
+        self.account_data = account
         self.gateway.on_account(account)
+        # 推送成功后才记录指纹, 推送出错时下一次相同的快照会重推
+        self._asset_fp = fp
+        return old_fp is None or old_fp[0] != state
+
+    # 以下为对账快照的回调, 只推送与本地不一致的数据; 只有主推维护的字段不一致才计入差异, 缩短对账间隔
+    def on_stock_asset_callback(self, asset: XtAsset):
+        self.sync.on_result('account', int(self.on_stock_asset(asset)))
 
     def on_stock_order_callback(self, order_list):
+        diffs = 0
         for order in order_list:
-            self.on_stock_order(order)
+            diffs += self.on_stock_order(order)
+        self.sync.on_result('order', diffs)
 
     def on_stock_positions_callback(self, pos_list):
+        diffs = 0
         for pos in pos_list:
-            self.on_stock_position(pos)
+            diffs += self.on_stock_position(pos)
+        self.sync.on_result('position', diffs)
 
     def on_stock_trade_callback(self, trade_list):
+        diffs = 0
         for trade in trade_list:
-            self.on_stock_trade(trade)
+            diffs += self.on_stock_trade(trade)
+        self.sync.on_result('trade', diffs)
 
     def on_stock_order(self, order: XtOrder):
-        symbol, exchange = to_vn_contract(order.stock_code)
+        sent = self._first_push_times.pop(order.order_id, None)
+        if sent is not None:
+            self.gateway.latency.record('order_first_push', time.perf_counter() - sent)
+        if order.order_id in self._archived_ids:
+            return False
         vnpy_oid = self.orderid_vnoid_map.get(order.order_id)
+        fp = (vnpy_oid, order.order_status, order.traded_volume, order.order_volume, order.price)
+        if self._order_fps.get(order.order_id) == fp:
+            return False
+        symbol, exchange = to_vn_contract(order.stock_code)
         order_ = OrderData(
             orderid=vnpy_oid,
             symbol=symbol,
@@ -203,13 +490,16 @@ class TD(XtQuantTraderCallback):
             datetime=timestamp_to_datetime(order.order_time)
 
         )
-        old_order = self.orders.get(order_.orderid, None)
-        if old_order == order_:
-            return
+        old_order = self.orders.get(vnpy_oid)
+        if old_order is not None:
+            order_.reference = old_order.reference
         if order_.status == Status.REJECTED:
             self.write_log(f'【拒单】 {order.status_msg}')
         self.orders[order_.orderid] = order_
         self.gateway.on_order(order_)
+        self._order_fps[order.order_id] = fp
+        self.basket_tracker.on_order(order_.orderid, order_.status)
+        return True
 
     def _on_dbf_trade_callback(self, trade: TradeData):
         order = self.orders.get(trade.orderid)
@@ -234,11 +524,24 @@ class TD(XtQuantTraderCallback):
         self.orderid_vnoid_map[row['xt_order_id']] = note
         self.vnoid_orderid_map[note] = row['xt_order_id']
         vn_status = TaskStatus_Status_Map.get(task_status)
-        old_order.status = vn_status
+        if vn_status is None:
+            self.write_log(f'未知的文件单任务状态 {task_status} {note}')
+        else:
+            old_order.status = vn_status
         old_order.traded = row['traded']
+        self.orders.refresh(old_order)
         self.gateway.on_order(old_order)
 
     def on_stock_position(self, position: XtPosition):
+        """
+        有变化时推送, 返回数量、可用、冻结、成本价是否变化; 只有市值随行情变化时照常推送, 返回False
+        """
+        state = (position.volume, position.can_use_volume, position.yesterday_volume,
+                 position.frozen_volume, position.open_price)
+        fp = (state, position.market_value)
+        old_fp = self._position_fps.get(position.stock_code)
+        if old_fp == fp:
+            return False
         symbol, exchange = to_vn_contract(position.stock_code)
         # TODO ETF相关字段处理
         position_ = PositionData(
@@ -255,16 +558,22 @@ class TD(XtQuantTraderCallback):
         contract = self.gateway.get_contract(position_.vt_symbol)
         position_.product = contract.product
         position_.__post_init__()
+        self.positions[position_.vt_positionid] = position_
         self.gateway.on_position(position_)
+        self._position_fps[position.stock_code] = fp
+        return old_fp is None or old_fp[0] != state
 
     def on_stock_trade(self, trade: XtTrade):
         symbol, exchange = to_vn_contract(trade.stock_code)
         vnoid = self.orderid_vnoid_map.get(trade.order_id)
         if vnoid is None:
-            return
+            return False
+        if trade.traded_id in self.traders:
+            # 主推和对账快照中重复的成交; 委托归档后成交随之移除, 但委托号映射也已删除, 上面已经返回
+            return False
         order = self.orders.get(vnoid)
         if order is None:
-            return
+            return False
         trd_typ = TO_VN_Trade_Type[trade.order_type]
         trade_ = TradeData(
             gateway_name=self.gateway.gateway_name,
@@ -287,24 +596,48 @@ class TD(XtQuantTraderCallback):
                     else:
                         trade_.direction = Direction.LONG
                     trade_.__post_init__()
+        self.orders.add_trade(trade_)
         self.gateway.on_trade(trade_)
+        self.basket_tracker.on_trade(vnoid, trade_.tradeid, trade_.price, trade_.volume)
+        return True
 
     def on_cancel_error(self, cancel_error: XtCancelError):
         self.write_log(cancel_error.error_msg)
 
     def on_order_error(self, order_error: XtOrderError):
         self.write_log(f'订单错误：{order_error.error_msg}')
-        vnpy_oid = self.orderid_vnoid_map.get(order_error.order_id)
+        # 出错的委托不会再有回报和主推
+        seq = getattr(order_error, 'seq', None)
+        vnpy_oid = None
+        if seq is not None:
+            with self._send_lock:
+                self._send_times.pop(seq, None)
+                # 发送失败时只有错误回调没有异步回报, 队列委托和篮子腿的本地委托号只能从seq找回
+                vnpy_oid = self.seq_orderid.pop(seq, None)
+        self._first_push_times.pop(order_error.order_id, None)
+        if vnpy_oid is None:
+            vnpy_oid = self.orderid_vnoid_map.get(order_error.order_id)
+        if vnpy_oid is None and seq is not None:
+            # 直接发出的普通委托以seq为本地委托号
+            vnpy_oid = str(seq)
         old_order = self.orders.get(vnpy_oid, None)
         if old_order:
             old_order.status = Status.REJECTED
+            self.orders.refresh(old_order)
             self.gateway.on_order(old_order)
+            self.basket_tracker.on_order(old_order.orderid, old_order.status)
 
     def on_order_stock_async_response(self, response: XtOrderResponse):
+        with self._send_lock:
+            sent = self._send_times.pop(response.seq, None)
+            vnoid = self.seq_orderid.pop(response.seq, None) or str(response.seq)
+        if sent is not None:
+            self.gateway.latency.record('order_response', time.perf_counter() - sent)
+            self._first_push_times[response.order_id] = sent
         self.write_log(f'下单成功 {response.order_id} {response.order_remark} {response.strategy_name}')
 
-        self.orderid_vnoid_map[response.order_id] = str(response.seq)
-        self.vnoid_orderid_map[str(response.seq)] = response.order_id
+        self.orderid_vnoid_map[response.order_id] = vnoid
+        self.vnoid_orderid_map[vnoid] = response.order_id
 
     def on_cancel_order_stock_async_response(self, response: XtCancelOrderResponse):
         self.write_log(f'撤单结果： {response.cancel_result}')
@@ -0,0 +1,84 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :tick_buffer.py
+@Time      :2023/3/13 10:45
+@Author    :fsksf
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+
+TICK_DTYPE = np.dtype([
+    ('time', 'i8'),
+    ('last_price', 'f8'),
+    ('volume', 'f8'),
+    ('bid_price', 'f8', (5,)),
+    ('bid_volume', 'f8', (5,)),
+    ('ask_price', 'f8', (5,)),
+    ('ask_volume', 'f8', (5,)),
+])
+
+
+class TickRingBuffer:
+    """
+    定长tick环形缓存
+
+    每条数据同时写在i和i+capacity两处, 最近n条总是一段连续内存, last(n)返回的是视图不拷贝.
+    视图会被后续写入覆盖, 需要长期持有时请自行copy.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity * 2, dtype=TICK_DTYPE)
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def append(self, data: dict):
+        i = self._count % self.capacity
+        row = (
+            data['time'], data['lastPrice'], data['volume'],
+            data['bidPrice'][:5], data['bidVol'][:5],
+            data['askPrice'][:5], data['askVol'][:5]
+        )
+        self._data[i] = row
+        self._data[i + self.capacity] = row
+        self._count += 1
+
+    def last(self, n: int = None) -> np.ndarray:
+        size = len(self)
+        if n is None or n > size:
+            n = size
+        end = self._count % self.capacity + self.capacity
+        return self._data[end - n: end]
+
+
+class TickBuffers:
+    """
+    按vt_symbol管理的tick环形缓存, 收到第一个tick时创建
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffers: Dict[str, TickRingBuffer] = {}
+
+    def append(self, vt_symbol: str, data: dict):
+        buffer = self.buffers.get(vt_symbol)
+        if buffer is None:
+            buffer = self.buffers[vt_symbol] = TickRingBuffer(self.capacity)
+        buffer.append(data)
+
+    def get(self, vt_symbol: str) -> Optional[TickRingBuffer]:
+        return self.buffers.get(vt_symbol)
+
+    def last(self, vt_symbol: str, n: int = None) -> Optional[np.ndarray]:
+        buffer = self.buffers.get(vt_symbol)
+        if buffer is None:
+            return None
+        return buffer.last(n)
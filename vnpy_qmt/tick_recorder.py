@@ -0,0 +1,299 @@
+# -*- coding:utf-8 -*-
+"""
+@FileName  :tick_recorder.py
+@Time      :2023/4/26 14:18
+@Author    :fsksf
+"""
+import os
+import time
+import zlib
+import struct
+import datetime
+from queue import SimpleQueue, Empty
+from threading import Thread, Lock
+from typing import Dict, List
+
+import numpy as np
+
+
+RECORD_DTYPE = np.dtype([
+    ('time', 'i8'),
+    ('last_price', 'f8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('pre_close', 'f8'),
+    ('volume', 'f8'),
+    ('amount', 'f8'),
+    ('ask_price', 'f8', (5,)),
+    ('ask_volume', 'f8', (5,)),
+    ('bid_price', 'f8', (5,)),
+    ('bid_volume', 'f8', (5,)),
+])
+# 单调递增的列存差分, 压缩率更高
+DELTA_FIELDS = ('time', 'volume')
+BLOCK_HEADER = struct.Struct('<4sII')
+BLOCK_MAGIC = b'QTK1'
+FILE_SUFFIX = '.qtk'
+
+
+def encode_block(rows: np.ndarray, level: int = 6) -> bytes:
+    """
+    一块按列存放, 每列按字节重排后整体zlib压缩
+    """
+    n = len(rows)
+    columns = []
+    for name in RECORD_DTYPE.names:
+        column = np.ascontiguousarray(rows[name])
+        if name in DELTA_FIELDS:
+            column = np.diff(column, prepend=column.dtype.type(0))
+        columns.append(column.view(np.uint8).reshape(n, -1).T.tobytes())
+    payload = zlib.compress(b''.join(columns), level)
+    return BLOCK_HEADER.pack(BLOCK_MAGIC, n, len(payload)) + payload
+
+
+def decode_block(n: int, payload: bytes) -> np.ndarray:
+    raw = zlib.decompress(payload)
+    rows = np.empty(n, dtype=RECORD_DTYPE)
+    pos = 0
+    for name in RECORD_DTYPE.names:
+        field = RECORD_DTYPE[name]
+        width = field.itemsize
+        chunk = np.frombuffer(raw, np.uint8, n * width, pos).reshape(width, n).T
+        column = np.ascontiguousarray(chunk).view(field.base).reshape(rows[name].shape)
+        if name in DELTA_FIELDS:
+            column = np.cumsum(column)
+        rows[name] = column
+        pos += n * width
+    return rows
+
+
+def read_ticks(path: str) -> np.ndarray:
+    """
+    读取一个标的一天的记录, 末尾未写完整的块忽略
+    """
+    blocks = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos = 0
+    size = BLOCK_HEADER.size
+    while pos + size <= len(data):
+        magic, n, length = BLOCK_HEADER.unpack_from(data, pos)
+        if magic != BLOCK_MAGIC or pos + size + length > len(data):
+            break
+        blocks.append(decode_block(n, data[pos + size: pos + size + length]))
+        pos += size + length
+    if not blocks:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.concatenate(blocks)
+
+
+def list_codes(folder: str, date: str) -> List[str]:
+    """
+    某日有记录的qmt代码
+    """
+    day_folder = os.path.join(folder, date)
+    if not os.path.isdir(day_folder):
+        return []
+    return sorted(name[:-len(FILE_SUFFIX)] for name in os.listdir(day_folder) if name.endswith(FILE_SUFFIX))
+
+
+class TickRecorder:
+    """
+    tick记录: 行情回调线程只把原始字段拷进预分配的缓冲区, 写满后交给后台线程;
+    后台线程按代码归并, 攒够block_rows条或每flush_interval秒压缩追加到 日期/代码.qtk.
+
+    回调线程从不等待: 排队的缓冲区超过max_buffers个时丢弃新数据并计数.
+    """
+
+    def __init__(self, folder: str, buffer_size: int = 65536, max_buffers: int = 16,
+                 block_rows: int = 4096, flush_interval: float = 60):
+        self.folder = folder
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.block_rows = block_rows
+        self.flush_interval = flush_interval
+        self._buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self._ids = np.zeros(buffer_size, dtype=np.int32)
+        self._n = 0
+        self._free: List[tuple] = []
+        self._queue = SimpleQueue()
+        self._swap_requested = False
+        self._code_ids: Dict[str, int] = {}
+        self._codes: List[str] = []
+        # 后台线程中按代码序号暂存的数据
+        self._pending: Dict[int, List[np.ndarray]] = {}
+        self._pending_rows: Dict[int, int] = {}
+        # 回调线程增加、写盘线程减少, 用_lock保护
+        self.queued_rows = 0
+        self._lock = Lock()
+        self.pending_rows = 0
+        self.written_rows = 0
+        self.written_bytes = 0
+        self.dropped_rows = 0
+        self._thread: Thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, datas: dict):
+        """
+        在行情回调线程中调用, datas为xtquant推送的{qmt代码: [tick, ...]}
+        """
+        if self._swap_requested:
+            self._swap()
+        buffer = self._buffer
+        ids = self._ids
+        n = self._n
+        size = self.buffer_size
+        code_ids = self._code_ids
+        for code, data_list in datas.items():
+            code_id = code_ids.get(code)
+            if code_id is None:
+                code_id = code_ids[code] = len(self._codes)
+                self._codes.append(code)
+            for data in data_list:
+                if n == size:
+                    self._n = n
+                    self._swap()
+                    buffer = self._buffer
+                    ids = self._ids
+                    n = 0
+                buffer[n] = (
+                    data['time'], data['lastPrice'], data['open'], data['high'], data['low'],
+                    data['lastClose'], data['volume'], data.get('amount', 0),
+                    data['askPrice'][:5], data['askVol'][:5], data['bidPrice'][:5], data['bidVol'][:5]
+                )
+                ids[n] = code_id
+                n += 1
+        self._n = n
+
+    def _swap(self):
+        self._swap_requested = False
+        n = self._n
+        if not n:
+            return
+        with self._lock:
+            full = self.queued_rows >= self.max_buffers * self.buffer_size
+            if not full:
+                self.queued_rows += n
+        if full:
+            # 写盘跟不上, 丢弃这一缓冲区而不是等待
+            self.dropped_rows += n
+            self._n = 0
+            return
+        self._queue.put((self._buffer, self._ids, n))
+        try:
+            self._buffer, self._ids = self._free.pop()
+        except IndexError:
+            self._buffer = np.zeros(self.buffer_size, dtype=RECORD_DTYPE)
+            self._ids = np.zeros(self.buffer_size, dtype=np.int32)
+        self._n = 0
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(next_flush - time.monotonic(), 0.01))
+            except Empty:
+                item = None
+            if item is not None:
+                if item is self:
+                    self._write_pending(force=True)
+                    return
+                self._collect(*item)
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                # 让回调线程把未写满的缓冲区也交过来, 下一轮写出
+                self._swap_requested = True
+                self._write_pending(force=True)
+
+    def _collect(self, buffer: np.ndarray, ids: np.ndarray, n: int):
+        order = np.argsort(ids[:n], kind='stable')
+        sorted_ids = ids[:n][order]
+        starts = np.flatnonzero(np.diff(sorted_ids, prepend=-1))
+        ends = np.append(starts[1:], n)
+        for start, end in zip(starts, ends):
+            code_id = int(sorted_ids[start])
+            self._pending.setdefault(code_id, []).append(buffer[order[start:end]])
+            self._pending_rows[code_id] = self._pending_rows.get(code_id, 0) + int(end - start)
+        self.pending_rows += n
+        with self._lock:
+            self.queued_rows -= n
+        self._free.append((buffer, ids))
+        self._write_pending(force=False)
+
+    def _write_pending(self, force: bool):
+        date = datetime.date.today().strftime('%Y%m%d')
+        day_folder = os.path.join(self.folder, date)
+        os.makedirs(day_folder, exist_ok=True)
+        for code_id in list(self._pending):
+            rows = self._pending_rows[code_id]
+            if not force and rows < self.block_rows:
+                continue
+            block = encode_block(np.concatenate(self._pending.pop(code_id)))
+            del self._pending_rows[code_id]
+            path = os.path.join(day_folder, self._codes[code_id] + FILE_SUFFIX)
+            with open(path, 'ab') as f:
+                f.write(block)
+            self.pending_rows -= rows
+            self.written_rows += rows
+            self.written_bytes += len(block)
+
+    def get_stats(self) -> dict:
+        """
+        backlog为还没写到文件的条数
+        """
+        return {
+            "backlog": self._n + self.queued_rows + self.pending_rows,
+            "queued": self.queued_rows,
+            "pending": self.pending_rows,
+            "written": self.written_rows,
+            "bytes": self.written_bytes,
+            "dropped": self.dropped_rows
+        }
+
+    def close(self):
+        """
+        行情停止推送后调用, 写出全部数据
+        """
+        self._swap()
+        if self._thread is not None:
+            self._queue.put(self)
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == '__main__':
+    # 记录耗时和文件大小, 对比pickle
+    import pickle
+    import tempfile
+
+    folder = tempfile.mkdtemp()
+    recorder = TickRecorder(folder)
+    recorder.start()
+    now = int(time.time() * 1000)
+    codes = [f'{600000 + i}.SH' for i in range(500)]
+    batches = []
+    for k in range(200):
+        batches.append({
+            code: [{
+                'time': now + k * 3000, 'lastPrice': 10 + (k + i) % 7 * 0.01, 'volume': 1000 * k + i,
+                'amount': 10000.0 * k, 'open': 9.9, 'high': 10.1, 'low': 9.8, 'lastClose': 9.95,
+                'askPrice': [10.01, 10.02, 10.03, 10.04, 10.05], 'askVol': [k % 9, 2, 3, 4, 5],
+                'bidPrice': [9.99, 9.98, 9.97, 9.96, 9.95], 'bidVol': [1, 2, 3, k % 5, 5]
+            }]
+            for i, code in enumerate(codes)
+        })
+    t = time.perf_counter()
+    for datas in batches:
+        recorder.record(datas)
+    cost = (time.perf_counter() - t) / (len(batches) * len(codes))
+    recorder.close()
+    stats = recorder.get_stats()
+    pickled = len(pickle.dumps(batches, protocol=pickle.HIGHEST_PROTOCOL))
+    print(f'每个tick记录耗时 {cost * 1e6:.2f}us, 写入{stats["written"]}条 {stats["bytes"]}字节, '
+          f'pickle {pickled}字节, 压缩比 {pickled / stats["bytes"]:.1f}')
+    rows = read_ticks(os.path.join(folder, datetime.date.today().strftime('%Y%m%d'), codes[1] + FILE_SUFFIX))
+    assert rows['volume'][-1] == 1000 * 199 + 1 and len(rows) == 200
@@ -72,7 +72,8 @@ TO_VN_Product = {
     'index': Product.INDEX,
     'stock': Product.EQUITY,
     'fund': Product.FUND,
-    'etf': Product.ETF
+    'etf': Product.ETF,
+    'bond': Product.BOND
 }
 
 
@@ -82,7 +83,16 @@ def to_vn_product(dic: dict):
     for k, v in dic.items():
         if v:
             break
-    return TO_VN_Product[k]
+    return TO_VN_Product.get(k)
+
+
+def to_vn_min_volume(product: Product) -> int:
+    """
+    买入的最小单位: 债券(含可转债)10张, 其余100股/份
+    """
+    if product == Product.BOND:
+        return 10
+    return 100
 
 
 def to_qmt_code(symbol, exchange):
@@ -91,6 +101,11 @@ def to_qmt_code(symbol, exchange):
 
 
 def timestamp_to_datetime(tint):
+    # 常见的秒、毫秒时间戳按数量级直接换算, 不转字符串
+    if 1000000000000 <= tint < 10000000000000:
+        return datetime.datetime.fromtimestamp(tint / 1000)
+    if 1000000000 <= tint < 10000000000:
+        return datetime.datetime.fromtimestamp(tint)
     st = len(str(tint))
     if st != 10:
         p = st - 10